@@ -0,0 +1,269 @@
+"""TaskTree 基准测试（无需 Qt，直接驱动 TaskTree）。
+
+覆盖 add_task、rename_task、complete_task、find_task_by_id、load_from_file、save_to_file，
+树的形状包括 deep（单链）、wide（根节点下平铺）和 random（随机挂接），规模从 10^2 到 10^6。
+结果包括延迟分位数、加载时的内存峰值和文件大小，以 JSON 格式保存为基线；
+与基线比较时，任何指标超过容差即以非零状态退出。
+
+用法示例：
+
+    python benchmarks/bench_task_tree.py --sizes 100 1000 10000 --output results.json
+    python benchmarks/bench_task_tree.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_task_tree.py --compare benchmarks/baseline.json --tolerance 0.25
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage import SqliteStorage  # noqa: E402
+from task_tree import Task, TaskTree  # noqa: E402
+
+SHAPES = ("deep", "wide", "random")
+DEFAULT_SIZES = (100, 1_000, 10_000, 100_000, 1_000_000)
+# 不同的持久化方式：文件扩展名和 TaskTree 的构造参数
+MODES = {
+    "snapshot": (".json", {}),
+    "journal": (".json", {"journal": True}),
+    "binary": (".ewtb", {}),
+    "sqlite": (".db", {}),
+}
+LATENCY_METRICS = ("p50", "p90")
+# 小于该值（秒）的延迟差异视为噪声，不判定为回归
+NOISE_FLOOR = 50e-6
+
+
+@contextlib.contextmanager
+def quiet():
+    """屏蔽 TaskTree 的控制台输出，避免干扰计时和结果。"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        "n": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": ordered[-1],
+    }
+
+
+def timed_runs(action, budget, max_runs, min_runs=3, setup=None):
+    """重复执行 action 直到用完时间预算（至少 min_runs 次，至多 max_runs 次），返回每次耗时。"""
+    samples = []
+    deadline = time.perf_counter() + budget
+    while len(samples) < max_runs and (len(samples) < min_runs or time.perf_counter() < deadline):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        action()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def build_tree(tree, shape, size, seed=0):
+    """在 tree 的根节点下构造指定形状的 size 个节点（含根节点），并返回全部节点。"""
+    rng = random.Random(seed)
+    nodes = [tree.root]
+    for i in range(1, size):
+        if shape == "deep":
+            parent = nodes[-1]
+        elif shape == "wide":
+            parent = tree.root
+        else:
+            parent = nodes[rng.randrange(len(nodes))]
+        task = Task(f"任务 {i}")
+        tree.attach_task(parent, task)
+        nodes.append(task)
+    tree.current_task = nodes[-1]
+    return nodes
+
+
+def prepare_file(directory, mode, shape, size):
+    """生成基准用的任务文件，返回 (文件名, 构造参数, 全部 id)。"""
+    extension, options = MODES[mode]
+    filename = os.path.join(directory, f"{shape}-{size}{extension}")
+    with quiet():
+        tree = TaskTree(filename, **options)
+        nodes = build_tree(tree, shape, size)
+        if isinstance(tree.storage, SqliteStorage):
+            tree.storage.import_tree(tree.root, tree.current_task.id)
+        else:
+            tree.save_to_file()
+        tree.close()
+    return filename, options, [node.id for node in nodes]
+
+
+def file_size(filename):
+    return sum(os.path.getsize(path) for path in (filename, filename + ".journal", filename + "-wal")
+               if os.path.exists(path))
+
+
+def bench_case(directory, mode, shape, size, budget):
+    """对一种持久化方式、形状和规模运行全部操作，返回指标字典。"""
+    filename, options, ids = prepare_file(directory, mode, shape, size)
+    results = {"file_size": file_size(filename)}
+    max_runs = 200 if size <= 10_000 else 20
+
+    with quiet():
+        results["load_from_file"] = percentiles(timed_runs(lambda: TaskTree(filename, **options).close(),
+                                                           budget, max_runs))
+        tracemalloc.start()
+        tree = TaskTree(filename, **options)
+        results["load_memory_peak"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        rng = random.Random(1)
+        lookups = [rng.choice(ids) for _ in range(1000)]
+        lookup_samples = []
+        for task_id in lookups:
+            start = time.perf_counter()
+            tree.find_task_by_id(tree.root, task_id)
+            lookup_samples.append(time.perf_counter() - start)
+        results["find_task_by_id"] = percentiles(lookup_samples)
+
+        results["save_to_file"] = percentiles(timed_runs(tree.save_to_file, budget, max_runs))
+        results["add_task"] = percentiles(timed_runs(lambda: tree.add_task("基准任务"), budget, max_runs))
+        results["rename_task"] = percentiles(timed_runs(lambda: tree.rename_task("重命名"), budget, max_runs))
+        # 每次完成前先添加一个子任务，保证总有可完成的任务
+        results["complete_task"] = percentiles(timed_runs(tree.complete_task, budget, max_runs,
+                                                          setup=lambda: tree.add_task("待完成")))
+        tree.close()
+    return results
+
+
+def cpu_model():
+    """CPU 型号（Linux 上读 /proc/cpuinfo，其它平台用 platform.processor()）。"""
+    try:
+        with open("/proc/cpuinfo") as file:
+            for line in file:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def git_commit():
+    """当前代码的 git 提交（不在 git 仓库中时为 None）。"""
+    import subprocess
+
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(sizes, shapes, modes, budget):
+    """记录在结果中的运行环境和参数：不同机器或参数得到的基线不能直接比较。"""
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpu": cpu_model(),
+        "cpu_count": os.cpu_count(),
+        "commit": git_commit(),
+        "sizes": list(sizes),
+        "shapes": list(shapes),
+        "modes": list(modes),
+        "budget": budget,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def run(sizes, shapes, modes, budget):
+    results = {}
+    directory = tempfile.mkdtemp(prefix="easyworkflow-bench-")
+    try:
+        for mode in modes:
+            for shape in shapes:
+                for size in sizes:
+                    key = f"{mode}/{shape}/{size}"
+                    print(f"正在测试 {key} ...", file=sys.stderr)
+                    for metric, value in bench_case(directory, mode, shape, size, budget).items():
+                        results[f"{key}/{metric}"] = value
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {"meta": environment(sizes, shapes, modes, budget), "results": results}
+
+
+def compare(current, baseline, tolerance):
+    """返回超过容差的回归列表，每项为 (指标, 基线值, 当前值)。"""
+    regressions = []
+    for key, base in baseline["results"].items():
+        value = current["results"].get(key)
+        if value is None:
+            continue
+        if isinstance(base, dict):
+            for metric in LATENCY_METRICS:
+                if value[metric] > base[metric] * (1 + tolerance) and value[metric] - base[metric] > NOISE_FLOOR:
+                    regressions.append((f"{key}.{metric}", base[metric], value[metric]))
+        elif value > base * (1 + tolerance):
+            regressions.append((key, base, value))
+    return regressions
+
+
+def print_table(report):
+    print(f"{'用例':<40} {'p50':>10} {'p90':>10} {'p99':>10} {'max':>10}")
+    for key, value in report["results"].items():
+        if isinstance(value, dict):
+            print(f"{key:<40} " + " ".join(f"{value[m] * 1000:>8.3f}ms" for m in ("p50", "p90", "p99", "max")))
+        else:
+            print(f"{key:<40} {value:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="TaskTree 基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--shapes", nargs="+", choices=SHAPES, default=list(SHAPES))
+    parser.add_argument("--modes", nargs="+", choices=sorted(MODES), default=["snapshot"])
+    parser.add_argument("--budget", type=float, default=2.0, help="每个操作的计时预算（秒）")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--save-baseline", help="把结果保存为基线文件")
+    parser.add_argument("--compare", help="与基线文件比较，出现回归时以状态 1 退出")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许的相对退化幅度")
+    args = parser.parse_args(argv)
+
+    report = run(args.sizes, args.shapes, args.modes, args.budget)
+    print_table(report)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as file:
+                json.dump(report, file, indent=4)
+            print(f"结果已写入 {path}")
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        for field in ("python", "implementation", "platform", "cpu", "cpu_count", "budget"):
+            if baseline["meta"].get(field) != report["meta"][field]:
+                print(f"注意：基线的 {field} 为 {baseline['meta'].get(field)!r}，本次为 {report['meta'][field]!r}，"
+                      f"比较结果可能不可靠。")
+        regressions = compare(report, baseline, args.tolerance)
+        for key, base, value in regressions:
+            print(f"回归：{key} 基线 {base:.6g}，本次 {value:.6g}")
+        if regressions:
+            return 1
+        print(f"与基线 {args.compare} 相比没有超过 {args.tolerance:.0%} 的回归。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
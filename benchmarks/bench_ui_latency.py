@@ -0,0 +1,367 @@
+"""界面端到端延迟测试：在 offscreen 平台上运行 TaskManagerUI 和 MiniModeWindow，回放操作并统计卡顿。
+
+bench_task_tree.py 只测量 TaskTree 本身，这里覆盖它测不到的部分：Qt 信号分发、悬浮窗重新布局和遮罩、
+配置文件写入以及重绘。keyboard 库被替换为空实现，不需要显示器和 root 权限，可以在 CI 之类的 Linux 机器上运行。
+
+一个模拟快捷键监听线程按设定的速率把 add、rename、complete、drag 事件投递到 HotkeyDispatcher，
+与真实的 keyboard 回调走同一条路径；每个事件从投递到悬浮窗标签显示出新名称的时间记为端到端延迟
+（drag 记到松开鼠标、位置写入配置为止）。投递时间按计划时刻计算，界面卡住时排队的事件也会计入延迟。
+同时 GUI 线程中有一个按帧间隔触发的定时器，相邻两次触发的间隔记为帧时间，超过阈值的记为一次事件循环卡顿。
+
+事件可以随机生成（--mix 指定各类事件的比例），也可以从脚本文件读取，每行一个事件，# 开头的行为注释：
+
+    add
+    rename 整理会议记录
+    complete
+    drag 40 -10
+
+用法示例：
+
+    python benchmarks/bench_ui_latency.py --events 500 --rate 50 --size 10000
+    python benchmarks/bench_ui_latency.py --script events.txt --output ui.json
+    python benchmarks/bench_ui_latency.py --compare ui_baseline.json --tolerance 0.5 --max-stalls 0
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+from collections import deque
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+# 全局快捷键由下面的模拟线程代替，不注册真实的键盘钩子
+sys.modules["keyboard"] = types.SimpleNamespace(add_hotkey=lambda *args, **kwargs: None)
+
+from PyQt5.QtCore import QEvent, QPoint, Qt, QTimer  # noqa: E402
+from PyQt5.QtGui import QMouseEvent  # noqa: E402
+from PyQt5.QtTest import QTest  # noqa: E402
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+import ui  # noqa: E402
+from bench_task_tree import build_tree, compare, percentiles, quiet  # noqa: E402
+from task_tree import TaskTree  # noqa: E402
+
+EVENT_KINDS = ("add", "rename", "complete", "drag")
+# 事件对应的快捷键动作：add 和 complete 与真实快捷键相同，rename 和 drag 需要模拟输入，使用测试专用的动作
+ACTIONS = {"add": "add_task", "complete": "complete_task", "rename": "bench_rename", "drag": "bench_drag"}
+DEFAULT_MIX = "add=4,rename=2,complete=3,drag=1"
+DRAG_STEPS = 8  # 一次拖动分成的鼠标移动事件数
+
+
+def parse_mix(text):
+    """把 "add=4,drag=1" 解析为 {事件: 权重}。"""
+    weights = {}
+    for item in text.split(","):
+        kind, _, weight = item.partition("=")
+        kind = kind.strip()
+        if kind not in EVENT_KINDS:
+            raise ValueError(f"未知的事件：{kind}")
+        weights[kind] = float(weight or 1)
+    return weights
+
+
+def random_events(count, mix, seed):
+    """按权重随机生成 count 个事件 (类型, 参数)。"""
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    events = []
+    for i in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "rename":
+            events.append((kind, f"重命名 {i}"))
+        elif kind == "drag":
+            events.append((kind, (rng.randint(-60, 60), rng.randint(-40, 40))))
+        else:
+            events.append((kind, None))
+    return events
+
+
+def read_script(filename):
+    """读取事件脚本，返回 [(类型, 参数), ...]。"""
+    events = []
+    with open(filename, encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            kind, _, rest = line.partition(" ")
+            rest = rest.strip()
+            if kind == "rename":
+                events.append((kind, rest or f"重命名 {number}"))
+            elif kind == "drag":
+                dx, dy = (int(value) for value in rest.split()) if rest else (30, 0)
+                events.append((kind, (dx, dy)))
+            elif kind in EVENT_KINDS:
+                events.append((kind, None))
+            else:
+                raise ValueError(f"{filename} 第 {number} 行：未知的事件 {kind}")
+    return events
+
+
+class ProbeMiniWindow(ui.MiniModeWindow):
+    """在标签刷新后通知测试的悬浮窗。"""
+
+    harness = None
+
+    def update_task_name(self):
+        super().update_task_name()
+        if self.harness is not None:
+            self.harness.label_updated()
+
+
+class LatencyHarness:
+    def __init__(self, app, task_manager_ui, mini_window, events, rate, frame_interval, stall_ms):
+        self.app = app
+        self.ui = task_manager_ui
+        self.mini = mini_window
+        self.events = events
+        self.rate = rate
+        self.frame_interval = frame_interval
+        self.stall_seconds = stall_ms / 1000
+        self.pending = deque()  # 已投递、尚未执行的事件 (类型, 参数, 计划投递时间)，与分发队列的顺序一致
+        self.in_flight = []  # 正在执行、等待标签刷新的事件
+        self.latencies = {kind: [] for kind in EVENT_KINDS}
+        self.unchanged = {kind: 0 for kind in EVENT_KINDS}  # 没有引起标签变化的事件（例如完成根节点）
+        self.frame_times = []
+        self.stalls = []
+        self.handled = 0
+        self.last_frame = None
+        self.feeder_done = threading.Event()
+
+        dispatcher = task_manager_ui.hotkey_dispatcher
+        for kind, action in ACTIONS.items():
+            dispatcher.register(action, lambda count, posted_at, kind=kind: self.handle(kind, count, posted_at))
+        mini_window.harness = self
+
+        self.frame_timer = QTimer()
+        self.frame_timer.setTimerType(Qt.PreciseTimer)
+        self.frame_timer.setInterval(frame_interval)
+        self.frame_timer.timeout.connect(self.on_frame)
+        self.check_timer = QTimer()
+        self.check_timer.setInterval(50)
+        self.check_timer.timeout.connect(self.check_finished)
+
+    # ---- 投递 ----
+
+    def feed(self):
+        """模拟 keyboard 的监听线程：按计划时刻投递事件，界面卡住时不等待。"""
+        dispatcher = self.ui.hotkey_dispatcher
+        started = time.perf_counter()
+        for i, (kind, argument) in enumerate(self.events):
+            scheduled = started + i / self.rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.pending.append((kind, argument, scheduled))
+            dispatcher.post(ACTIONS[kind])
+        self.feeder_done.set()
+
+    # ---- 执行 ----
+
+    def handle(self, kind, count, posted_at=None):
+        """分发队列的处理函数：连续的同类事件合并为一次调用，与真实快捷键相同。"""
+        events = [self.pending.popleft() for _ in range(count)]
+        self.in_flight = [(event_kind, scheduled) for event_kind, _, scheduled in events]
+        try:
+            if kind in ("add", "complete"):
+                self.ui.run_hotkey_action(ACTIONS[kind], count, posted_at)
+            elif kind == "rename":
+                for _, name, _ in events:
+                    self.rename(name)
+            else:
+                for _, offset, _ in events:
+                    self.drag(*offset)
+                self.label_updated()
+        finally:
+            for event_kind, _ in self.in_flight:
+                self.unchanged[event_kind] += 1
+            self.in_flight = []
+            self.handled += count
+
+    def rename(self, name):
+        """在悬浮窗的输入框中输入新名称并回车（中文名称相当于输入法一次提交，直接设置文本）。"""
+        self.mini.enter_rename_mode()
+        self.mini.input_field.setText(name)
+        QTest.keyClick(self.mini.input_field, Qt.Key_Return)
+
+    def drag(self, dx, dy):
+        """按下左键拖动悬浮窗再松开。"""
+        mini = self.mini
+        start = QPoint(mini.width() // 2, mini.height() // 2)
+        self.send_mouse(QEvent.MouseButtonPress, start, Qt.LeftButton)
+        origin = mini.pos()
+        for step in range(1, DRAG_STEPS + 1):
+            # 窗口跟随鼠标移动，鼠标相对窗口的位置等于起点加上尚未跟上的位移
+            target = QPoint(dx * step // DRAG_STEPS, dy * step // DRAG_STEPS)
+            self.send_mouse(QEvent.MouseMove, start + target - (mini.pos() - origin), Qt.NoButton)
+        self.send_mouse(QEvent.MouseButtonRelease, start, Qt.NoButton)
+
+    def send_mouse(self, event_type, position, button):
+        buttons = Qt.LeftButton if event_type != QEvent.MouseButtonRelease else Qt.NoButton
+        event = QMouseEvent(event_type, position, self.mini.mapToGlobal(position), button, buttons, Qt.NoModifier)
+        QApplication.sendEvent(self.mini, event)
+
+    def label_updated(self):
+        now = time.perf_counter()
+        for kind, scheduled in self.in_flight:
+            self.latencies[kind].append(now - scheduled)
+        self.in_flight = []
+
+    # ---- 帧时间 ----
+
+    def on_frame(self):
+        now = time.perf_counter()
+        if self.last_frame is not None:
+            elapsed = now - self.last_frame
+            self.frame_times.append(elapsed)
+            if elapsed > self.stall_seconds:
+                self.stalls.append(elapsed)
+        self.last_frame = now
+
+    def check_finished(self):
+        if self.feeder_done.is_set() and self.handled >= len(self.events):
+            self.check_timer.stop()
+            # 再运行几帧，让最后一批事件引起的重绘和延迟保存也计入帧时间
+            QTimer.singleShot(max(200, 10 * self.frame_interval), self.app.quit)
+
+    def run(self):
+        feeder = threading.Thread(target=self.feed, daemon=True)
+        self.frame_timer.start()
+        self.check_timer.start()
+        started = time.perf_counter()
+        feeder.start()
+        self.app.exec_()
+        self.frame_timer.stop()
+        feeder.join()
+        return time.perf_counter() - started
+
+
+def run(args, events):
+    directory = tempfile.mkdtemp(prefix="easyworkflow-ui-bench-")
+    cwd = os.getcwd()
+    try:
+        # 主界面从当前目录读取 hotkey.json，悬浮窗把配置写到当前目录
+        shutil.copy(os.path.join(ROOT_DIR, "hotkey.json"), directory)
+        os.chdir(directory)
+        app = QApplication.instance() or QApplication([])
+        with quiet():
+            tree = TaskTree(os.path.join(directory, "task_tree.json"), journal=True, write_delay=0.5,
+                            history_depth=100, track_focus=True)
+            if args.size > 1:
+                with tree.batch():
+                    build_tree(tree, "random", args.size, seed=args.seed)
+            task_manager_ui = ui.TaskManagerUI(tree)
+            mini_window = ProbeMiniWindow(task_manager_ui)
+            mini_window.show()
+            if args.show_main:
+                task_manager_ui.show()
+            app.processEvents()
+            harness = LatencyHarness(app, task_manager_ui, mini_window, events, args.rate,
+                                     args.frame_interval, args.stall_ms)
+            print(f"正在回放 {len(events)} 个事件（每秒 {args.rate:g} 个）……", file=sys.stderr)
+            wall_time = harness.run()
+            mini_window.save_config()
+            tree.close()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    results = {}
+    for kind, samples in harness.latencies.items():
+        if samples:
+            results[f"end_to_end/{kind}"] = percentiles(samples)
+    if harness.frame_times:
+        results["frame_time"] = percentiles(harness.frame_times)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "qt_platform": QApplication.platformName(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "events": len(events),
+            "rate": args.rate,
+            "size": args.size,
+            "wall_time": wall_time,
+        },
+        "results": results,
+        # 卡顿次数不参与 compare() 的相对比较（基线为 0 时任何一次都会算作回归），用 --max-stalls 判定
+        "stalls": {
+            "threshold_ms": args.stall_ms,
+            "count": len(harness.stalls),
+            "max": max(harness.stalls, default=0.0),
+            "total": sum(harness.stalls),
+            "unchanged": harness.unchanged,
+        },
+    }
+
+
+def print_report(report):
+    print(f"{'指标':<24} {'次数':>6} {'p50':>10} {'p90':>10} {'p99':>10} {'max':>10}")
+    for key, value in report["results"].items():
+        print(f"{key:<24} {value['n']:>6} " + " ".join(f"{value[m] * 1000:>8.2f}ms"
+                                                      for m in ("p50", "p90", "p99", "max")))
+    stalls = report["stalls"]
+    print(f"事件循环卡顿（超过 {stalls['threshold_ms']:g} ms）：{stalls['count']} 次，"
+          f"最长 {stalls['max'] * 1000:.1f} ms，合计 {stalls['total'] * 1000:.1f} ms")
+    unchanged = {kind: count for kind, count in stalls["unchanged"].items() if count}
+    if unchanged:
+        print("没有引起标签变化的事件：" + "，".join(f"{kind} {count} 个" for kind, count in unchanged.items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="界面端到端延迟测试（offscreen）")
+    parser.add_argument("--events", type=int, default=300, help="随机生成的事件数")
+    parser.add_argument("--rate", type=float, default=30.0, help="每秒投递的事件数")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="各类事件的比例，例如 add=4,rename=2,complete=3,drag=1")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--script", help="从文件读取事件，不再随机生成")
+    parser.add_argument("--size", type=int, default=1000, help="预先构造的任务树节点数")
+    parser.add_argument("--frame-interval", type=int, default=16, help="帧定时器的间隔（毫秒）")
+    parser.add_argument("--stall-ms", type=float, default=50.0, help="帧间隔超过该值（毫秒）记为一次卡顿")
+    parser.add_argument("--show-main", action="store_true", help="同时显示主界面（树视图）")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--save-baseline", help="把结果保存为基线文件")
+    parser.add_argument("--compare", help="与基线文件比较，出现回归时以状态 1 退出")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="允许的相对退化幅度")
+    parser.add_argument("--max-stalls", type=int, help="卡顿次数超过该值时以状态 1 退出")
+    args = parser.parse_args(argv)
+
+    if args.script:
+        events = read_script(args.script)
+    else:
+        events = random_events(args.events, parse_mix(args.mix), args.seed)
+    report = run(args, events)
+    print_report(report)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as file:
+                json.dump(report, file, indent=4, ensure_ascii=False)
+            print(f"结果已写入 {path}")
+    status = 0
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, args.tolerance)
+        for key, base, value in regressions:
+            print(f"回归：{key} 基线 {base:.6g}，本次 {value:.6g}")
+        if regressions:
+            status = 1
+        else:
+            print(f"与基线 {args.compare} 相比没有超过 {args.tolerance:.0%} 的回归。")
+    if args.max_stalls is not None and report["stalls"]["count"] > args.max_stalls:
+        print(f"卡顿 {report['stalls']['count']} 次，超过允许的 {args.max_stalls} 次。")
+        status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
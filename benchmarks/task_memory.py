@@ -0,0 +1,87 @@
+"""比较旧版 Task 表示与当前紧凑表示在大规模任务树下的内存占用。
+
+用法：python benchmarks/task_memory.py [节点数 ...]（默认 100000 1000000）
+
+当前表示还要计入 TaskTree 的 id 索引。任务名称互不相同时两者相当（10^5 个节点：旧版 34.1 MiB，
+当前 35.7 MiB）；只有大量同名任务时名称驻留才有明显收益。
+"""
+import os
+import random
+import sys
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from task_tree import NO_CHILDREN, Task  # noqa: E402
+
+
+class LegacyTask:
+    """改造前的 Task：每个实例带 __dict__，并重复保存 parent_id 字符串。"""
+
+    def __init__(self, name, id=None, parent_id=None):
+        self.id = id if id is not None else str(uuid.uuid4())
+        self.name = name
+        self.parent_id = parent_id
+        self.children = []
+
+
+WORDS = ["整理", "需求", "文档", "修复", "接口", "测试", "发布", "会议", "评审", "数据", "迁移", "报告"]
+
+
+def imported_name(i):
+    # 模拟从 JSON 导入：每个节点的名称都是新解析出来的独立字符串，且几乎都互不相同，
+    # 名称驻留省不下内存（真实任务树里完全同名的任务很少）
+    return "".join([WORDS[i % len(WORDS)], WORDS[i * 7 % len(WORDS)], " #", str(i)])
+
+
+def build_legacy(count):
+    rng = random.Random(0)
+    root = LegacyTask("Root")
+    nodes = [root]
+    for i in range(1, count):
+        parent = nodes[rng.randrange(len(nodes))]
+        task = LegacyTask(imported_name(i), parent_id=parent.id)
+        parent.children.append(task)
+        nodes.append(task)
+    return root
+
+
+def build_compact(count):
+    rng = random.Random(0)
+    root = Task("Root")
+    nodes = [root]
+    index = {root.id: root}  # TaskTree 的 id 索引也计入当前表示的开销
+    for i in range(1, count):
+        parent = nodes[rng.randrange(len(nodes))]
+        task = Task(imported_name(i))
+        task.parent = parent
+        if parent.children is NO_CHILDREN:
+            parent.children = []
+        parent.children.append(task)
+        nodes.append(task)
+        index[task.id] = task
+    return root, index
+
+
+def measure(builder, count):
+    """返回构建完成后仍然存活的内存（不含构建用的临时节点列表）。"""
+    tracemalloc.start()
+    result = builder(count)
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def main(argv):
+    sizes = [int(arg) for arg in argv] or [100_000, 1_000_000]
+    print(f"{'节点数':>10} {'旧版 (MiB)':>12} {'当前 (MiB)':>12} {'节省':>8}")
+    for count in sizes:
+        legacy = measure(build_legacy, count)
+        compact = measure(build_compact, count)
+        saved = 1 - compact / legacy
+        print(f"{count:>10} {legacy / 2**20:>12.1f} {compact / 2**20:>12.1f} {saved:>8.0%}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
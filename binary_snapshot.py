@@ -0,0 +1,236 @@
+"""二进制任务树快照（.ewtb）。
+
+文件布局（小端序）：
+
+    头部    magic "EWTB" | 版本 u16 | 保留 u16 | 节点数 u64 | 根节点偏移 u64
+            | 当前任务偏移 u64 | journal_seq u64 | id 表偏移 u64
+    节点    父节点偏移 u64 | 完成时间 f64 | 名称长度 u32 | 名称 | id 长度 u16 | id | 子节点数 u32
+            | 子节点偏移 u64 * n
+    id 表   按 id 哈希排序的 (哈希 u64, 节点偏移 u64) 数组
+
+完成时间为 NaN 表示任务尚未完成。版本 1 的节点没有完成时间字段，仍然可以读取。
+
+节点按广度优先顺序存放，每个节点都记录了父节点和所有子节点的偏移，
+因此打开文件时只需解析根节点到当前任务这一条路径，其余子树在首次访问时再从 mmap 中读取。
+"""
+
+import hashlib
+import math
+import mmap
+import struct
+from collections import deque
+
+from json_stream import load_tree, write_tree
+from task_tree import LazyTask
+
+MAGIC = b"EWTB"
+VERSION = 2
+HEADER = struct.Struct("<4sHHQQQQQ")
+NODE_HEAD = struct.Struct("<QdI")
+NODE_HEAD_V1 = struct.Struct("<QI")
+ID_LENGTH = struct.Struct("<H")
+CHILD_COUNT = struct.Struct("<I")
+OFFSET = struct.Struct("<Q")
+INDEX_ENTRY = struct.Struct("<QQ")
+NO_PARENT = 0xFFFFFFFFFFFFFFFF
+
+def id_hash(task_id):
+    """稳定的 64 位 id 哈希（不能使用带随机盐的内置 hash）。"""
+    return int.from_bytes(hashlib.blake2b(task_id.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class BinarySnapshot:
+    """通过 mmap 打开的二进制快照，负责按需物化节点。"""
+
+    def __init__(self, filename, tree=None):
+        self.filename = filename
+        self.tree = tree
+        self._file = open(filename, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, _, self.node_count, self.root_offset, self.current_offset,
+         self.journal_seq, self.index_offset) = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version not in (1, VERSION):
+            self.close()
+            raise ValueError(f"{filename} 不是受支持的二进制任务树快照")
+        self.version = version
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+
+    def read_node(self, offset):
+        """解析一个节点记录，返回 (父节点偏移, 名称, id, 子节点偏移元组, 完成时间)。"""
+        buffer = self._mmap
+        if self.version == 1:
+            parent_offset, name_length = NODE_HEAD_V1.unpack_from(buffer, offset)
+            completed_at = None
+            position = offset + NODE_HEAD_V1.size
+        else:
+            parent_offset, completed_at, name_length = NODE_HEAD.unpack_from(buffer, offset)
+            if math.isnan(completed_at):
+                completed_at = None
+            position = offset + NODE_HEAD.size
+        name = buffer[position:position + name_length].decode("utf-8")
+        position += name_length
+        (id_length,) = ID_LENGTH.unpack_from(buffer, position)
+        position += ID_LENGTH.size
+        task_id = buffer[position:position + id_length].decode("utf-8")
+        position += id_length
+        (child_count,) = CHILD_COUNT.unpack_from(buffer, position)
+        position += CHILD_COUNT.size
+        child_offsets = struct.unpack_from(f"<{child_count}Q", buffer, position)
+        return parent_offset, name, task_id, child_offsets, completed_at
+
+    def make_task(self, offset, parent=None):
+        _, name, task_id, child_offsets, completed_at = self.read_node(offset)
+        task = LazyTask(name, task_id, source=self if child_offsets else None, key=offset, completed_at=completed_at)
+        task.parent = parent
+        return task
+
+    def load_root(self):
+        return self.make_task(self.root_offset)
+
+    def load_children(self, task):
+        """物化 task 的直接子节点，并登记到所属任务树的 id 索引中。"""
+        child_offsets = self.read_node(task._key)[3]
+        children = [self.make_task(offset, task) for offset in child_offsets]
+        if self.tree is not None and self.tree.lazy_source is self:
+            self.tree.register_tasks(children)
+        return children
+
+    def find_offset(self, task_id):
+        """在 id 表中二分查找节点偏移，找不到时返回 None。"""
+        target = id_hash(task_id)
+        low, high = 0, self.node_count
+        while low < high:
+            middle = (low + high) // 2
+            if INDEX_ENTRY.unpack_from(self._mmap, self.index_offset + middle * INDEX_ENTRY.size)[0] < target:
+                low = middle + 1
+            else:
+                high = middle
+        while low < self.node_count:
+            entry_hash, offset = INDEX_ENTRY.unpack_from(self._mmap, self.index_offset + low * INDEX_ENTRY.size)
+            if entry_hash != target:
+                break
+            if self.read_node(offset)[2] == task_id:
+                return offset
+            low += 1  # 哈希碰撞，继续比较下一项
+        return None
+
+    def resolve(self, root, task_id):
+        """物化从根节点到指定任务的路径并返回该任务，找不到时返回 None。"""
+        offset = self.find_offset(task_id)
+        if offset is None:
+            return None
+        return self.resolve_offset(root, offset)
+
+    def resolve_offset(self, root, offset):
+        path = []
+        while offset != NO_PARENT and offset != root._key:
+            path.append(offset)
+            offset = self.read_node(offset)[0]
+        if offset != root._key:
+            return None
+        node = root
+        for child_offset in reversed(path):
+            for child in node.children:
+                if isinstance(child, LazyTask) and child._key == child_offset:
+                    node = child
+                    break
+            else:
+                return None  # 该节点在加载后已被移动或删除
+        return node
+
+
+def encode_snapshot(root, current_task_id, journal_seq=0):
+    """把内存中的任务树编码为二进制快照（迭代实现，会物化所有未加载的子树）。"""
+    order = []
+    queue = deque([root])
+    while queue:
+        node = queue.popleft()
+        order.append(node)
+        queue.extend(node.children)
+
+    encoded = []
+    offsets = {}
+    position = HEADER.size
+    for node in order:
+        name = node.name.encode("utf-8")
+        task_id = node.id.encode("utf-8")
+        encoded.append((name, task_id))
+        offsets[id(node)] = position
+        position += NODE_HEAD.size + len(name) + ID_LENGTH.size + len(task_id) + CHILD_COUNT.size \
+            + OFFSET.size * len(node.children)
+    index_offset = position
+
+    buffer = bytearray(index_offset + INDEX_ENTRY.size * len(order))
+    current_offset = offsets[id(root)]
+    index = []
+    for node, (name, task_id) in zip(order, encoded):
+        offset = offsets[id(node)]
+        parent_offset = offsets[id(node.parent)] if node is not root else NO_PARENT
+        completed_at = node.completed_at if node.completed_at is not None else math.nan
+        NODE_HEAD.pack_into(buffer, offset, parent_offset, completed_at, len(name))
+        offset += NODE_HEAD.size
+        buffer[offset:offset + len(name)] = name
+        offset += len(name)
+        ID_LENGTH.pack_into(buffer, offset, len(task_id))
+        offset += ID_LENGTH.size
+        buffer[offset:offset + len(task_id)] = task_id
+        offset += len(task_id)
+        CHILD_COUNT.pack_into(buffer, offset, len(node.children))
+        offset += CHILD_COUNT.size
+        struct.pack_into(f"<{len(node.children)}Q", buffer, offset, *(offsets[id(child)] for child in node.children))
+        index.append((id_hash(node.id), offsets[id(node)]))
+        if node.id == current_task_id:
+            current_offset = offsets[id(node)]
+    index.sort()
+    for i, entry in enumerate(index):
+        INDEX_ENTRY.pack_into(buffer, index_offset + i * INDEX_ENTRY.size, *entry)
+    HEADER.pack_into(buffer, 0, MAGIC, VERSION, 0, len(order), offsets[id(root)], current_offset,
+                     journal_seq, index_offset)
+    return bytes(buffer)
+
+
+def json_to_binary(json_filename, binary_filename):
+    """把 task_tree.json 转换为二进制快照。"""
+    with open(json_filename, "r") as file:
+        data = load_tree(file)
+    with open(binary_filename, "wb") as file:
+        file.write(encode_snapshot(data["root"], data.get("current_task_id"), data.get("journal_seq", 0)))
+
+
+def binary_to_json(binary_filename, json_filename):
+    """把二进制快照转换回与 TaskTree.save_to_file 相同结构的 JSON 文件。"""
+    snapshot = BinarySnapshot(binary_filename)
+    try:
+        def iter_snapshot_nodes():
+            # 先序遍历快照，产出与 json_stream.iter_nodes 相同的元组
+            stack = [(snapshot.root_offset, None)]
+            while stack:
+                offset, parent_id = stack.pop()
+                _, name, task_id, child_offsets, completed_at = snapshot.read_node(offset)
+                yield task_id, name, parent_id, len(child_offsets), completed_at
+                stack.extend((child_offset, task_id) for child_offset in reversed(child_offsets))
+
+        extra = {"journal_seq": snapshot.journal_seq} if snapshot.journal_seq else {}
+        with open(json_filename, "w") as file:
+            write_tree(file, iter_snapshot_nodes(), snapshot.read_node(snapshot.current_offset)[2], extra)
+    finally:
+        snapshot.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        print("用法：python binary_snapshot.py <源文件> <目标文件>（按扩展名 .json/.ewtb 自动判断转换方向）")
+        sys.exit(1)
+    source, target = sys.argv[1], sys.argv[2]
+    if source.endswith(".ewtb"):
+        binary_to_json(source, target)
+    else:
+        json_to_binary(source, target)
+    print(f"已将 {source} 转换为 {target}。")
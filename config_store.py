@@ -0,0 +1,58 @@
+"""带脏标记的 JSON 配置文件存储。
+
+配置只在内容真正变化后才标记为脏，``save()`` 在没有修改时直接返回；
+写入时先写临时文件再替换，避免程序中途退出留下写了一半的配置文件。
+"""
+
+import copy
+import json
+import os
+
+
+class ConfigStore:
+    """加载、合并默认值并按需保存一个 JSON 配置文件。"""
+
+    def __init__(self, filename, defaults):
+        self.filename = filename
+        self.data = self.load(defaults)
+        self.dirty = False
+
+    def load(self, defaults):
+        """读取配置文件，缺失的键使用默认值补全（合并两层）。"""
+        config = copy.deepcopy(defaults)
+        if not os.path.exists(self.filename):
+            print("配置文件不存在，使用默认配置。")
+            return config
+        with open(self.filename, 'r') as file:
+            try:
+                loaded = json.load(file)
+            except json.JSONDecodeError:
+                print("JSON 文件格式错误，使用默认配置。")
+                return config
+        for key, value in loaded.items():
+            if isinstance(value, dict) and isinstance(config.get(key), dict):
+                config[key].update(value)
+            else:
+                config[key] = value
+        return config
+
+    def update(self, key, value):
+        """修改一项顶层配置，只有值发生变化时才标记为脏。"""
+        if self.data.get(key) != value:
+            self.data[key] = value
+            self.dirty = True
+
+    def mark_dirty(self):
+        """直接修改了 data 中的嵌套内容后调用。"""
+        self.dirty = True
+
+    def save(self):
+        """把修改写回文件；没有修改时不访问磁盘。返回是否实际写入。"""
+        if not self.dirty:
+            return False
+        temp_filename = self.filename + ".tmp"
+        with open(temp_filename, 'w') as file:
+            json.dump(self.data, file, indent=4)
+        os.replace(temp_filename, self.filename)
+        self.dirty = False
+        return True
@@ -0,0 +1,62 @@
+"""跨进程的建议性文件锁，用于多个 EasyWorkflow 实例（或脚本）共享同一个任务树文件。
+
+快照文件写入时会被原子替换，锁不能加在快照文件本身上，而是加在旁边一个固定的 ``<文件名>.lock`` 上。
+Unix 上使用 fcntl.flock，读取时加共享锁、写入时加排他锁；Windows 上使用 msvcrt.locking，
+只支持排他锁，共享锁也按排他锁处理。每次加锁都重新打开锁文件，
+因此同一进程中的不同线程之间也互相排斥。
+
+锁只是建议性的：不使用这个锁直接修改文件的程序仍然可以写入，但 TaskTree 在写入前会先合并这些修改。
+"""
+
+import contextlib
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+RETRY_INTERVAL = 0.05  # Windows 上获取锁失败后的重试间隔（秒）
+
+
+class FileLock:
+    def __init__(self, filename):
+        self.filename = filename
+
+    @contextlib.contextmanager
+    def shared(self):
+        """读取时持有的锁：可以与其它读取者同时持有。"""
+        with self._locked(exclusive=False):
+            yield
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        """写入时持有的锁：持有期间其它实例不能读取或写入。"""
+        with self._locked(exclusive=True):
+            yield
+
+    @contextlib.contextmanager
+    def _locked(self, exclusive):
+        file = open(self.filename, 'a+b')
+        try:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            else:
+                while True:
+                    try:
+                        file.seek(0)
+                        msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(RETRY_INTERVAL)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+                else:
+                    file.seek(0)
+                    msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            file.close()
@@ -0,0 +1,138 @@
+"""监视任务树文件的外部修改。
+
+Linux 上通过 inotify 监视文件所在的目录（快照是先写临时文件再原子替换的，直接监视文件会在替换后失效），
+其它平台定期比较文件的 stat。短时间内的多次变化合并为一次回调（``debounce`` 秒内没有新的变化才回调），
+因此文件频繁变化时也只做一次合并。回调在后台线程中执行，由 TaskTree 自己加锁。
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")  # struct inotify_event 的 wd、mask、cookie、len
+
+
+def load_inotify():
+    """返回 libc（提供 inotify 函数时），不支持时返回 None。"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class FileWatcher:
+    def __init__(self, paths, callback, debounce=0.2, poll_interval=1.0):
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.callback = callback
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self._closed = threading.Event()
+        self._wake_read, self._wake_write = os.pipe()  # close() 时唤醒正在 select 的线程
+        self._inotify_fd = self._open_inotify()
+        target = self._run_inotify if self._inotify_fd is not None else self._run_polling
+        self._thread = threading.Thread(target=target, name="TaskTreeWatcher", daemon=True)
+        self._thread.start()
+
+    def _open_inotify(self):
+        libc = load_inotify()
+        if libc is None:
+            return None
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        for directory in {os.path.dirname(path) for path in self.paths}:
+            if libc.inotify_add_watch(fd, directory.encode(sys.getfilesystemencoding()), mask) < 0:
+                os.close(fd)
+                return None
+        return fd
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        os.write(self._wake_write, b"x")
+        self._thread.join()
+        for fd in (self._wake_read, self._wake_write, self._inotify_fd):
+            if fd is not None:
+                os.close(fd)
+
+    def _notify(self):
+        """调用回调；回调返回 None 表示暂时无法处理（例如正在写入），稍后重试。"""
+        while not self._closed.is_set():
+            try:
+                if self.callback() is not None:
+                    return
+            except Exception as error:  # 回调失败不能让监视线程退出
+                print(f"处理任务文件的外部修改时出错：{error}")
+                return
+            self._closed.wait(self.debounce)
+
+    # ---- inotify ----
+
+    def _run_inotify(self):
+        names = {os.path.basename(path) for path in self.paths}
+        fds = [self._inotify_fd, self._wake_read]
+        while not self._closed.is_set():
+            select.select(fds, [], [])
+            if not self._read_events(names):
+                continue
+            # 等到 debounce 秒内没有新的相关事件，再统一处理
+            while not self._closed.is_set():
+                ready, _, _ = select.select(fds, [], [], self.debounce)
+                if self._inotify_fd not in ready or not self._read_events(names):
+                    break
+            if not self._closed.is_set():
+                self._notify()
+
+    def _read_events(self, names):
+        """读出所有待处理的事件，返回其中是否有被监视的文件。"""
+        relevant = False
+        while True:
+            try:
+                data = os.read(self._inotify_fd, 64 * 1024)
+            except BlockingIOError:
+                return relevant
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0").decode(sys.getfilesystemencoding(), "replace")
+                offset += length
+                if name in names:
+                    relevant = True
+
+    # ---- 轮询 ----
+
+    def signatures(self):
+        result = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                result.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                result.append(None)
+        return result
+
+    def _run_polling(self):
+        last = self.signatures()
+        while not self._closed.wait(self.poll_interval):
+            current = self.signatures()
+            if current != last:
+                last = current
+                self._notify()
@@ -0,0 +1,347 @@
+"""专注时间统计：记录每个任务被专注的时间段，并按任务、子树和日期汇总。
+
+专注任务每次变化（添加、完成、跳转、撤销……）时，上一个任务的专注时间段结束，写入 ``<任务树文件>.focus``：
+
+    记录    开始时间 f64 | 结束时间 f64 | 任务 id（UUID 的 16 字节）    小端序，每条 32 字节，只追加
+
+内存中的时间段按列存放在三个 ``array`` 中（开始时间、结束时间、任务编号），按开始时间递增排列。
+另外维护全部时长的前缀和，以及每个任务的行号和时长前缀和：按时间范围查询时用二分查找定位，
+区间内的总时长是两个前缀和之差，只有跨出范围的首尾两条需要裁剪，不必逐条遍历。
+时钟被调回过（时间段可能重叠）时不再维护前缀和，查询退回逐条裁剪。
+
+每个任务自身的累计时间和整棵子树的累计时间随记录增量维护：一个时间段结束时，
+把时长加到该任务及其所有祖先上；移动或删除子树时，从原来的祖先上减去子树的累计时间，
+因此查询全部历史的子树时间是 O(1) 的。
+"""
+
+import bisect
+import datetime
+import struct
+import time
+import uuid
+from array import array
+
+from file_lock import FileLock
+
+RECORD = struct.Struct("<dd16s")
+MIN_INTERVAL = 1.0  # 短于 1 秒的专注（例如批量导入过程中的临时专注）不记录
+
+
+class FocusTimeLog:
+    def __init__(self, tree, filename):
+        self.tree = tree
+        self.filename = filename
+        self.lock = FileLock(filename + ".lock")
+        self.starts = array("d")
+        self.ends = array("d")
+        self.task_indexes = array("I")  # 指向 task_ids 的编号
+        self.task_ids = []
+        self.ordered = True  # 时间段是否互不重叠且按时间排列（结束时间也递增，可以对它二分查找）
+        self.cumulative = array("d", [0.0])  # cumulative[i] 为前 i 条时间段的总时长，只在 ordered 时维护
+        self.task_rows = []  # 任务编号 -> 该任务的时间段所在的行号（递增）
+        self.task_cumulative = []  # 任务编号 -> 该任务时间段时长的前缀和
+        self.index_of = {}  # 任务 id -> 编号
+        self.own = {}  # 任务 id -> 自身的累计专注时间（秒）
+        self.rollup = {}  # 任务 id -> 整棵子树的累计专注时间（秒），只包含仍在任务树中的任务
+        self.task = None  # 正在计时的任务，暂停时为 None
+        self.started = None
+        self.load()
+        self.rebuild_rollup()
+        self.resume()
+        tree.add_listener(self.on_operation)
+
+    # ---- 读写 ----
+
+    def load(self):
+        try:
+            with open(self.filename, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return
+        data = data[:len(data) - len(data) % RECORD.size]  # 丢弃写到一半的最后一条记录
+        for start, end, raw_id in RECORD.iter_unpack(data):
+            self.append(start, end, str(uuid.UUID(bytes=raw_id)))
+
+    def append(self, start, end, task_id):
+        """把一个时间段加入内存中的列，返回任务编号。"""
+        index = self.index_of.get(task_id)
+        if index is None:
+            index = self.index_of[task_id] = len(self.task_ids)
+            self.task_ids.append(task_id)
+            if self.ordered:
+                self.task_rows.append(array("I"))
+                self.task_cumulative.append(array("d", [0.0]))
+        if self.ordered and self.ends and (end < self.ends[-1] or start < self.ends[-1]):
+            # 时间段重叠或时钟被调回：前缀和不再成立，之后的查询逐条裁剪
+            self.ordered = False
+            self.cumulative = array("d")
+            self.task_rows = []
+            self.task_cumulative = []
+        if self.starts and start < self.starts[-1]:
+            # 时钟被调回时插入到正确的位置，保持按开始时间排序
+            position = bisect.bisect_right(self.starts, start)
+            self.starts.insert(position, start)
+            self.ends.insert(position, end)
+            self.task_indexes.insert(position, index)
+        else:
+            self.starts.append(start)
+            self.ends.append(end)
+            self.task_indexes.append(index)
+            if self.ordered:
+                seconds = end - start
+                self.cumulative.append(self.cumulative[-1] + seconds)
+                self.task_rows[index].append(len(self.starts) - 1)
+                cumulative = self.task_cumulative[index]
+                cumulative.append(cumulative[-1] + seconds)
+        self.own[task_id] = self.own.get(task_id, 0.0) + (end - start)
+        return index
+
+    def write(self, start, end, task_id):
+        try:
+            raw_id = uuid.UUID(task_id).bytes
+        except ValueError:
+            return  # 不是本程序生成的 id（例如手工编辑的文件），只在内存中统计
+        with self.lock.exclusive(), open(self.filename, "ab") as file:
+            file.write(RECORD.pack(start, end, raw_id))
+
+    # ---- 计时 ----
+
+    def pause(self, now=None):
+        """结束正在计时的时间段（例如切换到其它工作流或退出时）。"""
+        task, started = self.task, self.started
+        self.task = self.started = None
+        if task is None:
+            return
+        now = time.time() if now is None else now
+        if now - started < MIN_INTERVAL:
+            return
+        self.append(started, now, task.id)
+        self.write(started, now, task.id)
+        if self.tree.tasks.get(task.id) is task:  # 任务已被删除时只记入它自身的时间
+            self.add_to_ancestors(task, now - started)
+
+    def resume(self, now=None):
+        """开始为当前专注任务计时。"""
+        if self.task is None:
+            self.task = self.tree.current_task
+            self.started = time.time() if now is None else now
+
+    def close(self):
+        self.pause()
+        self.tree.remove_listener(self.on_operation)
+
+    def on_operation(self, operation, previous):
+        """TaskTree 的修改监听器：维护子树累计时间，专注任务变化时切换计时。"""
+        op = operation.get("op")
+        tree = self.tree
+        if op in ("reset", "import"):
+            self.rebuild_rollup()
+        elif op == "add":
+            # 撤销删除时按先序重新添加，每个节点只带回自身的时间，子孙随后各自加回；
+            # 任务原本就存在时（previous 不为 None）它的时间已经在祖先上，不能再加一次
+            task = tree.get_task(operation["id"])
+            seconds = self.own.get(operation["id"])
+            if seconds and task is not None and previous is None:
+                self.rollup.pop(task.id, None)
+                self.add_to_ancestors(task, seconds)
+        elif op == "remove" and previous is not None:
+            seconds = self.rollup.get(operation["id"], 0.0)
+            parent = tree.get_task(previous["parent_id"])
+            if seconds and parent is not None:
+                self.add_to_ancestors(parent, -seconds)
+                stack = [previous["task"]]
+                while stack:
+                    node = stack.pop()
+                    self.rollup.pop(node.id, None)
+                    stack.extend(node.loaded_children())
+        elif op == "move" and previous is not None:
+            task = tree.get_task(operation["id"])
+            seconds = self.rollup.get(operation["id"], 0.0)
+            old_parent = tree.get_task(previous["parent_id"])
+            if seconds and task is not None and old_parent is not None:
+                self.add_to_ancestors(old_parent, -seconds)
+                self.add_to_ancestors(task.parent, seconds)
+        if self.task is not None and tree.current_task is not self.task:
+            self.pause()
+            self.resume()
+
+    def add_to_ancestors(self, task, seconds):
+        rollup = self.rollup
+        for ancestor in self.tree.get_task_path(task):
+            rollup[ancestor.id] = rollup.get(ancestor.id, 0.0) + seconds
+
+    def rebuild_rollup(self):
+        """按每个任务自身的累计时间重新计算子树累计时间（只沿有记录的任务的祖先链向上，不遍历整棵树）。"""
+        tree = self.tree
+        self.rollup = {}
+        with tree.lock:
+            for task_id, seconds in self.own.items():
+                task = tree.get_task(task_id)
+                if task is not None:
+                    self.add_to_ancestors(task, seconds)
+
+    # ---- 查询 ----
+
+    def running(self, now=None):
+        """正在计时的时间段已经持续的秒数。"""
+        if self.task is None:
+            return 0.0
+        return max(0.0, (time.time() if now is None else now) - self.started)
+
+    def task_time(self, task, now=None):
+        """任务自身的累计专注时间（秒），包含正在计时的部分。"""
+        seconds = self.own.get(task.id, 0.0)
+        if self.task is task:
+            seconds += self.running(now)
+        return seconds
+
+    def subtree_time(self, task, now=None):
+        """任务及其所有子孙的累计专注时间（秒），包含正在计时的部分。"""
+        seconds = self.rollup.get(task.id, 0.0)
+        if self.task is not None and task in self.tree.get_task_path(self.task):
+            seconds += self.running(now)
+        return seconds
+
+    def slice(self, start=None, end=None):
+        """返回可能与 [start, end) 相交的时间段在列中的下标范围（时钟被调回过时从头扫描）。"""
+        first = 0 if start is None or not self.ordered else bisect.bisect_right(self.ends, start)
+        last = len(self.starts) if end is None else bisect.bisect_left(self.starts, end)
+        return first, last
+
+    def time_per_task(self, start=None, end=None):
+        """返回 {任务 id: 秒数}，只统计 [start, end) 内的部分（都为 None 时直接返回累计值）。"""
+        if start is None and end is None:
+            return dict(self.own)
+        first, last = self.slice(start, end)
+        low = float("-inf") if start is None else start
+        high = float("inf") if end is None else end
+        totals = [0.0] * len(self.task_ids)
+        if self.ordered:
+            for index, rows in enumerate(self.task_rows):
+                cumulative = self.task_cumulative[index]
+                totals[index] = (cumulative[bisect.bisect_left(rows, last)]
+                                 - cumulative[bisect.bisect_left(rows, first)])
+            # 时间段互不重叠，只有首尾两条可能跨出 [low, high)
+            if first < last:
+                if self.starts[first] < low:
+                    totals[self.task_indexes[first]] -= low - self.starts[first]
+                if self.ends[last - 1] > high:
+                    totals[self.task_indexes[last - 1]] -= self.ends[last - 1] - high
+        else:
+            for begin, finish, index in zip(self.starts[first:last], self.ends[first:last],
+                                            self.task_indexes[first:last]):
+                if finish > low and begin < high:
+                    totals[index] += min(finish, high) - max(begin, low)
+        return {self.task_ids[index]: seconds for index, seconds in enumerate(totals) if seconds > 0}
+
+    def time_per_subtree(self, start=None, end=None):
+        """返回 {任务 id: 子树秒数}，把 time_per_task 的结果沿祖先链向上累加（已不在任务树中的任务不计入）。"""
+        if start is None and end is None:
+            return dict(self.rollup)
+        totals = {}
+        tree = self.tree
+        with tree.lock:
+            for task_id, seconds in self.time_per_task(start, end).items():
+                task = tree.get_task(task_id)
+                if task is None:
+                    continue
+                for ancestor in tree.get_task_path(task):
+                    totals[ancestor.id] = totals.get(ancestor.id, 0.0) + seconds
+        return totals
+
+    def daily_totals(self, days=7, task=None, now=None):
+        """返回最近 days 天（本地时间，含今天）每天的专注秒数 [(日期, 秒数), ...]，按日期递增。
+
+        task 不为 None 时只统计该任务的子树；正在计时的部分计入最后一天。
+        """
+        now = time.time() if now is None else now
+        today = datetime.date.fromtimestamp(now)
+        dates = [today - datetime.timedelta(days=offset) for offset in range(days - 1, -1, -1)]
+        # 每天零点的时间戳，再加上明天零点作为最后一个边界
+        bounds = [time.mktime(date.timetuple()) for date in dates]
+        bounds.append(time.mktime((today + datetime.timedelta(days=1)).timetuple()))
+        totals = [0.0] * days
+        included = self.subtree_filter(task)
+        if self.ordered:
+            self.sum_days(bounds, totals, included)
+        else:
+            first, last = self.slice(bounds[0], bounds[-1])
+            for begin, finish, index in zip(self.starts[first:last], self.ends[first:last],
+                                            self.task_indexes[first:last]):
+                if included is not None and not included(index):
+                    continue
+                self.spread(begin, finish, bounds, totals)
+        if self.task is not None and (task is None or task in self.tree.get_task_path(self.task)):
+            self.spread(self.started, now, bounds, totals)
+        return list(zip(dates, totals))
+
+    def sum_days(self, bounds, totals, included):
+        """按前缀和求每天的时长（只用于 ordered）：先按开始时间把整条时间段归到各天，
+        再把跨过零点的时间段（每个边界至多一条）从归入的那天减去、按边界重新拆开。"""
+        starts = self.starts
+        # 第 day 天开始的时间段是 [day_rows[day], day_rows[day + 1]) 行
+        day_rows = [bisect.bisect_left(starts, bound) for bound in bounds]
+        if included is None:
+            columns = [(None, self.cumulative)]
+        else:
+            columns = [(self.task_rows[index], self.task_cumulative[index])
+                       for index in range(len(self.task_rows)) if included(index)]
+        for rows, cumulative in columns:
+            if rows is None:
+                for day in range(len(totals)):
+                    totals[day] += cumulative[day_rows[day + 1]] - cumulative[day_rows[day]]
+                continue
+            # 只跳过该任务有记录的那些天，代价与 (任务, 天) 对的个数成正比
+            position = bisect.bisect_left(rows, day_rows[0])
+            stop = bisect.bisect_left(rows, day_rows[-1], position)
+            while position < stop:
+                day = bisect.bisect_right(day_rows, rows[position]) - 1
+                following = bisect.bisect_left(rows, day_rows[day + 1], position, stop)
+                totals[day] += cumulative[following] - cumulative[position]
+                position = following
+        for row in {row - 1 for row in day_rows if row > 0}:
+            if included is not None and not included(self.task_indexes[row]):
+                continue
+            begin, finish = starts[row], self.ends[row]
+            day = bisect.bisect_right(bounds, begin) - 1
+            if day >= 0:
+                totals[day] -= finish - begin
+            self.spread(begin, finish, bounds, totals)
+
+    @staticmethod
+    def spread(begin, finish, bounds, totals):
+        """把 [begin, finish) 按天边界拆开，加到对应的天上。"""
+        begin = max(begin, bounds[0])
+        finish = min(finish, bounds[-1])
+        day = bisect.bisect_right(bounds, begin) - 1
+        while begin < finish:
+            boundary = min(finish, bounds[day + 1])
+            totals[day] += boundary - begin
+            begin = boundary
+            day += 1
+
+    def subtree_filter(self, task):
+        """返回判断任务编号是否在 task 的子树中的函数（task 为 None 时返回 None），每个编号只判断一次。"""
+        if task is None:
+            return None
+        tree = self.tree
+        cache = {}
+
+        def included(index):
+            if index not in cache:
+                node = tree.get_task(self.task_ids[index])
+                cache[index] = node is not None and task in tree.get_task_path(node)
+            return cache[index]
+
+        return included
+
+
+def format_duration(seconds):
+    """把秒数格式化为“2小时5分”之类的文本。"""
+    minutes = int(seconds // 60)
+    if minutes < 1:
+        return f"{int(seconds)}秒"
+    hours, minutes = divmod(minutes, 60)
+    if not hours:
+        return f"{minutes}分"
+    return f"{hours}小时{minutes}分" if minutes else f"{hours}小时"
@@ -0,0 +1,62 @@
+"""全局快捷键的线程安全分发队列。
+
+keyboard 库在自己的监听线程中调用快捷键回调，直接在回调里修改任务树、写文件、发出 Qt 信号
+会与 GUI 线程交错执行。这里的回调只把动作名放进队列，再通过排队连接（Qt.QueuedConnection）
+唤醒 GUI 线程统一处理；连续的相同动作（例如快速按了五次添加任务）合并为一次调用，
+由处理函数根据次数批量修改任务树，最后只保存一次、刷新一次界面。
+投递时在监听线程中记下时间，处理函数据此统计动作在队列中等待 GUI 线程的时间。
+"""
+
+import threading
+import time
+from collections import deque
+
+from PyQt5.QtCore import QObject, Qt, pyqtSignal
+
+
+class HotkeyDispatcher(QObject):
+    drain_requested = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._handlers = {}  # 动作名 -> handler(count, posted_at)
+        self._queue = deque()  # (动作名, 投递时间)
+        self._lock = threading.Lock()
+        self._drain_pending = False  # 已经请求过 GUI 线程处理队列，避免重复投递事件
+        self.drain_requested.connect(self.drain, Qt.QueuedConnection)
+
+    def register(self, action, handler):
+        """登记动作的处理函数，处理函数接收连续触发的次数和其中第一次的投递时间（time.perf_counter()）。"""
+        self._handlers[action] = handler
+
+    def post(self, action):
+        """可以在任意线程调用：把动作放入队列，稍后在 GUI 线程执行。"""
+        posted_at = time.perf_counter()
+        with self._lock:
+            self._queue.append((action, posted_at))
+            if self._drain_pending:
+                return
+            self._drain_pending = True
+        self.drain_requested.emit()
+
+    def drain(self):
+        """在 GUI 线程中处理队列中的全部动作，连续的相同动作合并为一次调用。"""
+        with self._lock:
+            actions = list(self._queue)
+            self._queue.clear()
+            self._drain_pending = False
+        runs = []  # [动作名, 连续次数, 第一次的投递时间]
+        for action, posted_at in actions:
+            if runs and runs[-1][0] == action:
+                runs[-1][1] += 1
+            else:
+                runs.append([action, 1, posted_at])
+        for action, count, posted_at in runs:
+            handler = self._handlers.get(action)
+            if handler is None:
+                print(f"未知的快捷键动作：{action}")
+                continue
+            try:
+                handler(count, posted_at)
+            except Exception as error:  # 单个动作失败不影响队列中其余动作
+                print(f"执行快捷键动作 {action} 时出错：{error}")
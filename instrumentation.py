@@ -0,0 +1,163 @@
+"""可选的延迟统计：记录从快捷键回调到悬浮窗刷新各阶段的耗时。
+
+设置环境变量 ``EASYWORKFLOW_PROFILE=1`` 启用；未启用时 ``measure()`` 返回一个共享的空计时器，
+``begin_action()`` / ``finish_action()`` 直接返回，几乎没有开销。
+启用后每个阶段保留最近 ``WINDOW`` 次耗时的滚动直方图，可以通过 ``snapshot()`` 读取，
+退出时还会写到 ``EASYWORKFLOW_PROFILE_FILE``（默认 easyworkflow_profile.json）。
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+
+ENABLED = os.environ.get("EASYWORKFLOW_PROFILE", "") not in ("", "0")
+OUTPUT_FILE = os.environ.get("EASYWORKFLOW_PROFILE_FILE", "easyworkflow_profile.json")
+WINDOW = 1000
+
+_lock = threading.Lock()
+_histograms = {}  # "操作/阶段" -> 最近 WINDOW 次耗时（秒）
+_totals = {}  # "操作/阶段" -> [累计次数, 累计耗时]
+_pending_action = None  # [操作名, 开始时间, 信号发出时间]：等待悬浮窗刷新以计算端到端延迟
+
+
+def record(operation, stage, seconds):
+    """记录一次阶段耗时。"""
+    key = f"{operation}/{stage}"
+    with _lock:
+        samples = _histograms.get(key)
+        if samples is None:
+            samples = _histograms[key] = deque(maxlen=WINDOW)
+            _totals[key] = [0, 0.0]
+        samples.append(seconds)
+        total = _totals[key]
+        total[0] += 1
+        total[1] += seconds
+
+
+class _Timer:
+    __slots__ = ("operation", "stage", "start")
+
+    def __init__(self, operation, stage):
+        self.operation = operation
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.operation, self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def measure(operation, stage):
+    """返回计时用的上下文管理器：``with measure("add_task", "tree_mutation"): ...``。"""
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer(operation, stage)
+
+
+def begin_action(operation, posted_at=None):
+    """在快捷键或按钮回调的入口调用，开始一次端到端计时。
+
+    posted_at 是快捷键回调在监听线程中把动作放入队列的时间，给出时从这一刻开始计时，
+    并记录动作在队列中等待 GUI 线程的时间。
+    """
+    global _pending_action
+    if ENABLED:
+        hotkey_queued(operation, posted_at)
+        _pending_action = [operation, time.perf_counter() if posted_at is None else posted_at, None]
+
+
+def hotkey_queued(operation, posted_at):
+    """记录快捷键动作从放入队列到 GUI 线程开始执行的等待时间（posted_at 为 None 时不记录）。"""
+    if ENABLED and posted_at is not None:
+        record(operation, "hotkey_queue", time.perf_counter() - posted_at)
+
+
+def signal_emitted():
+    """在发出 update_ui_signal / task_changed_signal 之前调用。"""
+    pending = _pending_action
+    if ENABLED and pending is not None:
+        pending[2] = time.perf_counter()
+
+
+def signal_received():
+    """在第一个槽函数开始执行时调用，记录信号从发出到被 GUI 线程处理的排队时间。"""
+    pending = _pending_action
+    if ENABLED and pending is not None and pending[2] is not None:
+        record(pending[0], "signal_dispatch", time.perf_counter() - pending[2])
+        pending[2] = None
+
+
+def finish_action():
+    """在悬浮窗显示出新的任务名称后调用，记录端到端延迟。"""
+    global _pending_action
+    if not ENABLED:
+        return
+    pending = _pending_action
+    if pending is not None:
+        _pending_action = None
+        record(pending[0], "end_to_end", time.perf_counter() - pending[1])
+
+
+def snapshot():
+    """返回各阶段的统计：次数、均值、分位数（秒），分位数基于最近 WINDOW 次记录。"""
+    with _lock:
+        items = [(key, sorted(samples), list(_totals[key])) for key, samples in _histograms.items()]
+    result = {}
+    for key, ordered, (count, total) in items:
+        def pick(fraction):
+            return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+        result[key] = {
+            "count": count,
+            "mean": total / count,
+            "p50": pick(0.50),
+            "p90": pick(0.90),
+            "p99": pick(0.99),
+            "max": ordered[-1],
+        }
+    return result
+
+
+def dump_json(filename=None):
+    """把 snapshot() 的结果写入 JSON 文件。"""
+    filename = filename or OUTPUT_FILE
+    with open(filename, "w") as file:
+        json.dump(snapshot(), file, indent=4)
+    return filename
+
+
+def reset():
+    """清空所有统计。"""
+    global _pending_action
+    with _lock:
+        _histograms.clear()
+        _totals.clear()
+        _pending_action = None
+
+
+def _dump_at_exit():
+    if _histograms:
+        print(f"延迟统计已写入 {dump_json()}。")
+
+
+if ENABLED:
+    atexit.register(_dump_at_exit)
@@ -0,0 +1,326 @@
+"""task_tree.json 的流式、非递归读写。
+
+写入时按先序遍历逐个节点直接写到文件句柄，输出与 ``json.dump(data, indent=4)`` 完全一致；
+读取时分块扫描文件，解析到一个节点的结尾就立即构造 Task，不生成中间的字典树。
+两者都只使用显式栈，任务树的深度不受 Python 递归深度限制。
+"""
+
+import json
+import re
+from json.decoder import scanstring
+from json.encoder import encode_basestring_ascii
+
+from task_tree import Task
+from task_validation import InvalidNode, node_children, node_problem, quarantine_record
+
+INDENT = "    "
+# json.dump(indent=4) 的缩进随深度线性增长，深链会让文件大小变成平方级；
+# 超过该层级后不再增加缩进（仍是合法 JSON，浅层树的输出与 json.dump 完全一致）
+MAX_INDENT_LEVEL = 32
+INDENTS = [INDENT * level for level in range(MAX_INDENT_LEVEL + 1)]
+WRITE_BUFFER_SIZE = 1 << 16
+READ_CHUNK_SIZE = 1 << 16
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+SCALAR = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?|true|false|null")
+LITERALS = {"true": True, "false": False, "null": None}
+# 快速路径：本程序写出的节点头部（id、name、parent_id 后紧跟 children 数组）可以一次匹配完成
+_STRING = r'"([^"\\]*(?:\\.[^"\\]*)*)"'
+NODE_HEADER = re.compile(r'\s*"id"\s*:\s*' + _STRING + r'\s*,\s*"name"\s*:\s*' + _STRING
+                         + r'\s*,\s*"parent_id"\s*:\s*(?:"[^"\\]*(?:\\.[^"\\]*)*"|null)\s*,\s*"children"\s*:\s*\[')
+NODE_HEADER_WINDOW = 4096
+LEAF_TAIL = re.compile(r'\s*\]\s*\}\s*(,?)')
+
+
+def iter_nodes(root):
+    """按先序遍历产出 (id, name, parent_id, 子节点数, 完成时间)，供写入器使用。"""
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        children = node.children
+        yield node.id, node.name, node.parent_id, len(children), node.completed_at
+        stack.extend(reversed(children))
+
+
+def write_tree(file, nodes, current_task_id, extra=None):
+    """把先序节点序列写成 task_tree.json 的格式。
+
+    nodes 是 ``iter_nodes`` 产出的序列（可以是生成器，也可以是事先捕获的列表）；
+    extra 中的键值对会追加在 current_task_id 之后（例如 journal_seq）。
+    """
+    parts = []
+    size = 0
+
+    def write(text):
+        nonlocal size
+        parts.append(text)
+        size += len(text)
+        if size >= WRITE_BUFFER_SIZE:
+            file.write("".join(parts))
+            parts.clear()
+            size = 0
+
+    write('{\n' + INDENT + '"root": ')
+    stack = []  # 每个未闭合节点：[剩余子节点数, 缩进层级, 闭合后的后缀]
+    for task_id, name, parent_id, child_count, completed_at in nodes:
+        if stack:
+            parent = stack[-1]
+            parent[0] -= 1
+            level = parent[1] + 2
+            lead = INDENTS[min(level, MAX_INDENT_LEVEL)]
+            suffix = "\n" if parent[0] == 0 else ",\n"
+        else:
+            level, lead, suffix = 1, "", ""
+        pad = INDENTS[min(level + 1, MAX_INDENT_LEVEL)]
+        write(lead + "{\n"
+              + pad + '"id": ' + encode_basestring_ascii(task_id) + ",\n"
+              + pad + '"name": ' + encode_basestring_ascii(name) + ",\n"
+              + pad + '"parent_id": ' + (encode_basestring_ascii(parent_id) if parent_id is not None else "null")
+              + ",\n"
+              # 只有已完成的任务才写出完成时间，未完成的节点仍可走读取时的快速路径
+              + (pad + '"completed_at": ' + json.dumps(completed_at) + ",\n" if completed_at is not None else "")
+              + pad + '"children": ')
+        if child_count:
+            write("[\n")
+            stack.append([child_count, level, suffix])
+            continue
+        write("[]\n" + INDENTS[min(level, MAX_INDENT_LEVEL)] + "}" + suffix)
+        # 叶子节点写完后，依次闭合所有子节点都已写完的祖先
+        while stack and stack[-1][0] == 0:
+            _, level, suffix = stack.pop()
+            write(INDENTS[min(level + 1, MAX_INDENT_LEVEL)] + "]\n" + INDENTS[min(level, MAX_INDENT_LEVEL)] + "}" + suffix)
+    write(",\n" + INDENT + '"current_task_id": ' + json.dumps(current_task_id))
+    for key, value in (extra or {}).items():
+        write(",\n" + INDENT + json.dumps(key) + ": " + json.dumps(value))
+    write("\n}")
+    file.write("".join(parts))
+
+
+class _Tokenizer:
+    """分块读取文件的 JSON 词法分析器。"""
+
+    def __init__(self, file, chunk_size=READ_CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def fill(self):
+        """读取下一块数据并丢弃已消费的部分，文件结束时返回 False。"""
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def match_node_header(self):
+        """在刚读到 '{' 后尝试一次性匹配标准格式的节点头部，成功时返回 (id, name)。"""
+        while len(self.buffer) - self.position < NODE_HEADER_WINDOW and self.fill():
+            pass
+        match = NODE_HEADER.match(self.buffer, self.position)
+        if match is None:
+            return None
+        task_id, name = match.group(1), match.group(2)
+        if "\\" in task_id:
+            task_id = scanstring(self.buffer, match.start(1))[0]
+        if "\\" in name:
+            name = scanstring(self.buffer, match.start(2))[0]
+        self.position = match.end()
+        return task_id, name
+
+    def match_leaf_tail(self):
+        """匹配叶子节点空 children 数组之后的 ']}' 以及可选的逗号，返回是否带逗号；不匹配时返回 None。"""
+        match = LEAF_TAIL.match(self.buffer, self.position)
+        if match is None or (match.end() == len(self.buffer) and not self.eof):
+            return None  # 逗号可能还在下一个数据块中，交给通用路径处理
+        self.position = match.end()
+        return bool(match.group(1))
+
+    def error(self, message):
+        return json.JSONDecodeError(message, self.buffer, self.position)
+
+    def next(self):
+        """返回 (类型, 值)：类型为 '{' '}' '[' ']' ':' ',' 之一，或表示标量的 'v'；文件结束时返回 None。"""
+        while True:
+            self.position = WHITESPACE.match(self.buffer, self.position).end()
+            if self.position >= len(self.buffer):
+                if not self.fill():
+                    return None
+                continue
+            char = self.buffer[self.position]
+            if char in "{}[]:,":
+                self.position += 1
+                return char, None
+            if char == '"':
+                try:
+                    value, end = scanstring(self.buffer, self.position + 1)
+                except json.JSONDecodeError:
+                    if self.fill():
+                        continue  # 字符串跨越了数据块边界
+                    raise
+                self.position = end
+                return "v", value
+            match = SCALAR.match(self.buffer, self.position)
+            if match is not None and match.end() == len(self.buffer) and self.fill():
+                continue  # 数字或字面量可能还没读完整
+            if match is None:
+                raise self.error(f"无法识别的字符 {char!r}")
+            self.position = match.end()
+            text = match.group()
+            if text in LITERALS:
+                return "v", LITERALS[text]
+            return "v", json.loads(text)
+
+
+def _finish_node(fields, problems=None):
+    """用解析到的字段构造 Task，并挂上已经构造好的子节点。
+
+    problems 为 None 时遇到不合法的节点直接抛出 ValueError；否则把隔离记录追加到 problems，
+    不合法的子节点由它下面合法的子树代替，节点本身不合法时返回 InvalidNode（见 task_validation.py）。
+    """
+    children = fields.get("children")
+    if type(children) is not list:
+        children = node_children(fields, problems)
+    if not all(isinstance(child, Task) for child in children):
+        salvaged = []
+        for child in children:
+            if isinstance(child, Task):
+                salvaged.append(child)
+            elif isinstance(child, InvalidNode):
+                child.record["parent_id"] = fields.get("id")
+                salvaged.extend(child.children)
+            elif problems is None:
+                raise ValueError(f"任务 {fields.get('id')} 的 children 必须是任务对象组成的数组")
+            else:
+                problems.append(quarantine_record("子任务不是对象", {"value": child}, fields.get("id")))
+        children = salvaged
+    task_id, name = fields.get("id"), fields.get("name")
+    # 绝大多数节点合法：先做最便宜的类型检查，不合法时再由 node_problem 给出原因
+    reason = None if type(task_id) is str and task_id and type(name) is str else node_problem(fields)
+    if reason is not None:
+        if problems is None:
+            raise ValueError(f"任务 {fields.get('id')!r} 不合法：{reason}")
+        record = quarantine_record(reason, fields, salvaged_children=len(children))
+        problems.append(record)
+        return InvalidNode(record, children)
+    task = Task(name, task_id, completed_at=fields.get("completed_at"))
+    if children:
+        task.children = children
+        for child in children:
+            child.parent = task
+    return task
+
+
+def load_tree(file, problems=None):
+    """流式解析 task_tree.json，返回顶层字典，其中 "root" 已经是构造好的 Task。
+
+    只有从根节点到当前解析位置这一条路径上的节点会以临时字段字典的形式存在，
+    解析到节点结尾时立即转换为 Task。传入 problems 列表时不合法的节点不会中断解析，
+    而是被隔离并记录到 problems 中（根节点本身不合法时 "root" 为 InvalidNode）。
+    """
+    tokens = _Tokenizer(file)
+    # 栈帧：[容器类型 ('object'/'array'), 种类 ('top'/'node'/'children'/'generic'), 内容, 当前键, 状态]
+    # 状态：object 为 'key' / 'colon' / 'value' / 'comma'，array 为 'value' / 'comma'
+    stack = []
+    result = None
+
+    def kind_for(frame):
+        """根据父容器和键名决定新值的种类。"""
+        container, kind, _, key, _ = frame
+        if kind == "top" and key == "root":
+            return "node"
+        if kind == "node" and key == "children":
+            return "children"
+        if kind == "children":
+            return "node"
+        return "generic"
+
+    def store(value):
+        """把一个已完成的值交给父容器。"""
+        nonlocal result
+        if not stack:
+            result = value
+            return
+        frame = stack[-1]
+        if frame[0] == "object":
+            frame[2][frame[3]] = value
+        else:
+            frame[2].append(value)
+        frame[4] = "comma"
+
+    def close(frame):
+        container, kind, payload, _, _ = frame
+        if container == "object" and kind == "node":
+            return _finish_node(payload, problems)
+        return payload
+
+    while True:
+        token = tokens.next()
+        if token is None:
+            if stack or result is None:
+                raise tokens.error("文件意外结束")
+            return result
+        if result is not None:
+            raise tokens.error("文档结束后存在多余内容")
+        kind_token, value = token
+        frame = stack[-1] if stack else None
+        state = frame[4] if frame else "value"
+
+        if frame is not None and frame[0] == "object" and state in ("key", "comma"):
+            if kind_token == "}" and (state == "comma" or not frame[2]):
+                stack.pop()
+                store(close(frame))
+            elif state == "comma" and kind_token == ",":
+                frame[4] = "key"
+            elif state == "key" and kind_token == "v" and isinstance(value, str):
+                frame[3] = value
+                frame[4] = "colon"
+            else:
+                raise tokens.error("对象中缺少键名或逗号")
+            continue
+        if frame is not None and frame[0] == "object" and state == "colon":
+            if kind_token != ":":
+                raise tokens.error("键名后缺少冒号")
+            frame[4] = "value"
+            continue
+        if frame is not None and frame[0] == "array" and state == "comma":
+            if kind_token == "]":
+                stack.pop()
+                store(close(frame))
+            elif kind_token == ",":
+                frame[4] = "value"
+            else:
+                raise tokens.error("数组中缺少逗号")
+            continue
+
+        # 此处期望一个值
+        if kind_token == "]" and frame is not None and frame[0] == "array" and not frame[2]:
+            stack.pop()
+            store(close(frame))
+        elif kind_token == "{":
+            kind = kind_for(frame) if frame else "top"
+            header = tokens.match_node_header() if kind == "node" else None
+            if header is not None and frame is not None and frame[1] == "children" \
+                    and (comma := tokens.match_leaf_tail()) is not None:
+                # 叶子节点：头部和结尾都已读完，直接构造 Task
+                store(Task(header[1], header[0]))
+                if comma:
+                    frame[4] = "value"
+            elif header is not None:
+                # 已经读到 children 数组的开头，直接压入节点帧和数组帧
+                stack.append(["object", kind, {"id": header[0], "name": header[1]}, "children", "value"])
+                stack.append(["array", "children", [], None, "value"])
+            else:
+                stack.append(["object", kind, {}, None, "key"])
+        elif kind_token == "[":
+            kind = kind_for(frame) if frame else "generic"
+            stack.append(["array", kind, [], None, "value"])
+        elif kind_token == "v":
+            store(value)
+        else:
+            raise tokens.error(f"意外的符号 {kind_token!r}")
@@ -0,0 +1,80 @@
+"""悬浮窗绘制用的缓存：文本宽度、圆角遮罩和预先缩放好的背景图片。
+
+悬浮窗每次更新任务名称都要测量文本宽度、按新宽度生成圆角遮罩（QPainterPath -> 多边形 -> QRegion），
+用样式表显示的背景图片还会在每次重绘时重新缩放。这些结果只取决于文本、字体、尺寸和圆角半径，
+在这里按这些参数缓存，在几个任务之间来回切换时不再重复计算。
+
+每种结果各自保存在一个有上限的 LRU 缓存中（背景图片占内存最多，上限最小）。
+"""
+
+import os
+from collections import OrderedDict
+
+from PyQt5.QtCore import QRectF, Qt
+from PyQt5.QtGui import QFontMetrics, QPainterPath, QPixmap, QRegion
+
+
+class LRUCache:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        """返回 key 对应的结果，不在缓存中时调用 compute() 计算并缓存。"""
+        value = self.items.get(key)
+        if value is not None:
+            self.items.move_to_end(key)
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = compute()
+        self.items[key] = value
+        if len(self.items) > self.capacity:
+            self.items.popitem(last=False)
+        return value
+
+    def clear(self):
+        self.items.clear()
+
+
+class RenderCache:
+    def __init__(self, width_capacity=512, mask_capacity=64, pixmap_capacity=4):
+        self.widths = LRUCache(width_capacity)  # (字体, 文本) -> 文本宽度
+        self.masks = LRUCache(mask_capacity)  # (宽, 高, 圆角半径) -> 圆角遮罩
+        self.pixmaps = LRUCache(pixmap_capacity)  # (图片路径, 修改时间, 宽, 高) -> 缩放后的图片
+
+    def text_width(self, font, text):
+        """返回文本在指定字体下的宽度（像素）。"""
+        return self.widths.get((font.key(), text), lambda: QFontMetrics(font).boundingRect(text).width())
+
+    def rounded_mask(self, width, height, radius):
+        """返回指定尺寸的圆角遮罩。"""
+        def compute():
+            path = QPainterPath()
+            path.addRoundedRect(QRectF(0, 0, width, height), radius, radius)
+            return QRegion(path.toFillPolygon().toPolygon())
+        return self.masks.get((width, height, radius), compute)
+
+    def background_pixmap(self, image_path, width, height):
+        """返回拉伸到指定尺寸的背景图片；图片不存在或无法读取时返回 None。
+
+        缓存键包含文件的修改时间，替换图片文件后会重新读取。
+        """
+        try:
+            modified = os.path.getmtime(image_path)
+        except OSError:
+            return None
+
+        def compute():
+            pixmap = QPixmap(image_path)
+            if pixmap.isNull():
+                return False  # 缓存读取失败的结果，避免每次重绘都重新读取文件
+            return pixmap.scaled(width, height, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+        return self.pixmaps.get((image_path, modified, width, height), compute) or None
+
+    def clear(self):
+        self.widths.clear()
+        self.masks.clear()
+        self.pixmaps.clear()
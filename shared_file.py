@@ -0,0 +1,354 @@
+"""多个实例共享同一个 JSON 任务树文件时的加锁与外部修改合并。
+
+读取快照和日志时持有共享锁，写入时持有排他锁（见 file_lock.py）。写入前先比较文件的状态
+（快照的 inode、修改时间、大小和日志的长度）与上次读写后记下的状态，如果其它实例改过文件，
+先把外部修改合并到内存中再写，这样最后写入的实例不会覆盖别人的修改。
+
+合并只修改有变化的节点，并以 ``"external": True`` 的操作记录通知监听器（搜索索引、树视图等增量更新），
+不会重新加载整棵树：
+    只有日志变长了  从上次读到的位置读出新增的日志记录并应用
+    快照被替换了    解析新快照，与内存中的树按 id 比较：新增、改名、移动、删除的节点逐个应用，再应用它的日志
+本实例尚未写出的修改优先：被本地修改过的任务不接受外部的修改。外部修改不会改变本实例的专注任务，
+除非专注任务被删除。
+
+兄弟顺序：本地的添加和移动在日志记录中带上 ``after_id``（修改后排在它前面的兄弟任务，排在最前时为 None），
+重放日志时放在这个兄弟之后（见 TaskTree.placement_index）。合并外部添加或移入的任务时同样放在 after_id 之后
+（快照中取前一个兄弟），然后按顺序重放本实例尚未写出的添加和移动的位置：它们写出时排在已合并的记录之后，
+这样每个实例合并后的兄弟顺序都与重新加载文件后一致。没有 after_id 的旧记录按 index 放置，index 不计本实例尚未写出的
+添加和移入的任务。
+
+启用 watch 后，文件监视线程（见 file_watcher.py）发现外部修改时立即合并，不必等到下次写入。
+"""
+
+import os
+import sys
+from collections import Counter
+
+from file_lock import FileLock
+
+LOCAL_CHANGES = ("add", "rename", "remove", "move", "complete", "reopen")  # 这些本地修改写出之前不接受外部修改
+PLACEMENTS = ("add", "move")  # 这些本地修改写出之前，合并外部修改后要重放它们的位置
+
+
+def stat_signature(filename):
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class SharedFile:
+    def __init__(self, tree, storage):
+        self.tree = tree
+        self.storage = storage  # JsonStorage：日志和日志序号由它维护
+        self.lock = FileLock(tree.filename + ".lock")
+        self.snapshot_signature = None  # 上次读写后快照文件的状态
+        self.disk_seq = 0  # 文件中已有的最大日志序号，写入本地的日志记录时从它之后重新编号
+        # 尚未写入文件的本地修改涉及的任务 id -> 修改次数；写入时只减去本次写出的修改，
+        # 写入过程中新登记的修改仍然受保护
+        self.unsaved_ids = Counter()
+        self.unsaved_placements = []  # 尚未写入文件的本地添加和移动记录，按修改顺序
+        # 尚未写出的本地移动或删除之前，任务在文件中的位置：任务 id -> (父任务 id, 前一个兄弟的 id)
+        self.origins = {}
+        self.watcher = None
+        tree.add_listener(self.on_operation)
+
+    @property
+    def mergeable(self):
+        """二进制快照按需加载，不做合并（仍然加锁）。"""
+        return not self.tree.filename.endswith(".ewtb")
+
+    def on_operation(self, operation, previous):
+        """TaskTree 的修改监听器：记下本地修改涉及的任务，并给添加和移动记下前一个兄弟任务。"""
+        if not operation.get("external") and operation.get("op") in LOCAL_CHANGES:
+            self.unsaved_ids[operation["id"]] += 1
+            if operation["op"] in ("move", "remove") and previous is not None and operation["id"] not in self.origins:
+                # 任务已经从原来的父任务下移走，原来的前一个兄弟仍在 index - 1
+                old_parent = self.tree.tasks.get(previous["parent_id"])
+                if old_parent is not None:
+                    index = previous["index"]
+                    self.origins[operation["id"]] = (old_parent.id,
+                                                     old_parent.children[index - 1].id if index else None)
+            if operation["op"] in PLACEMENTS:
+                self.unsaved_placements.append(operation)
+                task = self.tree.tasks.get(operation["id"])
+                if task is not None and task.parent is not None:
+                    siblings = task.parent.children
+                    position = siblings.index(task)
+                    operation["after_id"] = siblings[position - 1].id if position else None
+
+    def watch(self, debounce=0.2):
+        """启动文件监视线程，外部修改后自动合并。"""
+        if self.watcher is None and self.mergeable:
+            from file_watcher import FileWatcher
+
+            paths = [self.tree.filename]
+            if self.storage.journal is not None:
+                paths.append(self.storage.journal.filename)
+            self.watcher = FileWatcher(paths, self.tree.merge_external_changes, debounce)
+
+    def close(self):
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+
+    def record_state(self, snapshot_seq=None):
+        """记下刚读取或写入后的文件状态（调用方持有文件锁）。
+
+        snapshot_seq 是刚写入的快照中记录的日志序号，之后的日志记录要编在它后面。
+        """
+        self.snapshot_signature = stat_signature(self.tree.filename)
+        journal = self.storage.journal
+        if journal is not None:
+            journal.size = os.path.getsize(journal.filename) if os.path.exists(journal.filename) else 0
+        if snapshot_seq is not None:
+            self.disk_seq = max(self.disk_seq, snapshot_seq)
+
+    def changed(self):
+        if stat_signature(self.tree.filename) != self.snapshot_signature:
+            return True
+        journal = self.storage.journal
+        return journal is not None and os.path.exists(journal.filename) and \
+            os.path.getsize(journal.filename) != journal.size
+
+    def prepare_save(self, operations):
+        """写入前调用（持有排他锁和 tree.lock）：本地修改即将写入文件，日志记录接在文件已有的记录之后编号。"""
+        unsaved = self.unsaved_ids
+        for operation in operations:
+            if not operation.get("external") and operation.get("op") in LOCAL_CHANGES:
+                unsaved[operation["id"]] -= 1
+                if unsaved[operation["id"]] <= 0:
+                    del unsaved[operation["id"]]
+        for task_id in [task_id for task_id in self.origins if task_id not in unsaved]:
+            del self.origins[task_id]
+        saved = {id(operation) for operation in operations}
+        self.unsaved_placements = [operation for operation in self.unsaved_placements if id(operation) not in saved]
+        storage = self.storage
+        if storage.journal is not None:
+            for operation in operations:
+                self.disk_seq += 1
+                operation["seq"] = self.disk_seq
+            storage.journal_seq = max(storage.journal_seq, self.disk_seq)
+
+    def merge(self):
+        """合并文件中的外部修改（调用方持有文件锁和 tree.lock），返回合并的修改数。"""
+        if not self.mergeable or not self.changed():
+            return 0
+        tree = self.tree
+        journal = self.storage.journal
+        signature = stat_signature(tree.filename)
+        merged = 0
+        offset = journal.size if journal is not None else 0
+        if signature != self.snapshot_signature:
+            self.snapshot_signature = signature
+            if signature is None:
+                return 0  # 快照被删除了，下次写入时会重新创建
+            from json_stream import load_tree
+
+            try:
+                with open(tree.filename, 'r') as file:
+                    data = load_tree(file)
+                root = data["root"]
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"读取外部修改后的 {tree.filename} 失败，原因：{e}")
+                return 0
+            merged += self.merge_tree(root, data.get("current_task_id"))
+            offset = 0
+            self.disk_seq = max(self.disk_seq, data.get("journal_seq", 0))
+            base_seq = data.get("journal_seq", 0)
+        else:
+            base_seq = 0
+        if journal is not None:
+            records, journal.size = journal.read_from(offset)
+            for record in records:
+                seq = record.get("seq", 0)
+                if seq > base_seq:
+                    merged += self.merge_record(record)
+                self.disk_seq = max(self.disk_seq, seq)
+            self.storage.journal_seq = max(self.storage.journal_seq, self.disk_seq)
+        if merged:
+            self.replay_placements()
+            print(f"已合并 {tree.filename} 中的 {merged} 处外部修改。")
+        return merged
+
+    def notify(self, operation, previous=None):
+        operation["external"] = True
+        self.tree.notify_listeners(operation, previous)
+
+    def replace_root(self, root, current_task_id):
+        """外部重置了任务树（根节点不同），整体换成新的树。"""
+        tree = self.tree
+        tree.set_root(root)
+        tree.current_task = tree.tasks.get(current_task_id, root)
+        self.notify({"op": "reset", "id": root.id})
+        return 1
+
+    def local_index(self, parent, place, task=None):
+        """把记录中的位置（place 中的 after_id 或 index）换算为 parent.children 中的位置（task 是要移动的任务，不计入）。
+
+        after_id 在本地被移走或删除过时，沿 origins 换成它在文件中的前一个兄弟。找不到 after_id 时按 index 放置：文件中的 index 不计本实例尚未写出的添加和移入的任务，
+        index 为 None 或超出时放在文件中最后一个兄弟之后。
+        """
+        children = [child for child in parent.children if child is not task]
+        if "after_id" in place:
+            after_id = place["after_id"]
+            # 前一个兄弟在本地被移走或删除过（尚未写出）时，换成它在文件中的前一个兄弟
+            seen = set()
+            while after_id in self.origins and self.origins[after_id][0] == parent.id and after_id not in seen:
+                seen.add(after_id)
+                after_id = self.origins[after_id][1]
+            if after_id is None:
+                return 0
+            if after_id not in self.origins:
+                for position, child in enumerate(children):
+                    if child.id == after_id:
+                        return position + 1
+        placed = {operation["id"] for operation in self.unsaved_placements}
+        index = place.get("index")
+        on_disk = [position for position, child in enumerate(children) if child.id not in placed]
+        if index is None or index >= len(on_disk):
+            return on_disk[-1] + 1 if on_disk else 0
+        return on_disk[index]
+
+    def replay_placements(self):
+        """合并之后按顺序重放本实例尚未写出的添加和移动的位置（与以后重新加载文件时重放日志的结果相同）。"""
+        tree = self.tree
+        for placement in self.unsaved_placements:
+            task = tree.tasks.get(placement["id"])
+            parent = tree.tasks.get(placement["parent_id"])
+            if task is None or parent is None or task.parent is None or task in tree.get_task_path(parent):
+                continue
+            siblings = [child for child in parent.children if child is not task]
+            index = tree.placement_index(siblings, placement)
+            index = len(siblings) if index is None else min(index, len(siblings))
+            if task.parent is parent and parent.children.index(task) == index:
+                continue
+            operation = {"op": "move", "id": task.id, "parent_id": parent.id, "index": index}
+            previous = tree.apply_operation(operation)
+            if previous is not None:
+                self.notify(operation, previous)
+
+    def add_external(self, parent, task_id, name, place, completed_at=None):
+        """添加外部新增的任务，place 是记录中的位置（见 local_index）。"""
+        from task_tree import Task
+
+        tree = self.tree
+        task = Task(name, task_id, completed_at=completed_at)
+        index = self.local_index(parent, place)
+        tree.attach_task(parent, task, index)
+        operation = {"op": "add", "id": task_id, "parent_id": parent.id, "name": name, "index": index}
+        if completed_at is not None:
+            operation["completed_at"] = completed_at
+        self.notify(operation)
+        return task
+
+    def remove_external(self, task):
+        """删除任务及其子树；专注任务在其中时回退到父任务（见 TaskTree.apply_operation）。"""
+        operation = {"op": "remove", "id": task.id}
+        previous = self.tree.apply_operation(operation)
+        if previous is not None:
+            self.notify(operation, previous)
+
+    def rename_external(self, task, name):
+        operation = {"op": "rename", "id": task.id, "name": name}
+        self.notify(operation, self.tree.apply_operation(operation))
+
+    def set_completed_external(self, task, completed_at):
+        """同步完成状态（不移动本实例的专注任务）。"""
+        previous = {"completed_at": task.completed_at}
+        task.completed_at = completed_at
+        self.notify({"op": "complete" if completed_at is not None else "reopen", "id": task.id, "at": completed_at},
+                    previous)
+
+    def merge_tree(self, root, current_task_id):
+        """把外部快照中的树与内存中的树按 id 比较，只应用有变化的节点。"""
+        tree = self.tree
+        if root.id != tree.root.id:
+            return self.replace_root(root, current_task_id)
+        unsaved = self.unsaved_ids
+        merged = 0
+        external_ids = {root.id}
+        stack = [root]  # 先序遍历：父节点总是先于子节点处理
+        while stack:
+            node = stack.pop()
+            parent = tree.tasks.get(node.id)
+            for index, child in enumerate(node.children):
+                external_ids.add(child.id)
+                stack.append(child)
+                if child.id in unsaved or parent is None:
+                    continue  # 本地修改过的任务以本地为准；父任务在本地被删除时不再恢复
+                mine = tree.tasks.get(child.id)
+                # 快照中的兄弟顺序就是文件中的位置：放在前一个兄弟之后
+                place = {"after_id": node.children[index - 1].id if index else None, "index": index}
+                if mine is None:
+                    self.add_external(parent, child.id, child.name, place, child.completed_at)
+                    merged += 1
+                    continue
+                if mine.name != child.name:
+                    self.rename_external(mine, child.name)
+                    merged += 1
+                if mine.completed_at != child.completed_at:
+                    self.set_completed_external(mine, child.completed_at)
+                    merged += 1
+                if mine.parent is not parent and mine not in tree.get_task_path(parent):
+                    self.move_external(mine, parent, place)
+                    merged += 1
+        # 删除外部快照中已经不存在的任务（本地新增、尚未写入的任务除外）
+        stack = [tree.root]
+        while stack:
+            node = stack.pop()
+            for child in list(node.children):
+                if child.id in external_ids or child.id in unsaved:
+                    stack.append(child)
+                else:
+                    self.remove_external(child)
+                    merged += 1
+        return merged
+
+    def move_external(self, task, parent, place):
+        """移动任务及其子树（专注任务不变），place 是记录中的位置（见 local_index）。"""
+        index = self.local_index(parent, place, task)
+        operation = {"op": "move", "id": task.id, "parent_id": parent.id, "index": index}
+        previous = self.tree.apply_operation(operation)
+        if previous is not None:
+            self.notify(operation, previous)
+
+    def merge_record(self, record):
+        """应用其它实例追加的一条日志记录（专注任务的变化只属于那个实例，忽略；完成状态会同步）。"""
+        tree = self.tree
+        op = record.get("op")
+        task_id = record.get("id")
+        if op == "reset":
+            from task_tree import Task
+
+            return self.replace_root(Task(name="Root", id=task_id), None)
+        if task_id in self.unsaved_ids:
+            return 0
+        task = tree.tasks.get(task_id)
+        if op == "add":
+            parent = tree.tasks.get(record.get("parent_id"))
+            if task is not None or parent is None:
+                return 0
+            self.add_external(parent, task_id, sys.intern(record["name"]), record, record.get("completed_at"))
+            return 1
+        if op == "rename" and task is not None:
+            if task.name == record["name"]:
+                return 0
+            self.rename_external(task, record["name"])
+            return 1
+        if op in ("complete", "reopen") and task is not None and "at" in record:
+            if task.completed_at == record["at"]:
+                return 0
+            self.set_completed_external(task, record["at"])
+            return 1
+        if op == "remove" and task is not None and task.parent is not None:
+            self.remove_external(task)
+            return 1
+        if op == "move" and task is not None and task.parent is not None:
+            parent = tree.tasks.get(record.get("parent_id"))
+            if parent is None or task in tree.get_task_path(parent):
+                return 0
+            self.move_external(task, parent, record)
+            return 1
+        return 0
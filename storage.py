@@ -0,0 +1,491 @@
+"""TaskTree 的可插拔存储后端。
+
+TaskTree 按文件扩展名选择后端：.db/.sqlite 使用 SqliteStorage，其余使用 JsonStorage
+（JSON 快照，.ewtb 为二进制快照，可选追加日志）；也可以通过 ``TaskTree(storage=...)`` 传入。
+后端需要实现：
+
+    load(tree)                   加载根节点和当前专注任务，其余节点可以按需加载
+    apply(operations, current_id) 写出一批操作记录，并记录当前专注任务（TaskTree 在锁外调用）
+    request_snapshot()           下次 apply 时整体重写（逐条写入的后端什么都不用做）
+    tree_rows(root)              （可选）把整棵树转换为 "import" 操作携带的数据，撤销重置时使用；
+                                 没有这个方法的后端在撤销重置时整体重写
+    load_children(task)          （按需加载时）返回 task 的直接子节点
+    resolve(root, task_id)       （按需加载时）物化到指定任务的路径并返回该任务
+    close()
+"""
+
+import os
+import sqlite3
+import struct
+import threading
+import time
+
+from shared_file import SharedFile
+from task_journal import TaskJournal
+from task_tree import LazyTask, Task, TaskTree
+from task_validation import InvalidNode, quarantine_record, validate_tree
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    parent_id TEXT,
+    position INTEGER NOT NULL DEFAULT 0,
+    completed_at REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_parent ON tasks (parent_id, position);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def snapshot_data(tree, filename, journal_seq=None):
+    """构造要写入快照文件的数据（调用方需持有 tree.lock）；journal_seq 为快照已包含的最后一条日志序号。"""
+    if filename.endswith(".ewtb"):
+        from binary_snapshot import encode_snapshot
+
+        data = encode_snapshot(tree.root, tree.current_task.id, journal_seq or 0)
+        if tree.lazy_source is not None:
+            # 编码时已物化全部节点，可以释放旧快照的映射，以便原子替换同名文件
+            tree.lazy_source.close()
+            tree.lazy_source = None
+        return data
+    from json_stream import iter_nodes
+
+    # 只捕获扁平的 (id, name, parent_id, 子节点数) 序列，写入时再流式输出，避免构造完整的字典树
+    data = {
+        "nodes": list(iter_nodes(tree.root)),
+        "current_task_id": tree.current_task.id,  # 记录当前专注任务的 id
+        "extra": {}
+    }
+    if journal_seq is not None:
+        data["extra"]["journal_seq"] = journal_seq
+    return data
+
+
+def write_snapshot(data, filename):
+    """先写入临时文件再原子替换，避免写到一半崩溃时损坏快照。"""
+    temp_filename = filename + ".tmp"
+    if isinstance(data, bytes):
+        with open(temp_filename, 'wb') as file:
+            file.write(data)
+    else:
+        from json_stream import write_tree
+
+        with open(temp_filename, 'w') as file:
+            write_tree(file, data["nodes"], data["current_task_id"], data["extra"])
+    os.replace(temp_filename, filename)
+
+
+class JsonStorage:
+    """把任务树整体保存为一个快照文件：JSON，扩展名为 .ewtb 时为按需加载的二进制快照。
+
+    日志模式下每次修改只向 <文件>.journal 追加一条记录，日志超过阈值后再压缩为新快照。
+    快照文件可能同时被其它实例使用：读写时加文件锁，写入前先合并外部修改（见 shared_file.py）。
+    """
+
+    def __init__(self, filename, journal=False, journal_threshold=256 * 1024):
+        self.filename = filename
+        self.tree = None
+        self.journal = TaskJournal(filename + ".journal", journal_threshold) if journal else None
+        self.journal_seq = 0  # 最近一条已持久化的日志记录序号
+        self.snapshot_dirty = False  # 下次写入时是否整体重写快照
+        self.shared_file = None  # 加载时创建
+
+    def close(self):
+        """快照和日志每次写入后即关闭，没有需要释放的资源。"""
+
+    def request_snapshot(self):
+        self.snapshot_dirty = True
+
+    def load(self, tree):
+        """加载快照并重放日志；文件不存在时创建新文件，无法解析时备份后重新创建。"""
+        self.tree = tree
+        tree.shared_file = self.shared_file = SharedFile(tree, self)
+        if self.filename.endswith(".ewtb") and os.path.exists(self.filename):
+            self.load_binary_snapshot()
+        elif not os.path.exists(self.filename):
+            print(f"{self.filename} 不存在，正在创建新文件并初始化任务树。")
+            if self.journal is not None and self.journal.size:
+                print(f"快照缺失，丢弃无法重放的日志 {self.journal.filename}。")
+            tree.save_to_file()
+        else:
+            self.load_json()
+
+    def load_json(self):
+        from json_stream import load_tree
+
+        tree = self.tree
+        problems = []  # 解析和校验时隔离的内容（见 task_validation.py）
+        try:
+            # 读取快照和日志时持有共享锁，其它实例不会在读到一半时写入
+            with self.shared_file.lock.shared():
+                with open(self.filename, 'r') as file:
+                    # 流式解析，边读边构造 Task，不生成中间的字典树；不合法的节点被隔离而不是中断加载
+                    data = load_tree(file, problems)
+                records = self.journal.read() if self.journal is not None else None
+                self.shared_file.record_state()
+        except (ValueError, KeyError, TypeError) as e:
+            # JSON 语法错误，无法挽救
+            print(f"文件读取失败，原因：{e}")
+            self.handle_file_format_error()
+            return
+        # 验证文件格式
+        if not self.validate_data_format(data):
+            self.handle_file_format_error()
+            return
+
+        # 一次遍历检查整棵树并就地修复，同时建立 id 索引
+        report = validate_tree(data["root"], data.get("current_task_id"), problems)
+        tree.set_root(report.root, report.current_task, index=report.tasks)
+        tree.current_task_id = tree.current_task.id
+        if self.journal is not None:
+            self.journal_seq = data.get("journal_seq", 0)
+            self.replay_journal(records, problems)
+            self.shared_file.disk_seq = self.journal_seq
+        if problems:
+            report.quarantine(self.filename + ".quarantine")
+            print(f"{self.filename} 中有不合法的内容（{report.summary()}），已自动修复，"
+                  f"被隔离的内容保存在 {self.filename}.quarantine。")
+            tree.save_to_file()  # 写回修复后的任务树，下次启动不会重复隔离
+        print(f"成功从 {self.filename} 加载任务树，当前专注任务为：{tree.current_task.name}")
+
+    def load_binary_snapshot(self):
+        """通过 mmap 打开二进制快照，只物化根节点到当前专注任务的路径，其余子树按需加载。"""
+        from binary_snapshot import BinarySnapshot
+
+        tree = self.tree
+        try:
+            with self.shared_file.lock.shared():
+                snapshot = BinarySnapshot(self.filename, tree)
+                records = self.journal.read() if self.journal is not None else None
+                self.shared_file.record_state()
+        except (ValueError, OSError, struct.error) as e:
+            print(f"文件读取失败，原因：{e}")
+            self.handle_file_format_error()
+            return
+        tree.set_root(snapshot.load_root(), lazy_source=snapshot)
+        tree.current_task = snapshot.resolve_offset(tree.root, snapshot.current_offset) or tree.root
+        if self.journal is not None:
+            self.journal_seq = snapshot.journal_seq
+            self.replay_journal(records)
+            self.shared_file.disk_seq = self.journal_seq
+        print(f"成功从 {self.filename} 加载任务树，当前专注任务为：{tree.current_task.name}")
+
+    def replay_journal(self, records=None, problems=None):
+        """在已加载的快照之上按顺序重放日志中尚未包含的记录（records 为 None 时从日志文件读取）。
+
+        缺少字段的记录被跳过；传入 problems 列表时把它们作为隔离记录追加到其中。
+        """
+        replayed = 0
+        for operation in self.journal.read() if records is None else records:
+            if not isinstance(operation, dict) or not isinstance(operation.get("seq", 0), int):
+                print(f"日志中有不合法的记录 {operation!r}，已跳过。")
+                if problems is not None:
+                    problems.append(quarantine_record("日志记录不合法", operation))
+                continue
+            seq = operation.get("seq", 0)
+            if seq <= self.journal_seq:
+                continue
+            self.journal_seq = seq
+            try:
+                self.tree.apply_operation(operation)
+            except (KeyError, TypeError, ValueError) as error:
+                print(f"日志记录 {seq} 不合法（{error!r}），已跳过。")
+                if problems is not None:
+                    problems.append(quarantine_record("日志记录不合法", operation))
+                continue
+            replayed += 1
+        if replayed:
+            print(f"已从日志重放 {replayed} 条操作记录。")
+
+    @staticmethod
+    def validate_data_format(data):
+        """验证 JSON 数据的顶层结构：只要求有一个 root 对象，其余问题由 validate_tree 修复。
+
+        流式加载时 root 对象已经被构造为 Task（缺少 children 时没有子任务）；根节点的字段不合法时为 InvalidNode，
+        同样可以修复。缺少 current_task_id 时回退到根节点。root 缺失或不是对象时无法挽救。
+        """
+        return isinstance(data, dict) and isinstance(data.get("root"), (Task, InvalidNode))
+
+    def handle_file_format_error(self):
+        """文件无法解析时，把它改名保留下来，再用新的任务树重新创建文件（不需要用户交互）。"""
+        tree = self.tree
+        backup = f"{self.filename}.corrupt-{time.strftime('%Y%m%d-%H%M%S')}"
+        try:
+            os.replace(self.filename, backup)
+            print(f"任务文件格式不符合预期，已把原文件移到 {backup}，请手动检查其中的内容。")
+        except OSError as error:
+            print(f"任务文件格式不符合预期，且无法备份原文件（{error}），不会覆盖它。")
+            tree.set_root(tree.create_root_node())
+            return
+        if self.journal is not None and self.journal.size:
+            print(f"快照无法读取，丢弃无法重放的日志 {self.journal.filename}。")
+            self.journal.clear()
+        tree.set_root(tree.create_root_node())
+        tree.save_to_file()
+        print(f"已重新创建 {self.filename} 文件。")
+
+    def snapshot_data(self):
+        """构造要写入快照的数据（调用方需持有 tree.lock），日志模式下记录快照已包含的最后一条日志序号。"""
+        return snapshot_data(self.tree, self.filename, self.journal_seq if self.journal is not None else None)
+
+    def apply(self, operations, current_task_id):
+        """写出一批操作记录：日志模式下追加到日志（超过阈值时压缩为新快照），否则整体重写快照。
+
+        写入期间持有排他文件锁，先合并其它实例写入的修改，避免覆盖；快照在持有 tree.lock 时捕获，
+        在锁外写入。当前专注任务已经包含在快照和 focus 操作记录中。
+        """
+        tree = self.tree
+        shared_file = self.shared_file
+        with shared_file.lock.exclusive():
+            with tree.lock:
+                shared_file.merge()
+                shared_file.prepare_save(operations)
+                if operations and self.journal is None:
+                    self.snapshot_dirty = True
+                data = self.snapshot_data() if self.snapshot_dirty else None
+                self.snapshot_dirty = False
+                snapshot_seq = self.journal_seq
+            if data is None and operations:
+                self.journal.append(operations)
+                if self.journal.needs_compaction():
+                    with tree.lock:
+                        data = self.snapshot_data()
+                        snapshot_seq = self.journal_seq
+                    print(f"日志已超过阈值，正在压缩为新的快照 {self.filename}。")
+            if data is not None:
+                # 快照已包含之前所有操作，写入后即可清空日志
+                write_snapshot(data, self.filename)
+                if self.journal is not None:
+                    self.journal.clear()
+            shared_file.record_state(snapshot_seq if data is not None else None)
+
+
+class SqliteStorage:
+    """把任务树保存在 SQLite 中：每次修改只更新相关的行，子节点按需查询。
+
+    数据库使用 WAL 模式，每批操作在一个事务中提交，崩溃时不会留下写了一半的任务树；
+    其它工具也可以直接查询 tasks 表而无需加载整棵树。
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.tree = None
+        self._lock = threading.RLock()  # 连接同时被 GUI 线程（按需加载）和后台写入线程使用
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+            columns = {row[1] for row in self.connection.execute("PRAGMA table_info(tasks)")}
+            if "completed_at" not in columns:  # 旧版本创建的数据库没有完成时间
+                self.connection.execute("ALTER TABLE tasks ADD COLUMN completed_at REAL")
+
+    def close(self):
+        with self._lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def request_snapshot(self):
+        """每次修改都已逐行写入，没有需要整体重写的快照。"""
+
+    def get_meta(self, key):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def make_task(self, task_id, name, completed_at=None, parent=None):
+        task = LazyTask(name, task_id, source=self, key=task_id, completed_at=completed_at)
+        task.parent = parent
+        return task
+
+    def load(self, tree):
+        """加载根节点和当前专注任务的祖先路径；空数据库会初始化一个新的根节点。"""
+        self.tree = tree
+        with self._lock:
+            root_id = self.get_meta("root_id")
+            row = self.connection.execute(
+                "SELECT id, name, completed_at FROM tasks WHERE id = ?", (root_id,)).fetchone() if root_id else None
+            if row is None:
+                print(f"{self.filename} 中没有任务树，正在初始化新的根节点。")
+                root = tree.create_root_node()
+                self.reset(root.id, root.name)
+                tree.set_root(root)
+                return
+            current_task_id = self.get_meta("current_task_id")
+        tree.set_root(self.make_task(*row), lazy_source=self)
+        current_task = tree.get_task(current_task_id) if current_task_id else None
+        if current_task is None:
+            print(f"当前专注任务 {current_task_id} 不存在，回退到根节点。")
+            current_task = tree.root
+        tree.current_task = current_task
+        print(f"成功从 {self.filename} 加载任务树，当前专注任务为：{current_task.name}")
+
+    def load_children(self, task):
+        """查询 task 的直接子节点，并登记到所属任务树的 id 索引中。"""
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT id, name, completed_at FROM tasks WHERE parent_id = ? ORDER BY position",
+                (task.id,)).fetchall()
+        children = [self.make_task(task_id, name, completed_at, task) for task_id, name, completed_at in rows]
+        if self.tree is not None and self.tree.lazy_source is self:
+            self.tree.register_tasks(children)
+        return children
+
+    def resolve(self, root, task_id):
+        """沿 parent_id 向上查出祖先链，再从根节点逐层物化到指定任务。"""
+        with self._lock:
+            rows = self.connection.execute("""
+                WITH RECURSIVE chain(id, parent_id, depth) AS (
+                    SELECT id, parent_id, 0 FROM tasks WHERE id = ?
+                    UNION ALL
+                    SELECT tasks.id, tasks.parent_id, chain.depth + 1
+                    FROM tasks JOIN chain ON tasks.id = chain.parent_id
+                )
+                SELECT id FROM chain ORDER BY depth DESC
+            """, (task_id,)).fetchall()
+        path = [row[0] for row in rows]
+        if not path or path[0] != root.id:
+            return None
+        node = root
+        for child_id in path[1:]:
+            for child in node.children:
+                if child.id == child_id:
+                    node = child
+                    break
+            else:
+                return None
+        return node
+
+    def reset(self, root_id, root_name="Root"):
+        with self._lock, self.connection:
+            self.connection.execute("DELETE FROM tasks")
+            self.connection.execute("INSERT INTO tasks (id, name, parent_id, position) VALUES (?, ?, NULL, 0)",
+                                    (root_id, root_name))
+            self.set_meta({"root_id": root_id, "current_task_id": root_id})
+
+    def set_meta(self, values):
+        self.connection.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", values.items())
+
+    def apply(self, operations, current_task_id):
+        """在一个事务中应用一批操作记录，每条操作只影响相关的行。"""
+        if not operations:
+            return
+        with self._lock, self.connection:
+            cursor = self.connection.cursor()
+            for operation in operations:
+                op = operation.get("op")
+                if op == "reset":
+                    cursor.execute("DELETE FROM tasks")
+                    cursor.execute("INSERT INTO tasks (id, name, parent_id, position) VALUES (?, 'Root', NULL, 0)",
+                                   (operation["id"],))
+                    self.set_meta({"root_id": operation["id"]})
+                elif op == "add" and operation.get("index") is not None:
+                    self.insert_at(cursor, operation)
+                elif op == "add":
+                    cursor.execute("""
+                        INSERT OR IGNORE INTO tasks (id, name, parent_id, position, completed_at)
+                        VALUES (?, ?, ?, (SELECT COALESCE(MAX(position) + 1, 0) FROM tasks WHERE parent_id = ?), ?)
+                    """, (operation["id"], operation["name"], operation["parent_id"], operation["parent_id"],
+                          operation.get("completed_at")))
+                elif op == "rename":
+                    cursor.execute("UPDATE tasks SET name = ? WHERE id = ?", (operation["name"], operation["id"]))
+                elif op in ("complete", "reopen"):
+                    cursor.execute("UPDATE tasks SET completed_at = ? WHERE id = ?",
+                                   (operation.get("at"), operation["id"]))
+                elif op == "move":
+                    self.move_to(cursor, operation)
+                elif op == "remove":
+                    cursor.execute("""
+                        WITH RECURSIVE subtree(id) AS (
+                            SELECT ?
+                            UNION ALL
+                            SELECT tasks.id FROM tasks JOIN subtree ON tasks.parent_id = subtree.id
+                        )
+                        DELETE FROM tasks WHERE id IN subtree
+                    """, (operation["id"],))
+                elif op == "import":
+                    cursor.execute("DELETE FROM tasks")
+                    cursor.executemany(
+                        "INSERT INTO tasks (id, name, parent_id, position, completed_at) VALUES (?, ?, ?, ?, ?)",
+                        operation["rows"])
+                    self.set_meta({"root_id": operation["root_id"]})
+                # focus 只移动专注任务，统一在下面记录
+            self.set_meta({"current_task_id": current_task_id})
+
+    def insert_at(self, cursor, operation):
+        """把任务插入到父任务的第 index 个子任务之前（撤销删除时恢复原来的位置）。"""
+        row = cursor.execute("SELECT position FROM tasks WHERE parent_id = ? ORDER BY position LIMIT 1 OFFSET ?",
+                             (operation["parent_id"], operation["index"])).fetchone()
+        if row is None:
+            position = cursor.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM tasks WHERE parent_id = ?",
+                                      (operation["parent_id"],)).fetchone()[0]
+        else:
+            position = row[0]
+            cursor.execute("UPDATE tasks SET position = position + 1 WHERE parent_id = ? AND position >= ?",
+                           (operation["parent_id"], position))
+        cursor.execute(
+            "INSERT OR IGNORE INTO tasks (id, name, parent_id, position, completed_at) VALUES (?, ?, ?, ?, ?)",
+            (operation["id"], operation["name"], operation["parent_id"], position, operation.get("completed_at")))
+
+    def move_to(self, cursor, operation):
+        """把任务移动到新父任务的第 index 个子任务之前（index 按移出该任务之后的子任务计算）。"""
+        task_id, parent_id = operation["id"], operation["parent_id"]
+        row = None
+        if operation.get("index") is not None:
+            row = cursor.execute(
+                "SELECT position FROM tasks WHERE parent_id = ? AND id != ? ORDER BY position LIMIT 1 OFFSET ?",
+                (parent_id, task_id, operation["index"])).fetchone()
+        if row is None:
+            position = cursor.execute(
+                "SELECT COALESCE(MAX(position) + 1, 0) FROM tasks WHERE parent_id = ? AND id != ?",
+                (parent_id, task_id)).fetchone()[0]
+        else:
+            position = row[0]
+            cursor.execute("UPDATE tasks SET position = position + 1 WHERE parent_id = ? AND id != ? AND position >= ?",
+                           (parent_id, task_id, position))
+        cursor.execute("UPDATE tasks SET parent_id = ?, position = ? WHERE id = ?", (parent_id, position, task_id))
+
+    @staticmethod
+    def tree_rows(root):
+        """把内存中的任务树展开为 tasks 表的行（会物化所有未加载的子树）。"""
+        rows = [(root.id, root.name, None, 0, root.completed_at)]
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            for position, child in enumerate(node.children):
+                rows.append((child.id, child.name, node.id, position, child.completed_at))
+                stack.append(child)
+        return rows
+
+    def import_tree(self, root, current_task_id):
+        """把内存中的整棵任务树写入数据库（用于从 JSON 迁移）。"""
+        rows = self.tree_rows(root)
+        with self._lock, self.connection:
+            self.connection.execute("DELETE FROM tasks")
+            self.connection.executemany(
+                "INSERT INTO tasks (id, name, parent_id, position, completed_at) VALUES (?, ?, ?, ?, ?)", rows)
+            self.set_meta({"root_id": root.id, "current_task_id": current_task_id})
+
+
+def json_to_sqlite(json_filename, db_filename):
+    """把 task_tree.json 导入到 SQLite 数据库。"""
+    tree = TaskTree(json_filename)
+    storage = SqliteStorage(db_filename)
+    try:
+        storage.import_tree(tree.root, tree.current_task.id)
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        print("用法：python storage.py <task_tree.json> <task_tree.db>")
+        sys.exit(1)
+    json_to_sqlite(sys.argv[1], sys.argv[2])
+    print(f"已将 {sys.argv[1]} 导入 {sys.argv[2]}。")
@@ -0,0 +1,159 @@
+"""同步服务器的参考实现：为 task_sync.py 保存并转发各台机器上传的操作，用于测试和家庭网络内使用。
+
+服务器不理解任务树，只按任务树（根节点 id）分别保存一条只追加的操作序列，给每条操作编上递增的序号，
+按操作 id 去重（客户端在确认之前崩溃后重新上传不会产生重复的操作）。合并完全由客户端完成。
+
+协议与 task_daemon.py 相同，是按行分隔的 JSON，一次请求完成上传和取回：
+
+    {"cmd": "sync", "tree": 根节点 id, "replica": 机器 id, "since": 已取回的序号, "ops": [...], "limit": 1000}
+    -> {"ok": true, "seq": 本次取回到的序号, "ops": [序号在 since 之后、由其它机器上传的操作], "more": 是否还有}
+    {"cmd": "ping"} -> {"ok": true, "trees": 任务树数量}
+
+指定 --log 时操作同时追加到文件（每行一条，带 tree 和 seq 字段），重启后从文件恢复。
+
+    python sync_server.py --host 0.0.0.0 --port 8765 --log sync_server.log
+"""
+
+import json
+import socketserver
+import sys
+import threading
+
+from task_sync import DEFAULT_PORT, PULL_LIMIT
+
+
+class OperationLog:
+    """一棵任务树在服务器上的操作序列。"""
+
+    __slots__ = ("ops", "ids")
+
+    def __init__(self):
+        self.ops = []  # 序号为 i + 1 的操作
+        self.ids = set()
+
+
+class SyncServer:
+    def __init__(self, log_filename=None):
+        self.trees = {}  # 根节点 id -> OperationLog
+        self.lock = threading.Lock()
+        self.log_filename = log_filename
+        self.server = None
+        self._thread = None
+        if log_filename is not None:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.log_filename, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # 崩溃时残留的半行
+                    log = self.trees.setdefault(record.pop("tree"), OperationLog())
+                    record.pop("seq", None)
+                    log.ops.append(record)
+                    log.ids.add(record["op_id"])
+        except FileNotFoundError:
+            pass
+
+    def execute(self, request):
+        try:
+            if not isinstance(request, dict):
+                raise ValueError("请求必须是 JSON 对象")
+            if request.get("cmd") == "ping":
+                return {"ok": True, "trees": len(self.trees)}
+            if request.get("cmd") != "sync":
+                raise ValueError(f"未知的命令：{request.get('cmd')}")
+            return dict(self.sync(str(request["tree"]), str(request["replica"]), int(request.get("since", 0)),
+                                  request.get("ops", []), int(request.get("limit", PULL_LIMIT))), ok=True)
+        except (KeyError, TypeError, ValueError) as error:
+            return {"ok": False, "error": f"请求参数错误：{error!r}"}
+
+    def sync(self, tree, replica, since, ops, limit):
+        """保存上传的操作，返回 since 之后其它机器上传的操作（最多 limit 条）。"""
+        with self.lock:
+            log = self.trees.setdefault(tree, OperationLog())
+            accepted = []
+            for record in ops:
+                if not isinstance(record, dict) or not isinstance(record.get("op_id"), str):
+                    raise ValueError(f"操作缺少 op_id：{record!r}")
+                if record["op_id"] in log.ids:
+                    continue
+                log.ids.add(record["op_id"])
+                log.ops.append(record)
+                accepted.append(dict(record, tree=tree, seq=len(log.ops)))
+            if accepted and self.log_filename is not None:
+                with open(self.log_filename, "a", encoding="utf-8") as file:
+                    file.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in accepted))
+            since = max(0, min(since, len(log.ops)))
+            end = min(len(log.ops), since + limit)
+            return {
+                "seq": end,
+                "ops": [record for record in log.ops[since:end] if record.get("replica") != replica],
+                "more": end < len(log.ops),
+            }
+
+    # ---- 服务 ----
+
+    def start(self, host="127.0.0.1", port=DEFAULT_PORT, background=False):
+        """在 TCP 端口上开始服务；background 为 True 时在后台线程中服务并立即返回。port 为 0 时自动选择端口。"""
+        self.server = SyncTCPServer((host, port), self)
+        if background:
+            self._thread = threading.Thread(target=self.server.serve_forever, name="SyncServer", daemon=True)
+            self._thread.start()
+        else:
+            self.server.serve_forever()
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class SyncRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                response = self.server.sync_server.execute(json.loads(line))
+            except ValueError as error:
+                response = {"ok": False, "error": f"无法解析请求：{error}"}
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode() + b"\n")
+
+
+class SyncTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, sync_server):
+        self.sync_server = sync_server
+        super().__init__(address, SyncRequestHandler)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="EasyWorkflow 同步服务器（参考实现）")
+    parser.add_argument("--host", default="127.0.0.1", help="监听的地址，其它机器连接时使用 0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--log", help="把操作追加到该文件，重启后恢复")
+    args = parser.parse_args(argv)
+    server = SyncServer(args.log)
+    print(f"同步服务器已在 {args.host}:{args.port} 上启动。")
+    try:
+        server.start(args.host, args.port)
+    except KeyboardInterrupt:
+        server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
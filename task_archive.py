@@ -0,0 +1,181 @@
+"""已完成子树的冷存储归档。
+
+完成很久的任务留在任务树中只会让加载、保存和内存占用越来越大。归档时把整棵已完成的子树写入
+``<任务树文件>.archive/`` 目录中的段文件，再从任务树中删除：
+
+    段文件    segment-000001.jsonl.gz ...，每行一条 JSON 记录，gzip 压缩
+    归档记录  {"archived_at", "parent_id", "index", "path", "nodes": [[id, 名称, 父任务 id, 完成时间], ...]}
+              nodes 按先序排列，第一个是子树的根；path 是归档时父任务的完整路径（名称）
+    恢复记录  {"restored": 子树根 id, "at": 时间}
+
+段文件只追加不改写：每次归档或恢复都在最后一个段的末尾追加一个新的 gzip 成员（gzip 格式允许多个成员
+首尾相接，读取时按顺序解压），超过 SEGMENT_LIMIT 后开始新的段。恢复只追加一条恢复记录，
+被恢复的子树之后不再出现在搜索结果中。
+
+归档的任务仍然可以搜索：第一次搜索时解压全部段，建立名称列表，之后只在段文件变化时重新读取。
+"""
+
+import gzip
+import json
+import os
+import time
+import zlib
+
+from file_lock import FileLock
+
+SEGMENT_LIMIT = 4 * 1024 * 1024  # 段文件超过这个大小（压缩后）后开始写新的段
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".jsonl.gz"
+
+
+class ArchivedTask:
+    """搜索结果中的一个归档任务。"""
+
+    __slots__ = ("id", "name", "path", "completed_at", "archived_at", "record")
+
+    def __init__(self, task_id, name, path, completed_at, archived_at, record):
+        self.id = task_id
+        self.name = name
+        self.path = path  # 从根节点到父任务的名称列表（归档时）
+        self.completed_at = completed_at
+        self.archived_at = archived_at
+        self.record = record  # 所在的归档记录（整棵子树）
+
+
+class TaskArchive:
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = FileLock(directory + ".lock")  # 多个实例同时归档或恢复时串行追加
+        self.records = None  # 子树根 id -> 尚未恢复的归档记录，第一次查询时才读取段文件
+        self.entries = []  # (规范化的名称, 任务 id, 所在的归档记录)
+        self._signature = None  # 上次读取时段文件的 (名称, 大小) 列表
+
+    def segments(self):
+        try:
+            names = sorted(name for name in os.listdir(self.directory)
+                           if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, name) for name in names]
+
+    def signature(self):
+        return [(path, os.path.getsize(path)) for path in self.segments()]
+
+    # ---- 写入 ----
+
+    def append(self, records):
+        """把一批记录作为一个 gzip 成员追加到最后一个段。"""
+        if not records:
+            return
+        payload = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+        os.makedirs(self.directory, exist_ok=True)
+        with self.lock.exclusive():
+            segments = self.segments()
+            if segments and os.path.getsize(segments[-1]) < SEGMENT_LIMIT:
+                path = segments[-1]
+            else:
+                path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{len(segments) + 1:06d}{SEGMENT_SUFFIX}")
+            with open(path, "ab") as file:
+                file.write(gzip.compress(payload))
+        self._signature = None  # 下次查询时重新读取（也包含其它实例追加的记录）
+
+    @staticmethod
+    def make_record(task, path, index, archived_at):
+        """把一棵子树转换为归档记录（会物化按需加载的子树）。"""
+        nodes = []
+        stack = [task]
+        while stack:
+            node = stack.pop()
+            nodes.append([node.id, node.name, node.parent_id, node.completed_at])
+            stack.extend(reversed(node.children))
+        return {"archived_at": archived_at, "parent_id": task.parent_id, "index": index, "path": path,
+                "nodes": nodes}
+
+    def mark_restored(self, record):
+        self.append([{"restored": record["nodes"][0][0], "at": time.time()}])
+
+    # ---- 读取 ----
+
+    def load(self):
+        """段文件有变化时重新读取全部记录。"""
+        signature = self.signature()
+        if signature == self._signature:
+            return
+        records = {}
+        for path, _ in signature:
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as file:
+                    lines = file.readlines()
+            except (OSError, EOFError) as error:
+                # 写到一半的最后一个成员会导致读取失败，丢弃该段中无法解压的部分
+                print(f"读取归档段 {path} 失败，原因：{error}")
+                lines = self.read_intact_members(path)
+            for line in lines:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if "restored" in record:
+                    records.pop(record["restored"], None)
+                elif record.get("nodes"):
+                    records[record["nodes"][0][0]] = record  # 同一棵子树被重复归档时以最后一次为准
+        entries = []
+        for record in records.values():
+            for task_id, name, _, _ in record["nodes"]:
+                entries.append((name.casefold(), task_id, record))
+        self.records = records
+        self.entries = entries
+        self._signature = signature
+
+    @staticmethod
+    def read_intact_members(path):
+        """逐个解压段文件中的 gzip 成员，返回损坏位置之前的所有行。"""
+        lines = []
+        with open(path, "rb") as file:
+            data = file.read()
+        while data:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)  # 16 + MAX_WBITS：解析 gzip 头部
+            try:
+                text = decompressor.decompress(data)
+            except zlib.error:
+                break
+            if not decompressor.eof:
+                break
+            lines.extend(text.decode("utf-8", "replace").splitlines(keepends=True))
+            data = decompressor.unused_data
+        return lines
+
+    def find(self, task_id):
+        """返回包含该任务的归档记录，不在归档中时返回 None。"""
+        self.load()
+        for _, entry_id, record in self.entries:
+            if entry_id == task_id:
+                return record
+        return None
+
+    def search(self, query, limit=20):
+        """按名称子串搜索归档的任务，匹配位置靠前、名称较短的在前。"""
+        self.load()
+        query = query.casefold()
+        if not query:
+            return []
+        matches = []
+        for name, task_id, record in self.entries:
+            position = name.find(query)
+            if position >= 0:
+                matches.append((position, len(name), task_id, record))
+        matches.sort(key=lambda match: match[:3])
+        return [self.describe(task_id, record) for _, _, task_id, record in matches[:limit]]
+
+    @staticmethod
+    def describe(task_id, record):
+        nodes = {node[0]: node for node in record["nodes"]}
+        task = nodes[task_id]
+        path = []
+        parent_id = task[2]
+        while parent_id in nodes:
+            path.append(nodes[parent_id][1])
+            parent_id = nodes[parent_id][2]
+        path = list(record.get("path", [])) + path[::-1]
+        return ArchivedTask(task_id, task[1], path, task[3], record.get("archived_at"), record)
+
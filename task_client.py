@@ -0,0 +1,161 @@
+"""任务守护进程（见 task_daemon.py）的客户端和命令行工具。
+
+    python task_client.py add "修复构建脚本"          在当前任务下添加任务并专注于它
+    python task_client.py add "子任务" --parent <id>  在指定任务下添加任务
+    python task_client.py rename "新名称" [--id <id>]
+    python task_client.py complete
+    python task_client.py current
+    python task_client.py focus <id>
+    python task_client.py search <关键字>
+    python task_client.py move <id> <父任务 id> [--index 0]
+    python task_client.py remove <id>
+    python task_client.py import < outline.md         把标准输入中的大纲导入到当前任务下
+    python task_client.py time [--id <id>] [--days 7]  专注时间统计
+    python task_client.py run < commands.jsonl        从标准输入逐行读取 JSON 请求，流水线发送
+
+在脚本中可以直接使用 TaskClient 保持一个连接，连续发送大量请求：
+
+    with TaskClient() as client:
+        client.request("add", name="构建失败")
+        client.pipeline([{"cmd": "add", "name": f"任务 {i}"} for i in range(1000)])
+"""
+
+import json
+import socket
+import sys
+
+from task_daemon import DEFAULT_ADDRESS
+
+PIPELINE_WINDOW = 512  # 流水线中最多有多少个请求在等待响应，避免双方的发送缓冲区都被填满而互相等待
+
+
+class TaskClient:
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=None):
+        """连接到守护进程；守护进程没有运行时抛出 OSError。"""
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        try:
+            self.socket.connect(address)
+        except OSError:
+            self.socket.close()
+            raise
+        self.reader = self.socket.makefile("rb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.reader.close()
+        self.socket.close()
+
+    def request(self, cmd, **fields):
+        """发送一个请求并等待响应。"""
+        return self.pipeline([dict(fields, cmd=cmd)])[0]
+
+    def pipeline(self, requests):
+        """连续发送多个请求，不逐个等待响应，按请求顺序返回全部响应。"""
+        responses = []
+        for start in range(0, len(requests), PIPELINE_WINDOW):
+            window = requests[start:start + PIPELINE_WINDOW]
+            self.socket.sendall(b"".join(
+                json.dumps(request, ensure_ascii=False).encode() + b"\n" for request in window))
+            for _ in window:
+                line = self.reader.readline()
+                if not line:
+                    raise ConnectionError("守护进程关闭了连接")
+                responses.append(json.loads(line))
+        return responses
+
+
+def parse_command(argv):
+    """把命令行参数转换为 (套接字路径, 请求)。"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="向任务守护进程发送命令。")
+    parser.add_argument("--socket", default=DEFAULT_ADDRESS, help="套接字路径")
+    commands = parser.add_subparsers(dest="cmd", required=True)
+    add = commands.add_parser("add", help="添加任务并专注于它")
+    add.add_argument("name")
+    add.add_argument("--parent", dest="parent_id")
+    rename = commands.add_parser("rename", help="重命名任务")
+    rename.add_argument("name")
+    rename.add_argument("--id")
+    commands.add_parser("complete", help="完成当前任务")
+    commands.add_parser("current", help="显示当前任务")
+    focus = commands.add_parser("focus", help="专注于指定的任务")
+    focus.add_argument("id")
+    search = commands.add_parser("search", help="搜索任务")
+    search.add_argument("query")
+    search.add_argument("--limit", type=int, default=20)
+    move = commands.add_parser("move", help="把任务连同子树移动到另一个任务下")
+    move.add_argument("id")
+    move.add_argument("parent_id")
+    move.add_argument("--index", type=int)
+    remove = commands.add_parser("remove", help="删除任务及其子树")
+    remove.add_argument("id")
+    outline = commands.add_parser("import", help="从标准输入导入缩进文本或 Markdown 大纲")
+    outline.add_argument("--parent", dest="parent_id")
+    focus_time = commands.add_parser("time", help="显示任务（默认为根节点）的专注时间统计")
+    focus_time.add_argument("--id")
+    focus_time.add_argument("--days", type=int, default=7)
+    commands.add_parser("sync", help="立即与同步服务器同步")
+    commands.add_parser("ping", help="检查守护进程是否在运行")
+    commands.add_parser("shutdown", help="停止守护进程")
+    commands.add_parser("run", help="从标准输入逐行读取 JSON 请求")
+    args = vars(parser.parse_args(argv))
+    address = args.pop("socket")
+    return address, {key: value for key, value in args.items() if value is not None}
+
+
+def print_response(request, response):
+    if not response["ok"]:
+        print(f"错误：{response['error']}", file=sys.stderr)
+    elif request["cmd"] == "current":
+        print(" > ".join(response["path"]))
+        print(response["task"]["id"])
+    elif request["cmd"] == "time":
+        from focus_time import format_duration
+
+        print(f"{response['task']['name']}：{format_duration(response['seconds'])}，"
+              f"含子任务 {format_duration(response['subtree_seconds'])}")
+        for date, seconds in response["daily"]:
+            print(f"{date}  {format_duration(seconds)}")
+    elif request["cmd"] == "sync":
+        print(f"上传 {response['pushed']} 条修改，合并 {response['merged']} 条其它机器的修改。")
+    elif request["cmd"] in ("search", "import"):
+        for task in response["tasks"]:
+            print(f"{task['id']}  {task['name']}")
+    elif "task" in response:
+        print(response["task"]["id"])
+
+
+def main(argv=None):
+    address, request = parse_command(sys.argv[1:] if argv is None else argv)
+    if request["cmd"] == "import":
+        request["text"] = sys.stdin.read()
+    if request["cmd"] == "run":
+        try:
+            requests = [json.loads(line) for line in sys.stdin if line.strip()]
+        except ValueError as error:
+            print(f"无法解析请求：{error}", file=sys.stderr)
+            return 1
+    try:
+        with TaskClient(address) as client:
+            if request["cmd"] == "run":
+                responses = client.pipeline(requests)
+                for response in responses:
+                    print(json.dumps(response, ensure_ascii=False))
+                return 0 if all(response["ok"] for response in responses) else 1
+            response = client.request(**request)
+    except (OSError, ValueError) as error:
+        print(f"无法连接任务守护进程 {address}：{error}", file=sys.stderr)
+        return 2
+    print_response(request, response)
+    return 0 if response["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
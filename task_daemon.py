@@ -0,0 +1,340 @@
+"""无界面的守护进程：在内存中持有一棵任务树，通过 Unix 套接字为脚本提供任务操作。
+
+git 钩子、构建脚本等工具连接到套接字（见 task_client.py）即可添加、重命名、完成任务，
+不需要图形界面，也不需要每次都重新启动 Python、重新解析任务树文件。
+
+协议是按行分隔的 JSON（UTF-8）：客户端每行发送一个请求，服务端按相同顺序每行返回一个响应。
+一个连接可以一直保持，也可以不等响应连续发送多个请求（流水线），服务端把一次收到的全部请求
+处理完后一起写回响应。请求的格式为 ``{"cmd": 命令, ...参数}``，响应为 ``{"ok": true, ...}``
+或 ``{"ok": false, "error": 原因}``：
+
+    ping                          返回守护进程的 pid 和任务树文件
+    current                       返回当前专注的任务
+    add      name [parent_id]     在当前任务（或 parent_id 指定的任务）下添加任务并专注于它
+    rename   name [id]            重命名当前任务（或 id 指定的任务）
+    complete                      完成当前任务，回退到父任务
+    focus    id                   专注于指定的任务
+    search   query [limit]        按名称搜索任务
+    move     id parent_id [index] 把任务连同子树移动到 parent_id 下（index 为 None 时追加到末尾）
+    remove   id                   删除任务及其子树
+    import   text [parent_id]     把缩进文本或 Markdown 大纲导入到当前任务（或 parent_id）下，只保存一次
+    time     [id] [days]          任务（默认为根节点）自身和整棵子树的累计专注时间，以及最近 days 天每天的时间
+    sync                          立即与同步服务器交换修改（需要以 --sync-server 启动），返回上传和合并的修改数
+    batch    commands             在一个批次中依次执行多个请求，只保存一次，返回 results 列表
+    shutdown                      写出修改后停止服务（图形界面启动时用它接管任务树）
+
+图形界面启动时如果发现守护进程正在运行，会先让它写出修改并退出，再加载同一个任务树，
+自己在同一个套接字上继续提供服务，因此同一时刻只有一个进程持有任务树，脚本无需关心是谁在服务。
+"""
+
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+DEFAULT_ADDRESS = os.environ.get("EASYWORKFLOW_SOCKET", "easyworkflow.sock")
+RECEIVE_SIZE = 64 * 1024
+
+
+def task_info(task):
+    return {"id": task.id, "name": task.name, "parent_id": task.parent_id}
+
+
+class TaskCommandError(Exception):
+    pass
+
+
+class TaskDaemon:
+    READ_ONLY_COMMANDS = ("ping", "current", "search", "time", "shutdown")
+
+    def __init__(self, task_tree, address=DEFAULT_ADDRESS, on_change=None):
+        self.task_tree = task_tree  # 图形界面切换工作流时会替换成新的任务树
+        self.address = address
+        self.on_change = on_change  # 每批修改之后调用（可能在服务线程中），图形界面借此刷新
+        self.server = None
+        self._thread = None
+        self.stopped = threading.Event()
+        self.shutdown_requested = False
+
+    # ---- 命令 ----
+
+    def execute(self, request):
+        """执行一个请求，返回响应；命令出错时返回错误响应而不是抛出异常。"""
+        try:
+            if not isinstance(request, dict):
+                raise TaskCommandError("请求必须是 JSON 对象")
+            handler = getattr(self, "cmd_" + str(request.get("cmd")), None)
+            if handler is None:
+                raise TaskCommandError(f"未知的命令：{request.get('cmd')}")
+            response = handler(request)
+        except TaskCommandError as error:
+            return {"ok": False, "error": str(error)}
+        except (KeyError, TypeError, ValueError) as error:
+            return {"ok": False, "error": f"请求参数错误：{error!r}"}
+        response["ok"] = True
+        return response
+
+    def get_task(self, task_id):
+        task = self.task_tree.get_task(task_id)
+        if task is None:
+            raise TaskCommandError(f"任务 {task_id} 不存在")
+        return task
+
+    def cmd_ping(self, request):
+        return {"pid": os.getpid(), "file": self.task_tree.filename}
+
+    def cmd_current(self, request):
+        tree = self.task_tree
+        with tree.lock:
+            task = tree.current_task
+            return {"task": task_info(task), "path": [node.name for node in tree.get_task_path(task)]}
+
+    def cmd_add(self, request):
+        tree = self.task_tree
+        name = str(request["name"])
+        with tree.lock:
+            if request.get("parent_id") is not None:
+                tree.focus_task(self.get_task(request["parent_id"]))
+            tree.add_task(name)
+            return {"task": task_info(tree.current_task)}
+
+    def cmd_rename(self, request):
+        tree = self.task_tree
+        with tree.lock:
+            task = self.get_task(request["id"]) if request.get("id") is not None else tree.current_task
+            if task is tree.root:
+                raise TaskCommandError("根节点名称不可修改")
+            if task is tree.current_task:
+                tree.rename_task(str(request["name"]))
+            else:
+                operation = {"op": "rename", "id": task.id, "name": str(request["name"])}
+                tree.record_operation(operation, tree.apply_operation(operation))
+            return {"task": task_info(task)}
+
+    def cmd_complete(self, request):
+        tree = self.task_tree
+        with tree.lock:
+            if tree.current_task is tree.root:
+                raise TaskCommandError("根节点不可完成")
+            completed = tree.current_task
+            tree.complete_task()
+            return {"task": task_info(completed), "current": task_info(tree.current_task)}
+
+    def cmd_focus(self, request):
+        tree = self.task_tree
+        with tree.lock:
+            tree.focus_task(self.get_task(request["id"]))
+            return {"task": task_info(tree.current_task)}
+
+    def cmd_search(self, request):
+        tasks = self.task_tree.search(str(request["query"]), int(request.get("limit", 20)))
+        return {"tasks": [task_info(task) for task in tasks]}
+
+    def cmd_move(self, request):
+        tree = self.task_tree
+        with tree.lock:
+            task = self.get_task(request["id"])
+            index = request.get("index")
+            if not tree.move_task(task, self.get_task(request["parent_id"]), None if index is None else int(index)):
+                raise TaskCommandError("不能移动根节点，也不能把任务移动到它自己的子树中")
+            return {"task": task_info(task)}
+
+    def cmd_remove(self, request):
+        tree = self.task_tree
+        with tree.lock:
+            task = self.get_task(request["id"])
+            if not tree.remove_task(task):
+                raise TaskCommandError("根节点不可删除")
+            return {"task": task_info(task), "current": task_info(tree.current_task)}
+
+    def cmd_import(self, request):
+        tree = self.task_tree
+        with tree.lock:
+            parent = self.get_task(request["parent_id"]) if request.get("parent_id") is not None else None
+            tasks = tree.import_outline(str(request["text"]), parent)
+            return {"tasks": [task_info(task) for task in tasks]}
+
+    def cmd_time(self, request):
+        tree = self.task_tree
+        if tree.focus_log is None:
+            raise TaskCommandError("没有启用专注时间统计")
+        with tree.lock:
+            task = self.get_task(request["id"]) if request.get("id") is not None else tree.root
+            focus_log = tree.focus_log
+            daily = focus_log.daily_totals(int(request.get("days", 7)), task)
+            return {"task": task_info(task), "seconds": focus_log.task_time(task),
+                    "subtree_seconds": focus_log.subtree_time(task),
+                    "daily": [[date.isoformat(), seconds] for date, seconds in daily]}
+
+    def cmd_sync(self, request):
+        """立即与同步服务器同步一次。"""
+        from task_sync import SyncError
+
+        task_sync = self.task_tree.sync
+        if task_sync is None:
+            raise TaskCommandError("没有设置同步服务器")
+        try:
+            pushed, merged = task_sync.sync()
+        except (OSError, SyncError) as error:
+            raise TaskCommandError(f"同步失败：{error}")
+        return {"pushed": pushed, "merged": merged}
+
+    def cmd_batch(self, request):
+        commands = request["commands"]
+        if not isinstance(commands, list):
+            raise TaskCommandError("commands 必须是列表")
+        with self.task_tree.batch():
+            return {"results": [self.execute(command) for command in commands]}
+
+    def cmd_shutdown(self, request):
+        self.shutdown_requested = True  # 在 handle_lines 中停止服务并写出修改后才返回响应
+        return {}
+
+    def handle_lines(self, lines):
+        """执行一次收到的全部请求行，返回要写回的响应（按请求顺序，每行一个）。"""
+        responses = []
+        changed = False
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as error:
+                responses.append({"ok": False, "error": f"无法解析请求：{error}"})
+                continue
+            response = self.execute(request)
+            responses.append(response)
+            changed = changed or response["ok"] and request.get("cmd") not in self.READ_ONLY_COMMANDS
+        if changed and self.on_change is not None:
+            self.on_change()
+        if self.shutdown_requested:
+            # 先停止接受新的请求再写出，客户端收到响应时任务树文件已经是最新的
+            self.close()
+            self.task_tree.flush()
+        return b"".join(json.dumps(response, ensure_ascii=False).encode() + b"\n" for response in responses)
+
+    # ---- 服务 ----
+
+    def start(self, background=False):
+        """在套接字上开始服务；background 为 True 时在后台线程中服务并立即返回。
+
+        套接字已被另一个正在运行的守护进程占用时抛出 OSError。
+        """
+        if not hasattr(socket, "AF_UNIX"):
+            raise OSError("当前平台不支持 Unix 套接字")
+        if os.path.exists(self.address):
+            if is_running(self.address):
+                raise OSError(f"{self.address} 上已经有守护进程在运行")
+            os.remove(self.address)  # 上次异常退出时留下的套接字文件
+        self.server = DaemonServer(self.address, self)
+        if background:
+            self._thread = threading.Thread(target=self.server.serve_forever, name="TaskDaemon", daemon=True)
+            self._thread.start()
+        else:
+            self.server.serve_forever()
+
+    def close(self):
+        """停止服务并删除套接字文件（不关闭任务树）。"""
+        if self.server is None or self.stopped.is_set():
+            return
+        self.stopped.set()
+        self.server.shutdown()
+        self.server.server_close()
+        try:
+            os.remove(self.address)
+        except OSError:
+            pass
+
+
+class DaemonRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        daemon = self.server.daemon
+        buffer = b""
+        while True:
+            data = self.request.recv(RECEIVE_SIZE)
+            if not data or daemon.stopped.is_set():
+                return
+            buffer += data
+            if b"\n" not in buffer:
+                continue
+            # 一次收到的所有完整请求一起处理，响应合并为一次写入
+            complete, buffer = buffer.rsplit(b"\n", 1)
+            self.request.sendall(daemon.handle_lines(complete.split(b"\n")))
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class DaemonServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True  # 每个连接一个线程，退出时不等待仍在连接的客户端
+
+        def __init__(self, address, daemon):
+            self.daemon = daemon
+            super().__init__(address, DaemonRequestHandler)
+
+
+def is_running(address=DEFAULT_ADDRESS):
+    """套接字上是否有守护进程在响应。"""
+    from task_client import TaskClient
+
+    try:
+        with TaskClient(address, timeout=1.0) as client:
+            return client.request("ping")["ok"]
+    except (OSError, ValueError):
+        return False
+
+
+def take_over(address=DEFAULT_ADDRESS):
+    """让正在运行的守护进程写出修改并停止服务，返回是否有守护进程被停止。"""
+    from task_client import TaskClient
+
+    try:
+        with TaskClient(address, timeout=10.0) as client:
+            client.request("shutdown")
+    except (OSError, ValueError):
+        return False
+    print(f"已接管 {address} 上守护进程持有的任务树。")
+    return True
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="在后台持有任务树，通过 Unix 套接字提供任务操作。")
+    parser.add_argument("--socket", default=DEFAULT_ADDRESS, help="套接字路径")
+    parser.add_argument("--file", help="使用单个任务树文件，而不是工作流目录中当前的工作流")
+    parser.add_argument("--directory", default="workflows", help="工作流目录")
+    parser.add_argument("--sync-server", help="同步服务器地址（主机:端口），与其它机器同步任务树")
+    args = parser.parse_args(argv)
+    tree_options = {"journal": True, "write_delay": 0.5, "history_depth": 100, "watch": True, "track_focus": True,
+                    "sync_server": args.sync_server}
+    if args.file:
+        from task_tree import TaskTree
+
+        workflow_store = None
+        task_tree = TaskTree(args.file, **tree_options)
+    else:
+        from workflow_store import WorkflowStore
+
+        workflow_store = WorkflowStore(args.directory, **tree_options)
+        task_tree = workflow_store.current()
+    daemon = TaskDaemon(task_tree, args.socket)
+    try:
+        print(f"守护进程已在 {args.socket} 上启动，任务树文件：{task_tree.filename}")
+        daemon.start()
+    except KeyboardInterrupt:
+        daemon.close()
+    except OSError as error:
+        print(f"无法启动守护进程：{error}")
+        return 1
+    finally:
+        if workflow_store is not None:
+            workflow_store.close()
+        else:
+            task_tree.close()
+    print("守护进程已停止。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
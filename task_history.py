@@ -0,0 +1,167 @@
+"""TaskTree 的撤销/重做历史。
+
+历史不复制任务树，而是为每次修改记录它的逆操作：添加的逆操作是删除，重命名的逆操作是改回旧名称，
+完成的逆操作是恢复原来的完成状态并把专注任务移回去，移动的逆操作是移回原来的位置，删除的逆操作是
+按先序重新添加整棵子树；重置任务树时保留旧的根节点对象（旧树本来就要被丢弃，
+保留引用不需要复制）。因此每一步占用的内存只与修改本身成正比，与任务树的规模无关。
+同一个 ``TaskTree.batch()`` 中的修改合并为一步。
+"""
+
+OPERATION_SIZE = 200  # 每条操作记录的估算内存（字节），另加名称长度
+NODE_SIZE = 220  # 重置时保留的旧树中每个节点的估算内存（字节）
+
+
+class HistoryStep:
+    """一步可撤销的修改：按顺序执行的操作记录，以及按撤销顺序排列的逆操作。"""
+
+    __slots__ = ("batch_id", "operations", "inverses", "size")
+
+    def __init__(self, batch_id):
+        self.batch_id = batch_id
+        self.operations = []
+        self.inverses = []
+        self.size = 0
+
+
+class TaskHistory:
+    def __init__(self, tree, max_depth=100, max_memory=32 * 1024 * 1024):
+        self.tree = tree
+        self.max_depth = max_depth
+        self.max_memory = max_memory
+        self.undo_stack = []
+        self.redo_stack = []
+        self.memory = 0  # 两个栈中所有步骤的估算内存
+        self._applying = False  # 正在执行撤销/重做，期间产生的修改不记入历史
+        tree.add_listener(self.on_operation)
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.memory = 0
+
+    def inverse_of(self, operation, previous):
+        """返回撤销该操作所需的逆操作（需要多个逆操作时返回按执行顺序排列的列表），无法撤销时返回 None。"""
+        op = operation.get("op")
+        if op == "add":
+            return {"op": "remove", "id": operation["id"]}
+        if op == "rename" and previous is not None:
+            return {"op": "rename", "id": operation["id"], "name": previous["name"]}
+        if op == "complete":
+            if previous is None:
+                return {"op": "focus", "id": operation["id"]}
+            return {"op": "reopen", "id": operation["id"], "at": previous["completed_at"]}
+        if op == "reopen" and previous is not None:
+            inverses = [{"op": "focus", "id": previous["current_id"]}]
+            if previous["completed_at"] is not None:
+                inverses.insert(0, {"op": "complete", "id": operation["id"], "at": previous["completed_at"]})
+            return inverses
+        if op == "focus" and previous is not None:
+            return {"op": "focus", "id": previous["current_id"]}
+        if op == "move" and previous is not None:
+            return {"op": "move", "id": operation["id"], "parent_id": previous["parent_id"], "index": previous["index"]}
+        if op == "remove" and previous is not None and not operation.get("archived"):
+            # 按先序重新添加整棵子树（第一个回到原来的位置），再把专注任务移回去；
+            # 归档的子树由归档负责恢复，不计入历史
+            inverses = []
+            stack = [previous["task"]]
+            while stack:
+                node = stack.pop()
+                add = {"op": "add", "id": node.id, "parent_id": node.parent_id,
+                       "name": node.name}
+                if node is previous["task"]:
+                    add["parent_id"] = previous["parent_id"]
+                    add["index"] = previous["index"]
+                if node.completed_at is not None:
+                    add["completed_at"] = node.completed_at
+                inverses.append(add)
+                stack.extend(reversed(node.children))
+            inverses.append({"op": "focus", "id": previous["current_id"]})
+            return inverses
+        if op == "reset" and previous is not None:
+            if previous["lazy"]:
+                # 按需加载的数据源随后会被新的任务树覆盖，先把旧树完全物化
+                stack = [previous["root"]]
+                while stack:
+                    stack.extend(stack.pop().children)
+            return {"op": "restore", "root": previous["root"], "current_id": previous["current_id"]}
+        return None
+
+    def on_operation(self, operation, previous):
+        """TaskTree 的修改监听器。"""
+        if self._applying:
+            return
+        if operation.get("external"):
+            # 其它实例的修改不计入本实例的历史；整棵树被替换后之前的历史不再可靠
+            if operation.get("op") in ("reset", "import"):
+                self.clear()
+            return
+        inverse = self.inverse_of(operation, previous)
+        if inverse is None:
+            # 无法撤销的修改之前的历史都不再可靠
+            self.clear()
+            return
+        # 新的修改使已撤销的步骤失效
+        self.memory -= sum(step.size for step in self.redo_stack)
+        self.redo_stack.clear()
+        batch_id = self.tree.batch_id
+        if batch_id is not None and self.undo_stack and self.undo_stack[-1].batch_id == batch_id:
+            step = self.undo_stack[-1]
+        else:
+            step = HistoryStep(batch_id)
+            self.undo_stack.append(step)
+        redo = dict(operation)
+        redo.pop("seq", None)
+        step.operations.append(redo)
+        inverses = inverse if isinstance(inverse, list) else [inverse]
+        step.inverses[0:0] = inverses
+        size = OPERATION_SIZE * (1 + len(inverses)) + len(operation.get("name", "")) * 2
+        size += sum(len(inverse.get("name", "")) * 2 for inverse in inverses if inverse["op"] == "add")
+        if inverses[0]["op"] == "restore":
+            size += previous["task_count"] * NODE_SIZE
+        elif inverses[0]["op"] == "rename":
+            size += len(inverses[0]["name"]) * 2
+        step.size += size
+        self.memory += size
+        self.trim()
+
+    def trim(self):
+        """超过步数或内存上限时丢弃最早的步骤（至少保留最近一步）。"""
+        while len(self.undo_stack) > 1 and (len(self.undo_stack) > self.max_depth or self.memory > self.max_memory):
+            self.memory -= self.undo_stack.pop(0).size
+
+    def apply(self, operations):
+        tree = self.tree
+        for operation in operations:
+            if operation["op"] == "restore":
+                tree.restore_root(operation["root"], operation["current_id"])
+            else:
+                previous = tree.apply_operation(operation)
+                tree.record_operation(dict(operation), previous)
+
+    def undo(self, steps=1):
+        """撤销最近的 steps 步，返回实际撤销的步数。"""
+        return self._move(self.undo_stack, self.redo_stack, steps, "inverses")
+
+    def redo(self, steps=1):
+        """重做最近撤销的 steps 步，返回实际重做的步数。"""
+        return self._move(self.redo_stack, self.undo_stack, steps, "operations")
+
+    def _move(self, source, target, steps, field):
+        done = 0
+        with self.tree.batch():
+            self._applying = True
+            try:
+                while done < steps and source:
+                    step = source.pop()
+                    self.apply(getattr(step, field))
+                    target.append(step)
+                    done += 1
+            finally:
+                self._applying = False
+        return done
@@ -0,0 +1,66 @@
+import json
+import os
+
+
+class TaskJournal:
+    """任务树的追加式操作日志。
+
+    每次修改只向日志末尾追加一行 JSON 记录，加载时在最近一次快照的基础上重放。
+    日志超过 ``threshold`` 字节后由 TaskTree 触发压缩：写出新的快照并清空日志。
+    """
+
+    def __init__(self, filename, threshold=256 * 1024):
+        self.filename = filename
+        self.threshold = threshold
+        self.size = os.path.getsize(filename) if os.path.exists(filename) else 0
+
+    def append(self, records):
+        """追加一条或多条操作记录。"""
+        if isinstance(records, dict):
+            records = [records]
+        lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        if not lines:
+            return
+        with open(self.filename, 'a', encoding='utf-8') as file:
+            file.write(lines)
+            file.flush()
+            os.fsync(file.fileno())
+        self.size += len(lines.encode('utf-8'))
+
+    def read(self):
+        """按顺序读出全部操作记录，忽略崩溃时可能残留的半行。"""
+        return self.read_from(0)[0]
+
+    def read_from(self, offset):
+        """读出从字节偏移 offset 开始的完整记录，返回 (记录列表, 已读到的偏移)。
+
+        其它实例追加了记录之后，只需从上次读到的位置读取新增的部分。
+        """
+        if not os.path.exists(self.filename):
+            return [], 0
+        with open(self.filename, 'rb') as file:
+            file.seek(offset)
+            data = file.read()
+        records = []
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break  # 另一个实例正在写入或崩溃残留的半行，下次再读
+            text = line.strip()
+            if text:
+                try:
+                    records.append(json.loads(text.decode('utf-8')))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    print(f"日志 {self.filename} 末尾存在不完整的记录，已忽略。")
+                    break
+            offset += len(line)
+        return records, offset
+
+    def needs_compaction(self):
+        """日志是否已超过压缩阈值。"""
+        return self.size >= self.threshold
+
+    def clear(self):
+        """清空日志（在新快照写入成功之后调用）。"""
+        with open(self.filename, 'w', encoding='utf-8'):
+            pass
+        self.size = 0
@@ -0,0 +1,64 @@
+"""把缩进文本或 Markdown 大纲解析为任务层级（见 TaskTree.import_outline）。
+
+支持的写法可以混用：
+
+    # 标题                    Markdown 标题按 # 的个数决定层级
+    - 列表项 / * 列表项 / 1. 列表项
+        - 子项                 比上一行缩进更多即为上一行的子任务（缩进宽度不限，制表符按 4 个空格计）
+    - [x] 已完成的项           任务列表的勾选状态导入为完成状态
+    纯文本行                   没有列表符号的行按缩进处理
+
+空行和 ``---`` 之类的分隔线会被忽略。列表项归属于它上方最近的标题。
+"""
+
+import re
+
+TAB_WIDTH = 4
+HEADING = re.compile(r"(#{1,6})\s+(.*?)\s*#*\s*$")
+BULLET = re.compile(r"(?:[-*+]|\d+[.)])\s+")
+CHECKBOX = re.compile(r"\[([ xX])\]\s+")
+RULE = re.compile(r"(?:-{3,}|\*{3,}|_{3,})\s*$")
+
+
+def parse_outline(text):
+    """返回先序排列的 (层级, 名称, 是否已完成) 列表，层级从 0 开始，每一项至多比上一项深一层。"""
+    items = []
+    heading_levels = []  # 当前所在的各级标题的 # 个数
+    indents = []  # 当前标题下各层列表项的缩进宽度
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or RULE.match(stripped):
+            continue
+        heading = HEADING.match(stripped)
+        if heading is not None:
+            marks = len(heading.group(1))
+            while heading_levels and heading_levels[-1] >= marks:
+                heading_levels.pop()
+            heading_levels.append(marks)
+            indents = []
+            if heading.group(2):
+                items.append((len(heading_levels) - 1, heading.group(2), False))
+            continue
+        indent = len(line.expandtabs(TAB_WIDTH)) - len(line.expandtabs(TAB_WIDTH).lstrip())
+        while indents and indents[-1] > indent:
+            indents.pop()
+        if not indents or indents[-1] < indent:
+            indents.append(indent)
+        name = stripped
+        bullet = BULLET.match(name)
+        if bullet is not None:
+            name = name[bullet.end():]
+        done = False
+        checkbox = CHECKBOX.match(name)
+        if checkbox is not None:
+            done = checkbox.group(1) != " "
+            name = name[checkbox.end():]
+        name = name.strip()
+        if name:
+            level = len(heading_levels) + len(indents) - 1
+            if items:
+                level = min(level, items[-1][0] + 1)  # 缩进跳了几级时只算深一层
+            else:
+                level = 0
+            items.append((level, name, done))
+    return items
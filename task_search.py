@@ -0,0 +1,246 @@
+"""任务名称的增量搜索索引。
+
+索引维护三个结构（名称忽略大小写）：
+    按名称排序的列表  前缀查询用二分查找定位，只读取需要返回的几项
+    三元组倒排表      三元组（相邻三个字符）-> 名称中包含它的任务集合，用于三个字符以上的子串查询
+    二元组倒排表      二元组（相邻两个字符）-> 名称中包含它的任务集合，用于两个字符的子串查询和模糊查询
+子串查询从最稀有的集合开始：它很大时先按顺序核对一小段，匹配很密集（例如只输入了一个常见的词）时
+核对到足够的结果就停止，否则再与其它集合求交集缩小候选；候选不多时按匹配位置和名称长度完整排序。
+三元组比二元组稀有得多（例如 "9999" 只需要核对包含 "999" 的任务），查询的开销不随任务树的规模增长。
+子串匹配不足时再按二元组重合度做模糊匹配，容忍错别字和漏字。
+
+索引通过 TaskTree 的修改监听器增量维护：添加、重命名、删除只更新相关任务，重置或整体换树时重建。
+建立索引需要遍历整棵树，可以在后台线程中进行（见 ``start()``），期间发生的修改会在建好后补上。
+"""
+
+import bisect
+import heapq
+import itertools
+import threading
+
+MAX_RANKED_CANDIDATES = 500  # 候选不超过这个数量时完整排序，否则找到足够的结果即停止
+DENSE_SCAN = 200  # 候选很多时，先按顺序核对这么多个，够了就不再求交集
+MAX_FUZZY_CANDIDATES = 128  # 模糊匹配最多计算相似度的候选数
+MAX_FUZZY_SAMPLE = 1000  # 模糊匹配最稀有的二元组集合超过这个数量时只取其中一段求交集（开销与候选数成正比）
+FUZZY_THRESHOLD = 0.5  # 模糊匹配至少要包含查询串中这一比例的二元组
+
+
+def normalize(text):
+    return text.casefold()
+
+
+def grams_of(text, size=2):
+    """返回文本中所有相邻 size 个字符组成的集合。"""
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def add_postings(postings, task, grams):
+    for gram in grams:
+        tasks = postings.get(gram)
+        if tasks is None:
+            postings[gram] = {task}
+        else:
+            tasks.add(task)
+
+
+class TaskSearchIndex:
+    def __init__(self, tree):
+        self.tree = tree
+        self.postings = {}  # 二元组 -> 名称中包含它的任务集合
+        self.trigrams = {}  # 三元组 -> 名称中包含它的任务集合
+        self.names = {}  # 任务 -> 规范化后的名称
+        # 按 (名称, id) 排序的 (名称, id, 任务)；id 唯一，比较时不会比较到任务对象
+        self.ordered = []
+        self.root = None
+        self.ready = threading.Event()
+        self._backlog = None  # 后台建立索引期间收到的修改，建好后重放
+        tree.add_listener(self.on_operation)
+
+    def start(self, background=False):
+        """建立索引；background 为 True 时在后台线程中进行，search() 会等待建立完成。
+
+        按需加载的任务树在遍历时会物化节点并修改 id 索引，只能持有 lock 在当前线程中建立；
+        这时 background 为 True 表示推迟到第一次搜索时再建立，以免打开文件时就物化整棵树。
+        """
+        with self.tree.lock:
+            if self.tree.lazy_source is not None:
+                if not background:
+                    self.rebuild()
+                return
+            if not background:
+                self.rebuild()
+                return
+            self._backlog = []
+            root = self.tree.root
+        threading.Thread(target=self._build_in_background, args=(root,), daemon=True).start()
+
+    def _build_in_background(self, root):
+        postings, trigrams, names, ordered = self.build(root)
+        with self.tree.lock:
+            self.postings, self.trigrams, self.names, self.ordered, self.root = postings, trigrams, names, ordered, root
+            backlog, self._backlog = self._backlog, None
+            self.ready.set()
+            for operation, previous in backlog:
+                self.on_operation(operation, previous)
+
+    def build(self, root):
+        """遍历任务树，返回新的 (二元组倒排表, 三元组倒排表, 名称表, 排序列表)（会物化按需加载的子树）。"""
+        postings = {}
+        trigrams = {}
+        names = {}
+        ordered = []
+        stack = [root]
+        while stack:
+            task = stack.pop()
+            name = normalize(task.name)
+            names[task] = name
+            ordered.append((name, task.id, task))
+            add_postings(postings, task, grams_of(name))
+            add_postings(trigrams, task, grams_of(name, 3))
+            stack.extend(task.children)
+        ordered.sort()
+        return postings, trigrams, names, ordered
+
+    def rebuild(self):
+        self.postings, self.trigrams, self.names, self.ordered = self.build(self.tree.root)
+        self.root = self.tree.root
+        self.ready.set()
+
+    def add(self, task):
+        name = normalize(task.name)
+        self.names[task] = name
+        bisect.insort(self.ordered, (name, task.id, task))
+        add_postings(self.postings, task, grams_of(name))
+        add_postings(self.trigrams, task, grams_of(name, 3))
+
+    def discard(self, task):
+        name = self.names.pop(task, None)
+        if name is None:
+            return
+        position = bisect.bisect_left(self.ordered, (name, task.id))
+        if position < len(self.ordered) and self.ordered[position][2] is task:
+            del self.ordered[position]
+        for postings, size in ((self.postings, 2), (self.trigrams, 3)):
+            for gram in grams_of(name, size):
+                tasks = postings.get(gram)
+                if tasks is not None:
+                    tasks.discard(task)
+                    if not tasks:
+                        del postings[gram]
+
+    def on_operation(self, operation, previous):
+        """TaskTree 的修改监听器（调用时持有 tree.lock）。"""
+        if self._backlog is not None:
+            self._backlog.append((operation, previous))
+            return
+        if not self.ready.is_set():
+            return  # 尚未建立索引，建立时会读取最新的任务树
+        op = operation.get("op")
+        if self.tree.root is not self.root or op in ("reset", "import"):
+            self.rebuild()
+        elif op in ("add", "rename"):
+            task = self.tree.get_task(operation["id"])
+            if task is not None:
+                self.discard(task)
+                self.add(task)
+        elif op == "remove" and previous is not None:
+            stack = [previous["task"]]
+            while stack:
+                task = stack.pop()
+                self.discard(task)
+                stack.extend(task.loaded_children())
+
+    def search(self, query, limit=20, fuzzy=True):
+        """按相关度返回名称匹配查询串的任务：前缀匹配优先，其次子串匹配，最后是模糊匹配。"""
+        with self.tree.lock:
+            if not self.ready.is_set() and self._backlog is None:
+                self.rebuild()  # 推迟建立的索引（见 start()）
+        self.ready.wait()
+        with self.tree.lock:
+            if self.tree.root is not self.root:
+                self.rebuild()
+            query = normalize(query.strip())
+            if not query:
+                return []
+            results = self.prefix_search(query, limit)
+            if len(results) < limit and len(query) > 1:
+                results.extend(self.substring_search(query, limit - len(results)))
+            if fuzzy and len(results) < limit and len(query) > 2:
+                results.extend(self.fuzzy_search(query, limit - len(results)))
+            return results
+
+    def prefix_search(self, query, limit):
+        """返回名称以查询串开头的任务（按名称排序）。"""
+        ordered = self.ordered
+        position = bisect.bisect_left(ordered, (query,))
+        results = []
+        while position < len(ordered) and len(results) < limit:
+            name, _, task = ordered[position]
+            if not name.startswith(query):
+                break
+            if task is not self.root:
+                results.append(task)
+            position += 1
+        return results
+
+    def substring_search(self, query, limit):
+        """返回名称在中间位置包含查询串的任务（前缀匹配由 prefix_search 负责）。"""
+        names = self.names
+        root = self.root  # 根节点不是可跳转的任务，与其它两种匹配一样跳过
+        if len(query) > 2:
+            sets = sorted((self.trigrams.get(gram, ()) for gram in grams_of(query, 3)), key=len)
+        else:
+            sets = [self.postings.get(query, ())]
+        candidates = sets[0]
+        if len(candidates) > MAX_RANKED_CANDIDATES:
+            # 匹配很密集时（例如一个常见的词）按顺序核对一小段就能找够
+            results = []
+            for task in itertools.islice(candidates, DENSE_SCAN):
+                if names[task].find(query) > 0 and task is not root:
+                    results.append(task)
+                    if len(results) >= limit:
+                        return results
+            # 否则与其它集合求交集缩小候选（集合运算在 C 中完成，比逐个核对快得多）
+            for tasks in sets[1:]:
+                if len(candidates) <= MAX_RANKED_CANDIDATES:
+                    break
+                candidates = candidates & tasks
+        if len(candidates) <= MAX_RANKED_CANDIDATES:
+            matched = [task for task in candidates if names[task].find(query) > 0 and task is not root]
+            return heapq.nsmallest(limit, matched,
+                                   key=lambda task: (names[task].find(query), len(names[task]), names[task]))
+        results = []
+        for task in candidates:
+            if names[task].find(query) > 0 and task is not root:
+                results.append(task)
+                if len(results) >= limit:
+                    break
+        return results
+
+    def fuzzy_search(self, query, limit):
+        """按查询串二元组的重合比例返回名称相似但不包含查询串的任务。"""
+        query_grams = grams_of(query)
+        # 候选从最稀有的（名称中确实出现过的）二元组集合出发依次求交集；
+        # 最稀有的集合也很大时只取其中一段，不为求交集遍历整个集合
+        sets = sorted((self.postings[gram] for gram in query_grams if gram in self.postings), key=len)
+        if not sets:
+            return []
+        candidates = sets[0]
+        if len(candidates) > MAX_FUZZY_SAMPLE:
+            candidates = set(itertools.islice(candidates, MAX_FUZZY_SAMPLE))
+        for tasks in sets[1:]:
+            # 候选已经不多，继续求交集的开销很小；只要还剩足够的结果就继续缩小到重合更多的名称
+            narrowed = candidates & tasks
+            if len(narrowed) >= limit:
+                candidates = narrowed
+        names = self.names
+        scored = []
+        for task in itertools.islice(candidates, MAX_FUZZY_CANDIDATES):
+            name = names[task]
+            if task is self.root or query in name:
+                continue
+            score = sum(map(name.__contains__, query_grams)) / len(query_grams)
+            if score >= FUZZY_THRESHOLD:
+                scored.append((-score, len(name), name, task))
+        scored.sort(key=lambda item: item[:3])
+        return [item[3] for item in scored[:limit]]
@@ -0,0 +1,772 @@
+"""多台机器之间按操作增量同步任务树（服务器的参考实现见 sync_server.py）。
+
+每次本地修改（添加、重命名、完成、重新打开、移动、删除）都被编上稳定的操作 id 和 Lamport 逻辑时钟，
+追加到 ``<任务树文件>.outbox``；同步时只把 outbox 中尚未上传的操作发给服务器，并取回上次同步之后
+其它机器上传的操作。一次同步的开销只与这期间的修改数量有关，与任务树的规模无关。
+
+操作记录的格式（JSON，每行一条）：
+
+    {"op_id": "<replica>-<clock>", "clock": 逻辑时钟, "replica": 机器 id, "op": 类型, "id": 任务 id, ...字段}
+
+合并规则是确定性的，按 (逻辑时钟, 机器 id) 比较先后，与收到操作的顺序无关：
+
+    重命名、完成状态、所在位置   每个任务的每个字段各自“后写者胜”，较早的修改到达时被忽略
+    删除                         删除优先：被删除的任务上的修改被忽略，添加或移动到被删除任务下的任务随之隐藏；
+                                 只有比删除更晚的重新添加（例如撤销删除）才能恢复它，隐藏的子任务也一起恢复
+    兄弟任务的顺序               每次添加或移动都在本机相邻的两个兄弟任务之间生成一个排序键（见 key_between），
+                                 兄弟任务按排序键排列，随所在位置一起“后写者胜”
+    移动                         按时间戳顺序重新执行，会形成环的移动被跳过
+
+修改只在本机生效的部分不同步：专注任务、归档（每台机器按完成时间自行归档）和整棵树的重置。
+同步状态（机器 id、时钟、已取回的位置、各字段的时间戳和删除标记）以 JSON Lines 追加到 ``<任务树文件>.sync``，
+每次同步只追加有变化的任务，文件中的过期行超过一定数量后整体重写。
+两台机器第一次同步前需要使用同一个任务树文件（根节点相同），之后只交换增量。
+"""
+
+import json
+import os
+import socket
+import threading
+import uuid
+
+SYNCED_OPERATIONS = ("add", "rename", "complete", "reopen", "move", "remove")
+DEFAULT_PORT = 8765
+PULL_LIMIT = 10000  # 每次请求最多取回的操作数，更多时分几次取回
+TIMEOUT = 10.0
+MOVE_LOG_SIZE = 1000  # 记住最近多少次移动，用于按时间戳顺序重新排列并发的移动
+COMPACT_MIN_LINES = 1000  # 状态文件的行数超过有效记录数的两倍加上这个数时整体重写
+KEY_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"  # 排序键使用的字符，按字符串比较时的顺序与这里相同
+
+
+class SyncError(Exception):
+    pass
+
+
+def parse_address(address):
+    """把 "host:port" 或 "host" 解析为 (host, port)。"""
+    if isinstance(address, tuple):
+        return address
+    host, _, port = str(address).rpartition(":")
+    if not host:
+        return port, DEFAULT_PORT
+    return host, int(port)
+
+
+def exchange(address, request, timeout=TIMEOUT):
+    """向同步服务器发送一个请求并返回响应（按行分隔的 JSON，与 task_daemon.py 的协议相同）。"""
+    with socket.create_connection(parse_address(address), timeout=timeout) as connection:
+        connection.sendall(json.dumps(request, ensure_ascii=False).encode() + b"\n")
+        with connection.makefile("rb") as reader:
+            line = reader.readline()
+    if not line:
+        raise SyncError("同步服务器没有返回响应")
+    response = json.loads(line)
+    if not response.get("ok"):
+        raise SyncError(response.get("error", "同步失败"))
+    return response
+
+
+def encode_number(number):
+    """把正整数写成 KEY_DIGITS 中的字符（高位在前）。"""
+    digits = []
+    while number:
+        number, digit = divmod(number, len(KEY_DIGITS))
+        digits.append(KEY_DIGITS[digit])
+    return "".join(reversed(digits))
+
+
+def key_between(low, high):
+    """返回一个排在 low 和 high 之间的排序键，low 为空字符串表示没有下界，high 为 None 表示没有上界。
+
+    排序键可以看作 36 进制小数的各位，按字符串比较；键都不以 "0" 结尾。结果在某一位上严格小于 high，
+    在它后面再追加字符也仍然排在 high 之前。
+    """
+    if high is not None and not low < high:
+        high = None  # 相邻任务的键顺序不对（只有不经过同步的修改才会这样），退化为排在 low 之后
+    key = []
+    position = 0
+    while True:
+        low_digit = KEY_DIGITS.index(low[position]) if position < len(low) else 0
+        high_digit = len(KEY_DIGITS) if high is None else KEY_DIGITS.index(high[position])
+        if high_digit - low_digit > 1:
+            key.append(KEY_DIGITS[(low_digit + high_digit) // 2])
+            return "".join(key)
+        key.append(KEY_DIGITS[low_digit])
+        if high_digit > low_digit:
+            high = None  # 这一位已经小于上界，之后的位不再受限
+        position += 1
+
+
+def initial_key(index):
+    """开始同步之前就已存在的第 index 个子任务的排序键：各台机器的初始任务树相同，得到的键也相同。"""
+    digits = encode_number(index + 1)
+    return KEY_DIGITS[len(digits)] + digits + "1"  # 位数在前，位数多的排在后面；结尾的 1 使键不以 0 结尾
+
+
+class MoveRecord:
+    """一次移动及撤销它所需的原位置（见 TaskSync.merge_move）。"""
+
+    __slots__ = ("stamp", "task_id", "parent_id", "key", "applied", "from_parent_id", "from_key", "from_placed")
+
+    def __init__(self, stamp, task_id, parent_id, key):
+        self.stamp = stamp
+        self.task_id = task_id
+        self.parent_id = parent_id
+        self.key = key  # 在新的兄弟任务中的排序键
+        self.applied = False
+        self.from_parent_id = None
+        self.from_key = None
+        self.from_placed = None
+
+
+class TaskSync:
+    def __init__(self, tree, filename, server=None, interval=60.0, debounce=1.0):
+        self.tree = tree
+        self.filename = filename  # 同步状态；待上传的操作在 filename 去掉 .sync 之后加 .outbox
+        self.outbox_filename = os.path.splitext(filename)[0] + ".outbox"
+        self.server = server
+        self.interval = interval
+        self.debounce = debounce
+        self.replica = None
+        self.clock = 0
+        self.root_id = None  # 同步状态所属的任务树（根节点 id），树被整体替换后状态作废
+        self.cursor = 0  # 已经取回的服务器操作序号
+        self.stamps = {}  # 任务 id -> {字段: (时钟, 机器 id)}，字段为 created、name、completed、parent
+        self.tombstones = {}  # 被删除的任务 id -> 删除操作的 (时钟, 机器 id)
+        self.buried = {}  # 祖先被删除而隐藏的任务 id -> {"parent_id", "name", "completed_at"}
+        self._buried_children = {}  # 父任务 id -> 其下隐藏的任务 id 集合
+        self.last_values = {}  # 被删除的任务 id -> 最后的 {"parent_id", "name", "completed_at"}，重新添加和检查环时使用
+        self.keys = {}  # 任务 id -> 在兄弟任务中的排序键（见 key_between），随所在位置一起更新
+        self._changed_ids = set()  # 时间戳或删除标记有变化、尚未写入状态文件的任务
+        self._state_lines = 0  # 状态文件当前的行数
+        self.outbox = []  # 尚未上传的本地操作
+        self.moves = []  # 最近的移动（MoveRecord），按时间戳排列
+        self._moves_trimmed = False  # 是否丢弃过更早的移动记录
+        self._applying = False  # 正在应用取回的操作，期间产生的修改不再上传
+        self._closed = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._sync_lock = threading.Lock()  # 同一时刻只进行一次同步
+        self._outbox_file = open(self.outbox_filename, "a", encoding="utf-8")
+        self.load()
+        tree.add_listener(self.on_operation)
+
+    # ---- 状态 ----
+
+    def load(self):
+        """读取状态文件：每行是一条状态（机器 id、时钟、位置）或一个任务的时间戳，后出现的覆盖先出现的。"""
+        state = {}
+        try:
+            with open(self.filename, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # 崩溃时残留的半行
+                    self._state_lines += 1
+                    if "id" not in record:
+                        state = record
+                    elif "tombstone" in record:
+                        self.tombstones[record["id"]] = tuple(record["tombstone"])
+                    else:
+                        self.stamps[record["id"]] = {field: tuple(stamp) for field, stamp in record["stamps"].items()}
+                        if "buried" in record:
+                            entry = record["buried"]
+                            self.bury(record["id"], entry["parent_id"], entry["name"], entry["completed_at"])
+                        else:
+                            self.unbury(record["id"])
+                        if "values" in record:
+                            self.last_values[record["id"]] = record["values"]
+                        else:
+                            self.last_values.pop(record["id"], None)
+                        if "key" in record:
+                            self.keys[record["id"]] = record["key"]
+                        else:
+                            self.keys.pop(record["id"], None)
+        except FileNotFoundError:
+            pass
+        self._changed_ids.clear()
+        self.replica = state.get("replica") or uuid.uuid4().hex[:12]
+        self.clock = state.get("clock", 0)
+        self.root_id = state.get("root_id", self.tree.root.id)
+        self.cursor = state.get("cursor", 0)
+        # 上次退出前尚未上传的操作：时间戳可能还没有写入状态文件，重新登记一遍
+        try:
+            with open(self.outbox_filename, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # 崩溃时残留的半行
+                    self.outbox.append(record)
+                    self.clock = max(self.clock, record["clock"])
+                    self.stamp_local(record, (record["clock"], record["replica"]))
+        except FileNotFoundError:
+            pass
+        if self.root_id != self.tree.root.id:
+            self.reset_state()
+
+    def state_lines(self, task_ids):
+        for task_id in task_ids:
+            if task_id in self.stamps or task_id in self.buried or task_id in self.last_values or task_id in self.keys:
+                line = {"id": task_id, "stamps": self.stamps.get(task_id, {})}
+                if task_id in self.buried:
+                    line["buried"] = self.buried[task_id]
+                if task_id in self.last_values:
+                    line["values"] = self.last_values[task_id]
+                if task_id in self.keys:
+                    line["key"] = self.keys[task_id]
+                yield line
+            if task_id in self.tombstones:
+                yield {"id": task_id, "tombstone": self.tombstones.get(task_id)}
+        yield {"replica": self.replica, "clock": self.clock, "root_id": self.root_id, "cursor": self.cursor}
+
+    def save(self):
+        """追加有变化的时间戳和最新的状态；过期的行太多时整体重写（先写临时文件再原子替换）。"""
+        live = len(self.stamps) + len(self.tombstones) + len(self.buried) + len(self.last_values) + len(self.keys)
+        if self._state_lines + len(self._changed_ids) > 2 * live + COMPACT_MIN_LINES:
+            self._changed_ids.clear()
+            lines = list(self.state_lines(set(self.stamps) | set(self.tombstones) | set(self.buried) |
+                                          set(self.last_values) | set(self.keys)))
+            temp_filename = self.filename + ".tmp"
+            with open(temp_filename, "w", encoding="utf-8") as file:
+                file.write("".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines))
+            os.replace(temp_filename, self.filename)
+            self._state_lines = len(lines)
+            return
+        lines = list(self.state_lines(self._changed_ids))
+        self._changed_ids.clear()
+        with open(self.filename, "a", encoding="utf-8") as file:
+            file.write("".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines))
+        self._state_lines += len(lines)
+
+    def set_stamp(self, task_id, field, stamp):
+        self.stamps.setdefault(task_id, {})[field] = stamp
+        self._changed_ids.add(task_id)
+
+    def set_key(self, task_id, key):
+        if key is None:
+            self.keys.pop(task_id, None)
+        else:
+            self.keys[task_id] = key
+        self._changed_ids.add(task_id)
+
+    def set_tombstone(self, task_id, stamp):
+        """记下任务被删除（只保留最晚的一次删除）。"""
+        if task_id not in self.tombstones or stamp > self.tombstones[task_id]:
+            self.tombstones[task_id] = stamp
+            self._changed_ids.add(task_id)
+
+    def bury(self, task_id, parent_id, name, completed_at):
+        """隐藏一个本身没有被删除、但祖先被删除了的任务，祖先恢复时再放回去。"""
+        self.unbury(task_id)
+        self.last_values.pop(task_id, None)
+        self.buried[task_id] = {"parent_id": parent_id, "name": name, "completed_at": completed_at}
+        self._buried_children.setdefault(parent_id, set()).add(task_id)
+        self._changed_ids.add(task_id)
+
+    def unbury(self, task_id):
+        """取消隐藏，返回隐藏时记下的内容（没有隐藏时返回 None）。"""
+        entry = self.buried.pop(task_id, None)
+        if entry is not None:
+            siblings = self._buried_children[entry["parent_id"]]
+            siblings.discard(task_id)
+            if not siblings:
+                del self._buried_children[entry["parent_id"]]
+            self.stamps.setdefault(task_id, {})  # 保证状态文件中有一行覆盖之前的隐藏记录
+            self._changed_ids.add(task_id)
+        return entry
+
+    def bury_subtree(self, task):
+        """子树被删除后隐藏其中的后代：其它机器可能并发地恢复子树的根，它们要随之恢复。"""
+        self.ensure_keys(task)
+        stack = [(task, child) for child in task.children]
+        while stack:
+            parent, node = stack.pop()
+            self.ensure_keys(node)
+            self.bury(node.id, parent.id, node.name, node.completed_at)
+            stack.extend((node, child) for child in node.children)
+
+    def write_outbox(self):
+        """用内存中尚未上传的操作重写 outbox 文件。"""
+        self._outbox_file.seek(0)
+        self._outbox_file.truncate()
+        self._outbox_file.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in self.outbox))
+        self._outbox_file.flush()
+
+    def reset_state(self):
+        """任务树被整体替换（重置或换成另一棵树）后，之前的同步状态不再适用。"""
+        self.root_id = self.tree.root.id
+        self.cursor = 0
+        self.stamps = {}
+        self.tombstones = {}
+        self.buried = {}
+        self._buried_children = {}
+        self.last_values = {}
+        self.keys = {}
+        self._changed_ids.clear()
+        self._state_lines = 2 * COMPACT_MIN_LINES  # 下次保存时整体重写，丢弃旧树的时间戳
+        self.outbox = []
+        self.write_outbox()
+
+    # ---- 记录本地修改 ----
+
+    def on_operation(self, operation, previous):
+        """TaskTree 的修改监听器：给本地修改编号并追加到 outbox。"""
+        op = operation.get("op")
+        if op in ("reset", "import"):
+            self.reset_state()
+            return
+        if op in ("move", "remove") and previous is not None and not operation.get("external"):
+            # 兄弟任务第一次发生变化之前按原来的顺序编上排序键（合并时在应用之前就已编好）
+            parent = self.tree.get_task(previous["parent_id"])
+            if parent is not None:
+                task = previous["task"] if op == "remove" else self.tree.get_task(operation["id"])
+                self.ensure_keys(parent, restore=(task, previous["index"]))
+        if op == "remove" and previous is not None and not operation.get("archived") \
+                and (self._applying or not operation.get("external")):
+            task = previous["task"]
+            self.last_values[task.id] = {"parent_id": previous["parent_id"], "name": task.name,
+                                         "completed_at": task.completed_at}
+            self._changed_ids.add(task.id)
+            self.bury_subtree(task)
+        if self._applying or operation.get("external") or op not in SYNCED_OPERATIONS:
+            return
+        task = self.tree.get_task(operation["id"])
+        # 添加只在确实创建了任务时才是一次修改（添加已经存在的任务时 previous 不是 None，见 apply_operation）
+        changed = task is not None and previous is None if op == "add" else previous is not None
+        if not changed:
+            return  # 没有修改任何任务，例如撤销对已被其它机器删除或恢复的任务的修改
+        if op == "remove" and operation.get("archived"):
+            return  # 归档由每台机器各自进行
+        if op == "add":
+            self.unbury(operation["id"])  # 撤销删除时重新添加的任务
+            if self.last_values.pop(operation["id"], None) is not None:
+                self._changed_ids.add(operation["id"])
+        # 记录的内容取自修改后的任务本身而不是 operation，其它机器得到的与本机显示的一致
+        record = {"op": op, "id": operation["id"]}
+        from_key = self.keys.get(operation["id"])
+        self.clock += 1
+        if op in ("add", "move"):
+            # 在本机相邻的两个兄弟任务之间生成排序键，其它机器按键排列，下标在各台机器上含义不同
+            parent = task.parent
+            self.ensure_keys(parent, skip=task)
+            index = parent.children.index(task)
+            low = self.keys.get(parent.children[index - 1].id, "") if index else ""
+            high = self.keys.get(parent.children[index + 1].id) if index + 1 < len(parent.children) else None
+            record["parent_id"] = parent.id
+            record["key"] = self.new_key(low, high)
+        if op in ("add", "rename"):
+            record["name"] = task.name
+        if op == "add" and task.completed_at is not None:
+            record["completed_at"] = task.completed_at
+        elif op in ("complete", "reopen"):
+            record["at"] = task.completed_at
+        record.update(op_id=f"{self.replica}-{self.clock}", clock=self.clock, replica=self.replica)
+        if op == "move":
+            move = MoveRecord((self.clock, self.replica), record["id"], record["parent_id"], record["key"])
+            move.applied = True
+            move.from_parent_id, move.from_key = previous["parent_id"], from_key
+            move.from_placed = self.stamps.get(record["id"], {}).get("parent")
+            self.remember_move(move)
+        self.stamp_local(record, (self.clock, self.replica))
+        self.outbox.append(record)
+        self._outbox_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._outbox_file.flush()
+        self._wake.set()
+
+    def stamp_local(self, record, stamp):
+        op = record["op"]
+        if op == "remove":
+            self.set_tombstone(record["id"], stamp)
+            return
+        fields = {"add": ("created", "name", "completed"), "rename": ("name",), "complete": ("completed",),
+                  "reopen": ("completed",), "move": ("parent",)}[op]
+        for field in fields:
+            self.set_stamp(record["id"], field, stamp)
+        if "key" in record:
+            self.set_key(record["id"], record["key"])
+
+    def new_key(self, low, high):
+        """在 low 和 high 之间生成一个新的排序键。
+
+        末尾加上机器 id 和时钟（低位在前，最后一位不是 0），两台机器同时在相同的位置插入时键也不会相同。
+        """
+        replica = "".join(char for char in self.replica.lower() if char in KEY_DIGITS)
+        return key_between(low, high) + replica + encode_number(self.clock)[::-1]
+
+    # ---- 同步 ----
+
+    def sync(self, server=None):
+        """上传尚未上传的操作并合并其它机器的修改，返回 (上传数, 合并数)。
+
+        网络通信在锁外进行；无法连接服务器时抛出 OSError，服务器拒绝时抛出 SyncError。
+        """
+        server = server or self.server
+        if server is None:
+            raise SyncError("没有设置同步服务器")
+        with self._sync_lock:
+            pushed, merged = self._sync(server)
+        if pushed or merged:
+            print(f"同步完成：上传 {pushed} 条修改，合并 {merged} 条其它机器的修改。")
+        return pushed, merged
+
+    def _sync(self, server):
+        tree = self.tree
+        pushed = merged = 0
+        while True:
+            with tree.lock:
+                if self.root_id != tree.root.id:
+                    self.reset_state()
+                pending = list(self.outbox)
+                request = {"cmd": "sync", "tree": self.root_id, "replica": self.replica, "since": self.cursor,
+                           "ops": pending, "limit": PULL_LIMIT}
+            response = exchange(server, request)
+            with tree.lock:
+                if self.root_id != request["tree"]:
+                    continue  # 通信期间任务树被替换了，按新的树重新同步
+                with tree.batch():
+                    merged += self.merge(response["ops"])
+                del self.outbox[:len(pending)]  # 通信期间新增的操作留到下一次上传
+                self.cursor = response["seq"]
+                self.save()
+                if pending:
+                    self.write_outbox()
+            pushed += len(pending)
+            if not response.get("more"):
+                return pushed, merged
+
+    def start(self):
+        """启动后台同步线程：每 interval 秒同步一次，本地有修改时在 debounce 秒后提前同步。"""
+        if self._thread is None and self.server is not None:
+            self._thread = threading.Thread(target=self._run, name="TaskSync", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._wake.clear()  # 同步期间的修改和 close() 会再次唤醒
+            try:
+                self.sync()
+            except (OSError, ValueError, SyncError) as error:
+                print(f"与同步服务器 {self.server} 同步失败：{error}")
+            if self._wake.wait(self.interval) and not self._closed.is_set():
+                self._closed.wait(self.debounce)  # 合并短时间内的连续修改
+
+    def close(self):
+        """停止后台同步（尚未上传的操作保留在 outbox 中，下次启动后上传）。"""
+        self._closed.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if not self._outbox_file.closed:
+            with self.tree.lock:
+                self.save()
+                self._outbox_file.close()
+            self.tree.remove_listener(self.on_operation)
+
+    # ---- 合并 ----
+
+    def merge(self, records):
+        """按规则应用其它机器的操作（调用方持有 tree.lock），返回实际生效的操作数。"""
+        merged = 0
+        self._applying = True
+        try:
+            # 本机撤销删除后，恢复子树中由其它机器添加、本机隐藏起来的任务
+            for parent_id in list(self._buried_children):
+                parent = self.tree.get_task(parent_id)
+                if parent is not None:
+                    merged += self.revive(parent)
+            for record in records:
+                try:
+                    stamp = (record["clock"], record["replica"])
+                    self.clock = max(self.clock, record["clock"])
+                    merged += self.merge_record(record, stamp)
+                except (KeyError, TypeError, ValueError) as error:
+                    print(f"同步服务器返回的操作 {record!r} 不合法（{error!r}），已跳过。")
+        finally:
+            self._applying = False
+        return merged
+
+    def newer(self, task_id, field, stamp):
+        """stamp 是否比任务该字段上次修改的时间戳更晚（没有记录时总是更晚）。"""
+        current = self.stamps.get(task_id, {}).get(field)
+        return current is None or stamp > current
+
+    def merge_record(self, record, stamp):
+        tree = self.tree
+        op = record["op"]
+        task_id = record["id"]
+        task = tree.get_task(task_id)
+        if task is not None and task.parent is None:
+            return 0  # 根节点
+        entry = self.buried.get(task_id)
+        # 任务是否存在也是“后写者胜”：比较最晚的添加和最晚的删除
+        if op == "add":
+            placed = self.placed(task_id)
+            if self.newer(task_id, "created", stamp):
+                self.set_stamp(task_id, "created", stamp)
+            tombstone = self.tombstones.get(task_id)
+            if tombstone is not None and tombstone > stamp:
+                return 0
+            # 添加同时写入了名称和完成状态，已经存在的任务（例如两台机器都撤销了删除）取较晚的
+            merged = 0
+            if self.newer(task_id, "name", stamp):
+                self.set_stamp(task_id, "name", stamp)
+                merged += self.set_name(task_id, str(record["name"]))
+            if self.newer(task_id, "completed", stamp):
+                self.set_stamp(task_id, "completed", stamp)
+                merged += self.set_completed(task_id, record.get("completed_at"))
+            if task is not None or entry is not None:
+                # 比最近一次添加或移动更晚的重新添加决定任务的位置
+                if (placed is None or stamp > placed) and not self.creates_cycle(task_id, record["parent_id"]):
+                    self.set_key(task_id, str(record["key"]))
+                    merged += self.relocate(task_id, record["parent_id"])
+                return merged
+            # 删除前（或删除之后收到）的更晚的名称和完成状态优先
+            values = self.last_values.pop(task_id, {})
+            entry = {"name": values.get("name", str(record["name"])),
+                     "completed_at": values.get("completed_at", record.get("completed_at"))}
+            self._changed_ids.add(task_id)
+            parent_id = record["parent_id"]
+            if placed is not None and placed > stamp and values.get("parent_id") is not None:
+                parent_id = values["parent_id"]  # 删除后收到了更晚的移动，排序键也是那次移动的
+            else:
+                self.set_key(task_id, str(record["key"]))
+            parent = tree.get_task(parent_id)
+            if parent is None:
+                self.bury(task_id, parent_id, entry["name"], entry["completed_at"])
+                return 0
+            return self.attach(task_id, parent, entry)
+        if op == "remove":
+            self.set_tombstone(task_id, stamp)
+            created = self.stamps.get(task_id, {}).get("created")
+            if created is not None and created > stamp:
+                return 0  # 删除之后又被重新添加过
+            if entry is not None:
+                self.unbury(task_id)  # 隐藏的后代仍然隐藏，直到它被重新添加
+                self.last_values[task_id] = entry
+                return 0
+            if task is None:
+                return 0
+            self.ensure_keys(task.parent)
+            return self.apply({"op": "remove", "id": task_id})
+        if op == "rename" and self.newer(task_id, "name", stamp):
+            self.set_stamp(task_id, "name", stamp)
+            return self.set_name(task_id, str(record["name"]))
+        if op in ("complete", "reopen") and self.newer(task_id, "completed", stamp):
+            self.set_stamp(task_id, "completed", stamp)
+            return self.set_completed(task_id, record.get("at"))
+        if op == "move":
+            return self.merge_move(MoveRecord(stamp, task_id, record["parent_id"], str(record["key"])))
+        return 0
+
+    def set_name(self, task_id, name):
+        """修改任务的名称；隐藏或已删除的任务只记下来，恢复时使用。"""
+        task = self.tree.get_task(task_id)
+        if task is None:
+            (self.buried.get(task_id) or self.last_values.setdefault(task_id, {}))["name"] = name
+            self._changed_ids.add(task_id)
+            return 0
+        if task.name == name:
+            return 0
+        return self.apply({"op": "rename", "id": task_id, "name": name})
+
+    def set_completed(self, task_id, completed_at):
+        task = self.tree.get_task(task_id)
+        if task is None:
+            (self.buried.get(task_id) or self.last_values.setdefault(task_id, {}))["completed_at"] = completed_at
+            self._changed_ids.add(task_id)
+            return 0
+        if task.completed_at == completed_at:
+            return 0
+        return self.apply({"op": "reopen" if completed_at is None else "complete", "id": task_id, "at": completed_at})
+
+    def merge_move(self, move):
+        """按时间戳顺序应用移动：先撤销本机已应用的更晚的移动，应用这次移动，再重做它们。
+
+        形成环的移动被跳过。这样无论收到的顺序如何，结果都与按时间戳依次执行相同，
+        两台机器同时把两个任务互相移到对方下面时也能得到一致的结果。
+        """
+        moves = self.moves
+        position = len(moves)
+        while position > 0 and moves[position - 1].stamp > move.stamp:
+            position -= 1
+        if position == 0 and self._moves_trimmed:
+            # 比记录中最早的移动还早（记录已被截断）：只在比任务现在的位置更新时应用
+            placed = self.placed(move.task_id)
+            if placed is not None and placed > move.stamp:
+                return 0
+        later = moves[position:]
+        del moves[position:]
+        for entry in reversed(later):
+            self.undo_move(entry)
+        merged = self.do_move(move)
+        self.remember_move(move)
+        for entry in later:
+            self.do_move(entry)
+            self.remember_move(entry)
+        return merged
+
+    def remember_move(self, move):
+        self.moves.append(move)
+        if len(self.moves) > MOVE_LOG_SIZE:
+            del self.moves[:len(self.moves) - MOVE_LOG_SIZE]
+            self._moves_trimmed = True
+
+    def do_move(self, move):
+        move.applied = False
+        from_parent_id = self.parent_id_of(move.task_id)
+        if from_parent_id is None or self.superseded(move) or self.creates_cycle(move.task_id, move.parent_id):
+            return 0  # 未知的任务（或是根节点）、之后又被重新添加过，或者会形成环
+        task = self.tree.get_task(move.task_id)
+        if task is not None:
+            self.ensure_keys(task.parent)
+        move.from_parent_id = from_parent_id
+        move.from_key = self.keys.get(move.task_id)
+        move.from_placed = self.stamps.get(move.task_id, {}).get("parent")
+        move.applied = True
+        self.set_stamp(move.task_id, "parent", move.stamp)
+        self.set_key(move.task_id, move.key)
+        return self.relocate(move.task_id, move.parent_id)
+
+    def undo_move(self, move):
+        if not move.applied or self.superseded(move):
+            return
+        if move.from_placed is None:
+            self.stamps.get(move.task_id, {}).pop("parent", None)
+            self._changed_ids.add(move.task_id)
+        else:
+            self.set_stamp(move.task_id, "parent", move.from_placed)
+        self.set_key(move.task_id, move.from_key)
+        self.relocate(move.task_id, move.from_parent_id)
+
+    def superseded(self, move):
+        """任务在这次移动之后被重新添加过（例如撤销删除），位置以添加为准。"""
+        created = self.stamps.get(move.task_id, {}).get("created")
+        return created is not None and created > move.stamp
+
+    def creates_cycle(self, task_id, parent_id):
+        while parent_id is not None:
+            if parent_id == task_id:
+                return True
+            parent_id = self.parent_id_of(parent_id)
+        return False
+
+    def parent_id_of(self, task_id):
+        """任务的父任务 id，隐藏和已删除的任务返回最后所在的父任务，根节点和未知的任务返回 None。
+
+        已删除的任务也保留父任务，检查环时各台机器看到的祖先相同，与删除和移动到达的先后无关。
+        """
+        task = self.tree.get_task(task_id)
+        if task is not None:
+            return task.parent.id if task.parent is not None else None
+        entry = self.buried.get(task_id) or self.last_values.get(task_id)
+        return entry.get("parent_id") if entry is not None else None
+
+    def relocate(self, task_id, parent_id):
+        """把任务按排序键放到 parent_id 下；父任务被删除或隐藏时任务随之隐藏。"""
+        tree = self.tree
+        task = tree.get_task(task_id)
+        parent = tree.get_task(parent_id)
+        if task is not None:
+            self.ensure_keys(task.parent)  # 从原来的兄弟任务中移走之前
+        if task is not None and parent is not None:
+            index = self.position(parent, task_id)
+            if task.parent is parent and parent.children.index(task) == index:
+                return 0
+            return self.apply({"op": "move", "id": task_id, "parent_id": parent_id, "index": index})
+        if task is not None:
+            name, completed_at = task.name, task.completed_at
+            merged = self.apply({"op": "remove", "id": task_id})  # 监听器隐藏它的后代
+            self.bury(task_id, parent_id, name, completed_at)
+            return merged
+        entry = self.buried.get(task_id)
+        if entry is None:
+            if task_id in self.last_values:
+                self.last_values[task_id]["parent_id"] = parent_id  # 已删除的任务只记下位置
+                self._changed_ids.add(task_id)
+            return 0
+        if parent is None:
+            self.bury(task_id, parent_id, entry["name"], entry["completed_at"])
+            return 0
+        self.unbury(task_id)
+        return self.attach(task_id, parent, entry)
+
+    def attach(self, task_id, parent, entry):
+        """把任务添加到 parent 下，再恢复它下面隐藏的后代。"""
+        operation = {"op": "add", "id": task_id, "parent_id": parent.id, "name": entry["name"],
+                     "index": self.position(parent, task_id)}
+        if entry.get("completed_at") is not None:
+            operation["completed_at"] = entry["completed_at"]
+        merged = self.apply(operation)
+        return merged + self.revive(self.tree.get_task(task_id))
+
+    def revive(self, task):
+        """恢复 task 下隐藏的后代，按排序键放回去。"""
+        merged = 0
+        stack = [task]
+        while stack:
+            parent = stack.pop()
+            for task_id in sorted(self._buried_children.get(parent.id, ()), key=self.order):
+                entry = self.unbury(task_id)
+                operation = {"op": "add", "id": task_id, "parent_id": parent.id, "name": entry["name"],
+                             "index": self.position(parent, task_id)}
+                if entry["completed_at"] is not None:
+                    operation["completed_at"] = entry["completed_at"]
+                merged += self.apply(operation)
+                stack.append(self.tree.get_task(task_id))
+        return merged
+
+    def placed(self, task_id):
+        """任务被放到现在的位置（添加或最近一次移动）的时间戳，没有记录时返回 None。"""
+        stamps = self.stamps.get(task_id)
+        if not stamps:
+            return None
+        return max(stamps.get("created", ()), stamps.get("parent", ())) or None
+
+    def order(self, task_id):
+        """兄弟任务按 (排序键, id) 排列：两台机器同时生成了相同的键时也有确定的顺序。"""
+        return self.keys.get(task_id, ""), task_id
+
+    def position(self, parent, task_id):
+        """任务按排序键在 parent 的其它子任务中的位置。"""
+        self.ensure_keys(parent)
+        order = self.order(task_id)
+        return sum(1 for child in parent.children if child.id != task_id and self.order(child.id) < order)
+
+    def ensure_keys(self, parent, skip=None, restore=None):
+        """给开始同步之前就已存在、还没有排序键的子任务按现在的顺序编上键（见 initial_key）。
+
+        在子任务第一次发生变化之前调用，各台机器上编出的键相同。本地修改在应用之后才通知监听器：
+        skip 是刚放进来的任务，restore 为 (任务, 下标) 时先把刚移走的任务放回原位。
+        """
+        keys = self.keys
+        if all(child.id in keys for child in parent.children if child is not skip) and \
+                (restore is None or restore[0].id in keys):
+            return
+        children = [child for child in parent.children if child is not skip and
+                    (restore is None or child is not restore[0])]
+        if restore is not None:
+            children.insert(min(restore[1], len(children)), restore[0])
+        if not any(child.id in keys for child in children):
+            for index, child in enumerate(children):
+                self.set_key(child.id, initial_key(index))
+            return
+        # 不经过同步的修改（例如同一个文件的另一个实例）留下的没有键的任务：按本机的位置补上
+        for index, child in enumerate(children):
+            if child.id not in keys:
+                low = keys[children[index - 1].id] if index else ""
+                high = next((keys[sibling.id] for sibling in children[index + 1:] if sibling.id in keys), None)
+                self.set_key(child.id, self.new_key(low, high))
+
+    def apply(self, operation):
+        """应用并持久化一条来自其它机器的修改；本机的专注任务保持不变（除非它被删除）。"""
+        tree = self.tree
+        current_task = tree.current_task
+        operation["external"] = True
+        tree.record_operation(operation, tree.apply_operation(operation))
+        if tree.current_task is not current_task and tree.tasks.get(current_task.id) is current_task:
+            focus = {"op": "focus", "id": current_task.id, "external": True}
+            tree.record_operation(focus, tree.apply_operation(focus))
+        return 1
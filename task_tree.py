@@ -1,35 +1,162 @@
 import uuid
-import json
-import os
+import contextlib
+import sys
+import threading
+import time
+import instrumentation
+from focus_time import FocusTimeLog
+from task_archive import TaskArchive
+from task_history import TaskHistory
+from task_search import TaskSearchIndex
+from task_validation import node_children, node_problem, quarantine_record
+from write_behind import WriteBehindWriter
+
+NO_CHILDREN = ()  # 所有叶子节点共享的空子节点序列，第一次挂子节点时才分配列表
+
 
 class Task:
-    def __init__(self, name, id=None, parent_id=None):
+    # 使用 __slots__ 去掉每个实例的 __dict__，叶子节点共享空子节点序列，大量同名任务共享驻留的名称。
+    # 省下的内存大约被 TaskTree 的 id 索引抵消：名称互不相同时总占用与旧表示相当（见 benchmarks/task_memory.py）
+    __slots__ = ("id", "name", "parent", "children", "completed_at")
+
+    def __init__(self, name, id=None, parent_id=None, completed_at=None):
+        # parent_id 由父节点引用推导，不再单独保存；参数仅为兼容旧的调用方式而保留
         self.id = id if id is not None else str(uuid.uuid4())  # Use provided ID or generate a new one
-        self.name = name
-        self.parent_id = parent_id  # Parent node ID
-        self.children = []  # List of child nodes
+        self.name = sys.intern(name)  # 驻留任务名称，大量同名任务（如“新任务”）共享同一个字符串
+        self.parent = None  # 父节点引用，由 TaskTree 维护
+        self.children = NO_CHILDREN  # List of child nodes；请通过 TaskTree.attach_task 添加子节点
+        self.completed_at = completed_at  # 完成时间（Unix 时间戳），未完成时为 None
+
+    @property
+    def completed(self):
+        return self.completed_at is not None
+
+    @property
+    def parent_id(self):
+        """父节点 id，由父节点引用推导。"""
+        return self.parent.id if self.parent is not None else None
+
+    def loaded_children(self):
+        """返回已经在内存中的子节点（按需加载的节点会返回空序列而不触发加载）。"""
+        return self.children
+
+    def may_have_children(self):
+        """是否可能有子节点（按需加载的节点在不触发加载的情况下做保守判断）。"""
+        return bool(self.children)
 
     def to_dict(self):
-        """将任务节点转为字典格式，便于保存到 JSON 文件。"""
-        return {
-            "id": self.id,
-            "name": self.name,
-            "parent_id": self.parent_id,
-            "children": [child.to_dict() for child in self.children]
-        }
+        """将任务节点转为字典格式，便于保存到 JSON 文件（迭代实现，不受递归深度限制）。"""
+        result = {"id": self.id, "name": self.name, "parent_id": self.parent_id, "children": []}
+        if self.completed_at is not None:
+            result["completed_at"] = self.completed_at
+        stack = [(self, result)]
+        while stack:
+            node, data = stack.pop()
+            for child in node.children:
+                child_data = {"id": child.id, "name": child.name, "parent_id": node.id, "children": []}
+                if child.completed_at is not None:
+                    child_data["completed_at"] = child.completed_at
+                data["children"].append(child_data)
+                stack.append((child, child_data))
+        return result
+
     def print(self, level=0):
-        """递归打印任务树，用于调试输出。"""
-        indent = "    " * int(level)
-        print(f"{indent}- {self.name} (ID: {self.id})")
-        for child in self.children:
-            child.print(level + 1) 
+        """打印任务树，用于调试输出。"""
+        stack = [(self, int(level))]
+        while stack:
+            node, depth = stack.pop()
+            print(f"{'    ' * depth}- {node.name} (ID: {node.id})")
+            stack.extend((child, depth + 1) for child in reversed(node.children))
+
+class LazyTask(Task):
+    """子节点按需加载的任务节点。
+
+    source 为提供子节点的数据源（二进制快照或 SQLite 存储），需实现 ``load_children(task)``；
+    key 是节点在数据源中的定位信息（例如快照中的偏移）。首次访问 children 时才加载。
+    """
+    __slots__ = ("_source", "_key")
+
+    def __init__(self, name, id=None, source=None, key=None, completed_at=None):
+        super().__init__(name, id, completed_at=completed_at)
+        self._source = source
+        self._key = key
+
+    @property
+    def children(self):
+        source = self._source
+        if source is not None:
+            self._source = None
+            _children_slot.__set__(self, source.load_children(self))
+        return _children_slot.__get__(self)
+
+    @children.setter
+    def children(self, value):
+        self._source = None
+        _children_slot.__set__(self, value)
+
+    def loaded_children(self):
+        return NO_CHILDREN if self._source is not None else _children_slot.__get__(self)
+
+    def may_have_children(self):
+        return self._source is not None or bool(_children_slot.__get__(self))
+
+
+_children_slot = Task.__dict__["children"]  # Task.children 的 slot 描述符，LazyTask 通过它读写真正的子节点列表
+
 
 class TaskTree:
-    def __init__(self, filename="task_tree.json"):
+    def __init__(self, filename="task_tree.json", journal=False, journal_threshold=256 * 1024, write_delay=None,
+                 storage=None, history_depth=0, history_memory=32 * 1024 * 1024, watch=False, archive_after_days=None,
+                 track_focus=False, sync_server=None, sync_interval=60.0):
         self.filename = filename
-        self.root = self.create_root_node()
-        self.current_task = self.root
+        # 存储后端（见 storage.py）：.db/.sqlite 文件使用 SQLite，其余使用 JSON 快照；
+        # 日志模式下 JSON 后端每次修改只追加一条记录到 <filename>.journal，达到阈值后压缩为新快照
+        if storage is None:
+            from storage import JsonStorage, SqliteStorage
+
+            if filename.endswith((".db", ".sqlite", ".sqlite3")):
+                storage = SqliteStorage(filename)
+            else:
+                storage = JsonStorage(filename, journal, journal_threshold)
+        self.storage = storage
+        self.lock = threading.RLock()  # 保护内存中的任务树，后台写入线程序列化时也会持有
+        self._io_lock = threading.Lock()  # 保证同一时刻只有一次磁盘写入
+        self._pending_operations = []  # 尚未交给存储后端写出的操作记录
+        self._batch_depth = 0  # batch() 的嵌套层数，大于 0 时修改只登记不保存
+        self._batch_counter = 0
+        self.batch_id = None  # 当前批次的编号，不在批次中时为 None（撤销历史据此把一个批次合并为一步）
+        self.writer = None
+        self.tasks = {}  # id -> Task 索引，随增删节点同步维护
+        self.lazy_source = None  # 二进制快照：尚未物化的节点从这里按需读取
+        self.listeners = []  # 每次修改后调用 listener(operation, previous)
+        self.search_index = None  # 第一次搜索时建立，之后随修改增量维护
+        # 快照文件可能同时被其它实例使用：JSON 后端加载时创建，负责文件锁和外部修改的合并（见 shared_file.py）
+        self.shared_file = None
+        # 已完成很久的子树移到旁边的归档目录中（见 task_archive.py），归档的任务仍可搜索和恢复
+        self.archive = TaskArchive(filename + ".archive")
+        self.set_root(self.create_root_node())
         self.load_from_file()
+        # sync_server 为 "主机:端口" 时与其它机器按操作增量同步（见 task_sync.py）；
+        # 在归档之前创建，归档时兄弟任务的排序键按归档前的顺序编号
+        self.sync = None
+        if sync_server is not None:
+            from task_sync import TaskSync
+
+            self.sync = TaskSync(self, filename + ".sync", sync_server, sync_interval)
+        if archive_after_days is not None:
+            self.archive_completed(archive_after_days)
+        # history_depth 大于 0 时记录撤销/重做历史（在加载之后创建，加载和重放日志不计入历史）
+        self.history = TaskHistory(self, history_depth, history_memory) if history_depth > 0 else None
+        # track_focus 为 True 时记录每个任务的专注时间段（见 focus_time.py）
+        self.focus_log = FocusTimeLog(self, filename + ".focus") if track_focus else None
+        # write_delay 不为 None 时启用后台写入：修改只标记脏状态，由后台线程合并写入
+        if write_delay is not None:
+            self.writer = WriteBehindWriter(self.flush, write_delay)
+        # watch 为 True 时监视文件，其它实例修改后立即合并，不必等到下次写入
+        if watch and self.shared_file is not None:
+            self.shared_file.watch()
+        if self.sync is not None:
+            self.sync.start()
 
     def create_root_node(self):
         """创建并返回一个新的根节点"""
@@ -37,133 +164,594 @@ class TaskTree:
 
     def reset_to_root(self):
         """重置任务树到只有根节点的状态"""
-        self.root = self.create_root_node()
-        self.current_task = self.root
-        self.save_to_file()
+        with self.lock:
+            previous = {"root": self.root, "current_id": self.current_task.id, "task_count": len(self.tasks),
+                        "lazy": self.lazy_source is not None}
+            self.set_root(self.create_root_node())
+            self.record_operation({"op": "reset", "id": self.root.id}, previous)
+
+    def restore_root(self, root, current_task_id):
+        """换回一棵之前的任务树（撤销重置时使用），并整体重新持久化。
+
+        root 必须已经完全物化（按需加载的数据源此时可能已被覆盖）。
+        """
+        with self.lock:
+            self.set_root(root)
+            current_task = self.current_task = self.tasks.get(current_task_id, root)
+            if hasattr(self.storage, "tree_rows"):
+                self.record_operation({"op": "import", "root_id": root.id, "rows": self.storage.tree_rows(root)})
+            else:
+                # 快照包含之前的全部操作，写入后日志会被清空
+                self.storage.request_snapshot()
+                self.record_operation({"op": "focus", "id": current_task.id})
+
+    def set_root(self, root, current_task=None, lazy_source=None, index=None):
+        """替换整棵任务树，并重建 id 索引和父节点引用（index 为校验时已经建立好的索引）。"""
+        self.root = root
+        root.parent = None
+        self.lazy_source = lazy_source
+        if index is not None:
+            self.tasks = index
+        else:
+            self.tasks = {}
+            self.index_subtree(root)
+        self.current_task = current_task if current_task is not None else root
+
+    def index_subtree(self, task):
+        """把子树中的所有节点加入 id 索引，并设置父节点引用（迭代实现，不受递归深度限制）。"""
+        stack = [task]
+        while stack:
+            node = stack.pop()
+            if node.id in self.tasks and self.tasks[node.id] is not node:
+                print(f"发现重复的任务 id {node.id}，索引中保留先出现的节点。")
+            else:
+                self.tasks[node.id] = node
+            for child in node.loaded_children():
+                child.parent = node
+                stack.append(child)
+
+    def unindex_subtree(self, task):
+        """把子树中的所有节点移出 id 索引。"""
+        stack = [task]
+        while stack:
+            node = stack.pop()
+            if self.tasks.get(node.id) is node:
+                del self.tasks[node.id]
+            stack.extend(node.loaded_children())
+
+    def register_tasks(self, tasks):
+        """登记刚从按需加载的数据源中物化出来的节点（所在的子树已被删除时不登记，例如生成撤销记录时）。"""
+        for task in tasks:
+            if self.tasks.get(task.parent.id) is task.parent:
+                self.index_subtree(task)
+
+    def attach_task(self, parent, task, index=None):
+        """把任务（及其子树）挂到父任务下（index 为 None 时追加到末尾），同时维护索引和父节点引用。"""
+        task.parent = parent
+        if parent.children is NO_CHILDREN:
+            parent.children = []
+        if index is None:
+            parent.children.append(task)
+        else:
+            parent.children.insert(index, task)
+        self.index_subtree(task)
+
+    def detach_task(self, task):
+        """把任务（及其子树）从父任务下摘除，同时维护索引和父节点引用。"""
+        parent = task.parent
+        if parent is not None:
+            parent.children.remove(task)
+        task.parent = None
+        self.unindex_subtree(task)
 
     def add_task(self, name):
-        new_task = Task(name, parent_id=self.current_task.id)
-        self.current_task.children.append(new_task)
-        self.current_task = new_task
-        self.save_to_file()
+        with self.lock:
+            new_task = Task(name)
+            self.attach_task(self.current_task, new_task)
+            self.current_task = new_task
+            self.record_operation({"op": "add", "id": new_task.id, "parent_id": new_task.parent_id, "name": name})
         
     def rename_task(self, new_name):
         """Rename the current task, ensuring the root node's name is immutable."""
-        if self.current_task == self.root:
-            print("根节点名称不可修改。")
-            return
-        self.current_task.name = new_name
-        self.save_to_file()
-        
-    def load_from_file(self):
-        """从 JSON 文件加载任务树，并设置当前专注任务。如果文件不存在，则创建一个新文件并初始化任务树。"""
-        if not os.path.exists(self.filename):
-            print(f"{self.filename} 不存在，正在创建新文件并初始化任务树。")
-            self.save_to_file()
+        with self.lock:
+            if self.current_task == self.root:
+                print("根节点名称不可修改。")
+                return
+            previous = {"name": self.current_task.name}
+            self.current_task.name = sys.intern(new_name)
+            self.record_operation({"op": "rename", "id": self.current_task.id, "name": new_name}, previous)
+
+    def search(self, query, limit=20, fuzzy=True):
+        """按名称搜索任务，返回按相关度排序的任务列表（见 task_search.py）。"""
+        if self.search_index is None:
+            self.prepare_search()
+        return self.search_index.search(query, limit, fuzzy)
+
+    def prepare_search(self, background=False):
+        """建立搜索索引（十万个节点约需一秒）；background 为 True 时在后台线程中建立。"""
+        with self.lock:
+            if self.search_index is None:
+                self.search_index = TaskSearchIndex(self)
+                self.search_index.start(background)
+
+    def undo(self, steps=1):
+        """撤销最近的 steps 步修改，返回实际撤销的步数（未启用历史时为 0）。"""
+        return self.history.undo(steps) if self.history is not None else 0
+
+    def redo(self, steps=1):
+        """重做最近撤销的 steps 步修改，返回实际重做的步数。"""
+        return self.history.redo(steps) if self.history is not None else 0
+
+    def add_listener(self, listener):
+        """登记修改监听器：每次修改后以 (操作记录, 修改前的状态) 调用，调用时持有 lock。"""
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def record_operation(self, operation, previous=None):
+        """登记一次修改并安排持久化。
+
+        操作记录由存储后端写出（JSON 日志模式下追加一条记录，否则整体重写快照）；启用后台写入时只标记脏状态。
+        previous 是撤销该修改所需的旧状态（例如重命名前的名称），只传给监听器，不会写入磁盘。
+        """
+        with self.lock:
+            self.notify_listeners(operation, previous)
+            self._pending_operations.append(operation)
+            if self._batch_depth:
+                return  # 批次结束时统一保存
+        self.schedule_flush()
+
+    def notify_listeners(self, operation, previous=None):
+        """通知监听器而不安排持久化（合并其它实例的修改时使用，这些修改已经在文件中）。"""
+        with self.lock:
+            for listener in self.listeners:
+                listener(operation, previous)
+
+    def merge_external_changes(self):
+        """合并其它实例写入文件的修改，返回合并的修改数（文件监视线程调用）。
+
+        任务树正忙或正在写入时返回 None，由调用方稍后重试：写入过程持有 _io_lock 后才获取 lock，
+        这里持有 lock 时不能阻塞等待 _io_lock，否则会与写入线程互相等待。
+        """
+        if self.shared_file is None:
+            return 0
+        if not self.lock.acquire(timeout=0.1):
+            return None
+        try:
+            if not self._io_lock.acquire(blocking=False):
+                return None
+            try:
+                with self.shared_file.lock.shared():
+                    return self.shared_file.merge()
+            finally:
+                self._io_lock.release()
+        finally:
+            self.lock.release()
+
+    def schedule_flush(self):
+        """同步写出修改，启用后台写入时只通知后台线程。"""
+        if self.writer is None:
+            self.flush()
         else:
+            self.writer.mark_dirty()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """在一个批次中执行多次修改，退出时只保存一次。
+
+        批次期间持有 ``lock``，其它线程看不到中间状态；批次可以嵌套，最外层结束时才保存。
+        """
+        with self.lock:
+            if self._batch_depth == 0:
+                self._batch_counter += 1
+                self.batch_id = self._batch_counter
+            self._batch_depth += 1
             try:
-                with open(self.filename, 'r') as file:
-                    data = json.load(file)
-                    # 验证文件格式
-                    if not self.validate_data_format(data):
-                        self.handle_file_format_error()
-                        return
-                    
-                    # 从文件加载任务树和当前任务
-                    self.root = self.dict_to_task(data["root"])
-                    self.current_task_id = data.get("current_task_id")
-                    self.current_task = self.find_task_by_id(self.root, self.current_task_id)
-                    print(f"成功从 {self.filename} 加载任务树，当前专注任务为：{self.current_task.name}")
-            except (json.JSONDecodeError, KeyError) as e:
-                # 捕获 JSON 解析错误或关键数据缺失情况
-                print(f"文件读取失败，原因：{e}")
-                self.handle_file_format_error()
-                
-                
-    def save_to_file(self, filename=None):
-        """将任务树保存到 JSON 文件，并记录当前专注任务的 id"""
-        if filename == None:
-            filename = self.filename
-        with open(filename, 'w') as file:
-            data = {
-                "root": self.task_to_dict(self.root),
-                "current_task_id": self.current_task.id  # 记录当前专注任务的 id
-            }
-            json.dump(data, file, indent=4)
-
-    def validate_data_format(self, data):
-        """验证 JSON 数据的格式是否符合预期。"""
-        # 检查数据中是否包含 "root" 和 "current_task_id" 字段
-        if "root" not in data or "current_task_id" not in data:
-            return False
-        # 检查 root 是否具有符合任务格式的基本字段
-        return isinstance(data["root"], dict) and "name" in data["root"] and "children" in data["root"]
-
-    def handle_file_format_error(self):
-        """处理文件格式错误的情况，提供选项重新创建或检查文件。"""
-        print("任务文件格式不符合预期。请确认文件结构或选择以下选项：")
-        try:
-            choice = input("输入 '1' 重新创建文件，输入 '2' 检查文件并重新加载：").strip()
-        except EOFError:
-            choice = ""  # 处理无法输入的情况
-
-        if choice == '1':
-            self.root = self.create_root_node()
-            self.current_task = self.root
-            self.save_to_file()
-            print(f"已重新创建 {self.filename} 文件。")
-        elif choice == '2':
-            print("请手动检查文件内容，并确保格式正确。")
+                yield self
+            finally:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self.batch_id = None
+                pending = self._batch_depth == 0 and self._pending_operations
+        if pending:
+            self.schedule_flush()
+
+    def flush(self):
+        """把所有待写入的修改同步写到磁盘。
+
+        只在持有 ``lock`` 时取出待写入的操作记录，真正的磁盘 I/O 由存储后端在锁外进行，
+        因此后台写入线程不会长时间阻塞 GUI 线程上的修改。
+        """
+        with self._io_lock, instrumentation.measure("persistence", "flush"):
+            with self.lock:
+                operations = self._pending_operations
+                self._pending_operations = []
+                current_task_id = self.current_task.id
+            self.storage.apply(operations, current_task_id)
+
+    def close(self):
+        """写出所有待写入的修改，停止后台写入线程并关闭存储后端。"""
+        if self.focus_log is not None:
+            self.focus_log.close()
+        if self.sync is not None:
+            self.sync.close()
+        if self.shared_file is not None:
+            self.shared_file.close()
+        if self.writer is not None:
+            self.writer.close()
+        else:
+            self.flush()
+        self.storage.close()
+
+    def compact_journal(self):
+        """把当前任务树写成新的快照并清空日志。"""
+        with self.lock:
+            self.storage.request_snapshot()
+        self.flush()
+
+    def apply_operation(self, operation):
+        """把一条操作记录应用到内存中的任务树（不触发持久化）。
+
+        返回修改前的状态（与 record_operation 的 previous 参数相同），没有可返回的状态时返回 None。
+        添加已经存在的任务（例如撤销删除时任务已被其它实例恢复）只切换专注任务，返回 {"current_id": ...}。
+        """
+        op = operation.get("op")
+        if op == "reset":
+            self.set_root(Task(name="Root", id=operation["id"]))
+        elif op == "add":
+            task = self.get_task(operation["id"])
+            if task is not None:
+                previous = {"current_id": self.current_task.id}
+                self.current_task = task
+                return previous
+            parent = self.get_task(operation["parent_id"])
+            if parent is None:
+                print(f"日志记录引用了不存在的父任务 {operation['parent_id']}，已跳过。")
+                return
+            task = Task(operation["name"], operation["id"], completed_at=operation.get("completed_at"))
+            self.attach_task(parent, task, self.placement_index(parent.children, operation))
+            self.current_task = task
+        elif op == "remove":
+            task = self.get_task(operation["id"])
+            if task is not None and task.parent is not None:
+                previous = {"task": task, "parent_id": task.parent.id, "index": task.parent.children.index(task),
+                            "current_id": self.current_task.id}
+                # 当前专注任务在被删除的子树中时，回退到被删除任务的父任务
+                if task in self.get_task_path(self.current_task):
+                    self.current_task = task.parent
+                self.detach_task(task)
+                return previous
+        elif op == "move":
+            task = self.get_task(operation["id"])
+            parent = self.get_task(operation["parent_id"])
+            if task is None or parent is None or task.parent is None or task in self.get_task_path(parent):
+                print(f"无法把任务 {operation['id']} 移动到 {operation['parent_id']} 下，已跳过。")
+                return
+            previous = {"parent_id": task.parent.id, "index": task.parent.children.index(task)}
+            # 子树中的节点仍在索引中，只需调整两个父任务的子节点列表
+            task.parent.children.remove(task)
+            if parent.children is NO_CHILDREN:
+                parent.children = []
+            index = self.placement_index(parent.children, operation)
+            parent.children.insert(len(parent.children) if index is None else min(index, len(parent.children)), task)
+            task.parent = parent
+            return previous
+        elif op == "focus":
+            task = self.get_task(operation["id"])
+            if task is not None:
+                previous = {"current_id": self.current_task.id}
+                self.current_task = task
+                return previous
+        elif op == "rename":
+            task = self.get_task(operation["id"])
+            if task is not None:
+                previous = {"name": task.name}
+                task.name = sys.intern(operation["name"])
+                return previous
+        elif op == "complete":
+            task = self.get_task(operation["id"])
+            if task is not None and task.parent is not None:
+                previous = {"completed_at": task.completed_at}
+                task.completed_at = operation.get("at", task.completed_at)  # 旧版本的记录没有完成时间
+                self.current_task = task.parent
+                return previous
+        elif op == "reopen":
+            task = self.get_task(operation["id"])
+            if task is not None:
+                previous = {"completed_at": task.completed_at, "current_id": self.current_task.id}
+                task.completed_at = operation.get("at")
+                self.current_task = task
+                return previous
         else:
-            print("未选择有效选项，默认重新创建文件。")
-            self.root = self.create_root_node()
-            self.current_task = self.root
-            self.save_to_file()
+            print(f"未知的日志操作类型：{op}，已跳过。")
+        
+    @staticmethod
+    def placement_index(siblings, operation):
+        """添加或移动记录在 siblings 中的位置：带 after_id 时放在这个兄弟任务之后（None 表示最前，见 shared_file.py），
+        找不到它或没有 after_id 时按 index（None 表示追加到末尾）。"""
+        if "after_id" in operation:
+            after_id = operation["after_id"]
+            if after_id is None:
+                return 0
+            for position, child in enumerate(siblings):
+                if child.id == after_id:
+                    return position + 1
+        return operation.get("index")
+
+    def load_from_file(self):
+        """从存储后端加载任务树，并设置当前专注任务（文件不存在时由后端创建新文件并初始化任务树）。"""
+        self.storage.load(self)
+
+    def save_to_file(self, filename=None):
+        """将任务树保存到 JSON 文件，并记录当前专注任务的 id
+
+        保存到默认文件时由存储后端整体重写（日志模式下即是一次压缩：快照先写入临时文件再原子替换，之后清空日志）；
+        启用后台写入时只标记脏状态，重复调用几乎没有开销。保存到其它文件时导出一份快照（.ewtb 为二进制快照）。
+        """
+        if filename == None or filename == self.filename:
+            with self.lock:
+                self.storage.request_snapshot()
+            if self.writer is None:
+                self.flush()
+            else:
+                self.writer.mark_dirty()
+            return
+        from storage import snapshot_data, write_snapshot
+
+        with self.lock:
+            data = snapshot_data(self, filename)
+        write_snapshot(data, filename)
 
     def task_to_dict(self, task):
         """将任务转换为字典格式，用于保存到 JSON 文件。"""
-        return {
-            "id": task.id,
-            "name": task.name,
-            "children": [self.task_to_dict(child) for child in task.children]
-        }
-
-    def dict_to_task(self, data):
-        """从字典格式的数据重建任务树。"""
-        task = Task(data["name"], data["id"], data.get("parent_id"))
-        task.children = [self.dict_to_task(child) for child in data["children"]]
+        return task.to_dict()
+
+    def dict_to_task(self, data, problems=None):
+        """从字典格式的数据重建任务树（迭代实现，不受递归深度限制）。
+
+        不合法的节点被跳过，它下面合法的子树挂到它的父任务下；传入 problems 列表时把隔离记录追加到其中。
+        根节点本身不合法时返回 None。
+        """
+        problems = [] if problems is None else problems
+        if not isinstance(data, dict) or node_problem(data) is not None:
+            problems.append(quarantine_record(node_problem(data) if isinstance(data, dict) else "根节点不是对象",
+                                              data))
+            return None
+        root = Task(data["name"], data["id"], completed_at=data.get("completed_at"))
+        stack = [(root, data)]
+        while stack:
+            task, node = stack.pop()
+            pending = list(reversed(node_children(node, problems)))
+            while pending:
+                child_data = pending.pop()
+                reason = node_problem(child_data) if isinstance(child_data, dict) else "子任务不是对象"
+                if reason is not None:
+                    problems.append(quarantine_record(reason, child_data, task.id))
+                    if isinstance(child_data, dict):
+                        pending.extend(reversed(node_children(child_data, problems)))  # 挽救合法的子任务
+                    continue
+                child = Task(child_data["name"], child_data["id"], completed_at=child_data.get("completed_at"))
+                child.parent = task
+                if task.children is NO_CHILDREN:
+                    task.children = []
+                task.children.append(child)
+                stack.append((child, child_data))
+        return root
+
+    def get_task(self, task_id):
+        """通过 id 索引以 O(1) 时间查找任务，找不到时返回 None。
+
+        使用二进制快照时，尚未物化的任务会按需从快照中加载（只物化其祖先路径）。
+        """
+        task = self.tasks.get(task_id)
+        if task is None and self.lazy_source is not None:
+            task = self.lazy_source.resolve(self.root, task_id)
         return task
 
     def find_task_by_id(self, task, task_id):
-        """根据 id 查找任务。"""
-        if task.id == task_id:
-            return task
-        for child in task.children:
-            result = self.find_task_by_id(child, task_id)
-            if result:
+        """在以 task 为根的子树中根据 id 查找任务。"""
+        result = self.get_task(task_id)
+        if result is None or task is self.root:
+            return result
+        # 只需沿父节点引用向上检查是否位于该子树内，代价与深度成正比
+        node = result
+        while node is not None:
+            if node is task:
                 return result
+            node = node.parent
         return None
 
+    def get_ancestors(self, task):
+        """返回从父任务到根节点的祖先列表。"""
+        ancestors = []
+        node = task.parent
+        while node is not None:
+            ancestors.append(node)
+            node = node.parent
+        return ancestors
+
+    def get_task_path(self, task):
+        """返回从根节点到该任务的路径。"""
+        path = self.get_ancestors(task)
+        path.reverse()
+        path.append(task)
+        return path
+
+    def focus_task(self, task):
+        """把专注任务切换到指定任务（例如从搜索结果跳转）。"""
+        with self.lock:
+            if task is self.current_task:
+                return
+            previous = {"current_id": self.current_task.id}
+            self.current_task = task
+            self.record_operation({"op": "focus", "id": task.id}, previous)
+
     def complete_task(self):
         """完成当前任务，将专注任务指针退回到父节点。"""
-        if self.current_task == self.root:
-            print("根节点不可完成。")
-            return
-        parent_task = self.find_parent(self.root, self.current_task)
-        if parent_task:
-            self.current_task = parent_task
-            print(f"已完成任务，回退到父任务：{self.current_task.name}")
-            self.save_to_file()
+        with self.lock:
+            if self.current_task == self.root:
+                print("根节点不可完成。")
+                return
+            completed_task = self.current_task
+            parent_task = completed_task.parent
+            if parent_task:
+                previous = {"completed_at": completed_task.completed_at}
+                completed_task.completed_at = time.time()
+                self.current_task = parent_task
+                print(f"已完成任务，回退到父任务：{self.current_task.name}")
+                self.record_operation({"op": "complete", "id": completed_task.id, "at": completed_task.completed_at},
+                                      previous)
+
+    def reopen_task(self, task):
+        """把已完成的任务重新标记为未完成，并专注于它。"""
+        with self.lock:
+            operation = {"op": "reopen", "id": task.id}
+            self.record_operation(operation, self.apply_operation(operation))
+
+    # ---- 批量修改：都在一个 batch() 中完成，退出时只保存一次 ----
+
+    def add_tasks(self, names, parent=None):
+        """在 parent（默认为当前任务）下依次添加多个子任务，专注任务不变，返回新建的任务列表。"""
+        return self.add_outline([(0, name, False) for name in names], parent)
+
+    def import_outline(self, text, parent=None):
+        """把缩进文本或 Markdown 大纲（见 task_outline.py）导入为 parent（默认为当前任务）下的子树。
+
+        专注任务不变，返回新建的顶层任务列表。
+        """
+        from task_outline import parse_outline
+
+        items = parse_outline(text)
+        created = self.add_outline(items, parent)
+        print(f"已从大纲导入 {len(items)} 个任务。")
+        return created
+
+    def add_outline(self, items, parent=None):
+        """按 (层级, 名称, 是否已完成) 的先序列表在 parent 下建立子树，返回新建的顶层任务列表。"""
+        with self.batch():
+            current_task = self.current_task
+            parent = current_task if parent is None else parent
+            stack = [parent]  # stack[层级] 是该层级任务的父任务
+            created = []
+            now = time.time()
+            for level, name, done in items:
+                del stack[level + 1:]
+                operation = {"op": "add", "id": str(uuid.uuid4()), "parent_id": stack[-1].id, "name": name}
+                if done:
+                    operation["completed_at"] = now
+                self.record_operation(operation, self.apply_operation(operation))
+                task = self.current_task
+                if level == 0:
+                    created.append(task)
+                stack.append(task)
+            if items:
+                self.focus_task(current_task)  # 新增操作会专注于新任务，最后换回原来的专注任务
+        return created
+
+    def move_task(self, task, parent, index=None):
+        """把任务连同子树移动到 parent 的第 index 个子任务之前（index 为 None 时追加到末尾），返回是否移动。
+
+        不能移动根节点，也不能移动到自己的子树中；专注任务不变。
+        """
+        with self.lock:
+            if task is self.root or task in self.get_task_path(parent):
+                print("不能移动根节点，也不能把任务移动到它自己的子树中。")
+                return False
+            if index is None:
+                index = len(parent.children) - (task.parent is parent)
+            operation = {"op": "move", "id": task.id, "parent_id": parent.id, "index": index}
+            self.record_operation(operation, self.apply_operation(operation))
+            return True
+
+    def remove_task(self, task):
+        """删除任务及其子树，返回是否删除；专注任务在子树中时回退到被删除任务的父任务。"""
+        with self.lock:
+            if task is self.root:
+                print("根节点不可删除。")
+                return False
+            operation = {"op": "remove", "id": task.id}
+            self.record_operation(operation, self.apply_operation(operation))
+            return True
+
+    def remove_tasks(self, tasks):
+        """在一个批次中删除多棵子树（已经随祖先一起删除的任务会被跳过），返回删除的子树数。"""
+        removed = 0
+        with self.batch():
+            for task in tasks:
+                if self.tasks.get(task.id) is task and self.remove_task(task):
+                    removed += 1
+        return removed
+
+    def archive_completed(self, older_than_days, now=None):
+        """把完成时间早于 older_than_days 天的子树整体移入归档，返回归档的任务数。
+
+        子树的根已完成即整体归档（其中未完成的子任务随之归档）；包含当前专注任务的子树不归档。
+        先写入归档再从任务树中删除，两步之间崩溃时任务只会同时存在于两处，不会丢失。
+        """
+        now = time.time() if now is None else now
+        cutoff = now - older_than_days * 24 * 60 * 60
+        with self.lock:
+            focused = {id(task) for task in self.get_task_path(self.current_task)}
+            candidates = []  # (父任务, 位置, 子树的根)
+            stack = [self.root]
+            while stack:
+                node = stack.pop()
+                for index, child in enumerate(node.children):
+                    if child.completed_at is not None and child.completed_at <= cutoff and id(child) not in focused:
+                        candidates.append((node, index, child))
+                    else:
+                        stack.append(child)
+            if not candidates:
+                return 0
+            records = [self.archive.make_record(task, [ancestor.name for ancestor in self.get_task_path(parent)],
+                                                index, now)
+                       for parent, index, task in candidates]
+            self.archive.append(records)
+            with self.batch():
+                for _, _, task in candidates:
+                    operation = {"op": "remove", "id": task.id, "archived": True}
+                    self.record_operation(operation, self.apply_operation(operation))
+        archived = sum(len(record["nodes"]) for record in records)
+        print(f"已将 {len(candidates)} 棵已完成的子树（共 {archived} 个任务）移入归档。")
+        return archived
+
+    def search_archive(self, query, limit=20):
+        """按名称搜索已归档的任务，返回 task_archive.ArchivedTask 列表。"""
+        return [task for task in self.archive.search(query, limit) if self.get_task(task.id) is None]
+
+    def restore_archived(self, task_id):
+        """从归档中恢复包含该任务的整棵子树并专注于该任务，返回恢复后的任务；不在归档中时返回 None。
+
+        子树挂回原来的父任务（父任务已不存在时挂到根节点下），完成状态保持不变。
+        """
+        record = self.archive.find(task_id)
+        if record is None:
+            return None
+        with self.batch():
+            parent = self.get_task(record["parent_id"]) or self.root
+            for position, (node_id, name, parent_id, completed_at) in enumerate(record["nodes"]):
+                if self.get_task(node_id) is not None:
+                    continue  # 已经在任务树中（例如其它实例已经恢复过）
+                operation = {"op": "add", "id": node_id, "name": name}
+                if position == 0:
+                    operation["parent_id"] = parent.id
+                    operation["index"] = min(record["index"], len(parent.children))
+                else:
+                    operation["parent_id"] = parent_id
+                if completed_at is not None:
+                    operation["completed_at"] = completed_at
+                self.record_operation(operation, self.apply_operation(operation))
+            task = self.get_task(task_id)
+            if task is not None:
+                self.focus_task(task)
+        self.archive.mark_restored(record)
+        print(f"已从归档恢复 {len(record['nodes'])} 个任务。")
+        return task
 
     def find_parent(self, parent, child):
-        """找到指定任务的父任务。"""
-        for node in parent.children:
-            if node == child:
-                return parent
-            result = self.find_parent(node, child)
-            if result:
-                return result
-        return None
+        """找到指定任务的父任务（直接使用父节点引用）。"""
+        return child.parent
 
 
 
@@ -0,0 +1,300 @@
+"""主窗口任务树视图使用的 QAbstractItemModel。
+
+模型不复制任务树，直接读取 Task 节点；子节点只有在视图展开时才通过 canFetchMore/fetchMore
+分批暴露给视图（按需加载的节点此时才从数据源读取），因此打开十万个节点的任务树也不会卡顿。
+
+任务树的修改通过 TaskTree 的监听器记录下来，在收到 task_changed_signal 时统一处理：
+只对已经展开的父节点发出 rowsInserted/rowsRemoved，对改名和专注任务的变化发出 dataChanged，
+只有重置或整体换树时才重置模型。
+"""
+
+import threading
+from collections import deque
+
+from PyQt5.QtCore import QAbstractItemModel, QModelIndex, Qt
+from PyQt5.QtGui import QBrush, QColor, QFont
+
+from focus_time import format_duration
+
+FETCH_BATCH_SIZE = 1000  # 每次 fetchMore 最多暴露的子节点数
+CURRENT_TASK_BACKGROUND = QColor("#FFE8A3")
+COMPLETED_TASK_FOREGROUND = QColor("#9E9E9E")  # 已完成（尚未归档）的任务显示为灰色
+
+
+class TaskTreeModel(QAbstractItemModel):
+    def __init__(self, task_tree, parent=None):
+        super().__init__(parent)
+        self.task_tree = None
+        self._pending = deque()  # 尚未反映到视图上的 (操作记录, 修改前的状态)
+        self._pending_lock = threading.Lock()
+        self._updating = False  # 正在发出行插入/删除通知，期间视图不能再通过 fetchMore 读取子节点
+        self.set_task_tree(task_tree)
+
+    def set_task_tree(self, task_tree):
+        """切换到另一棵任务树（例如切换工作流），重置模型。"""
+        self.beginResetModel()
+        if self.task_tree is not None:
+            self.task_tree.remove_listener(self.on_operation)
+        self.task_tree = task_tree
+        task_tree.add_listener(self.on_operation)
+        with self._pending_lock:
+            self._pending.clear()
+        self.reset_state()
+        self.endResetModel()
+
+    def reset_state(self):
+        self.root = self.task_tree.root
+        self.current = self.task_tree.current_task
+        self.nodes = {id(self.root): self.root}  # 内部 id -> 任务，保证视图持有的索引指向的对象仍然存活
+        self.exposed = {}  # id(父任务) -> 已经暴露给视图的子任务列表（总是子节点列表的前缀）
+        self.rows = {id(self.root): 0}  # id(任务) -> 在父任务的已暴露子任务中的行号
+        # id(任务) -> 暴露它时的父任务；已删除的任务在发出删除通知前已经离开任务树，不能读取 task.parent
+        self.parents = {}
+        self.totals = {}  # id(父任务) -> 上次读取时的子节点数，用来判断新增的子任务是否在已暴露范围内
+
+    # ---- QAbstractItemModel 接口 ----
+
+    def task_for(self, index):
+        return self.nodes[index.internalId()] if index.isValid() else None
+
+    def index(self, row, column, parent=QModelIndex()):
+        if column != 0:
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(0, 0, id(self.root)) if row == 0 else QModelIndex()
+        children = self.exposed.get(parent.internalId(), ())
+        if not 0 <= row < len(children):
+            return QModelIndex()
+        return self.createIndex(row, 0, id(children[row]))
+
+    def parent(self, index):
+        parent = self.parents.get(index.internalId()) if index.isValid() else None
+        return self.index_of(parent) if parent is not None else QModelIndex()
+
+    def index_of(self, task):
+        """返回已经暴露给视图的任务的索引。"""
+        key = id(task)
+        row = self.rows.get(key)
+        if row is None:
+            return QModelIndex()
+        return self.createIndex(row, 0, key)
+
+    def rowCount(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return 1
+        return len(self.exposed.get(parent.internalId(), ()))
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return True
+        task = self.task_for(parent)
+        children = self.exposed.get(id(task))
+        return bool(children) or task.may_have_children()
+
+    def canFetchMore(self, parent):
+        task = self.task_for(parent)
+        if task is None or self._updating:
+            return False
+        children = self.exposed.get(id(task))
+        if children is None:
+            return task.may_have_children()
+        return len(children) < len(task.children)
+
+    def fetchMore(self, parent):
+        task = self.task_for(parent)
+        if task is None or self._updating:
+            return
+        with self.task_tree.lock:
+            children = task.children  # 按需加载的节点在这里才读取子节点
+            exposed = self.exposed.setdefault(id(task), [])
+            batch = children[len(exposed):len(exposed) + FETCH_BATCH_SIZE]
+            self.totals[id(task)] = len(children)
+        if not batch:
+            return
+        self._updating = True  # 视图在 beginInsertRows 中可能再次调用 fetchMore
+        try:
+            self.beginInsertRows(parent, len(exposed), len(exposed) + len(batch) - 1)
+            for row, child in enumerate(batch, len(exposed)):
+                self.nodes[id(child)] = child
+                self.parents[id(child)] = task
+                self.rows[id(child)] = row
+            exposed.extend(batch)
+            self.endInsertRows()
+        finally:
+            self._updating = False
+
+    def data(self, index, role=Qt.DisplayRole):
+        task = self.task_for(index)
+        if task is None:
+            return None
+        if role == Qt.DisplayRole:
+            return task.name
+        if role == Qt.ToolTipRole:
+            focus_log = self.task_tree.focus_log
+            if focus_log is None:
+                return task.id
+            return (f"{task.id}\n专注时间：{format_duration(focus_log.task_time(task))}"
+                    f"（含子任务 {format_duration(focus_log.subtree_time(task))}）")
+        if role == Qt.ForegroundRole and task.completed:
+            return QBrush(COMPLETED_TASK_FOREGROUND)
+        if task is self.current:
+            if role == Qt.FontRole:
+                font = QFont()
+                font.setBold(True)
+                return font
+            if role == Qt.BackgroundRole:
+                return QBrush(CURRENT_TASK_BACKGROUND)
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    # ---- 增量更新 ----
+
+    def on_operation(self, operation, previous):
+        """TaskTree 的修改监听器：只记录，等 task_changed_signal 时在 GUI 线程中处理。"""
+        with self._pending_lock:
+            self._pending.append((operation, previous))
+
+    def apply_pending(self):
+        """把积累的修改转换为细粒度的模型通知（连接到 task_changed_signal）。"""
+        with self._pending_lock:
+            pending = list(self._pending)
+            self._pending.clear()
+        tree = self.task_tree
+        with tree.lock:
+            if tree.root is not self.root or any(op.get("op") in ("reset", "import") for op, _ in pending):
+                self.beginResetModel()
+                self.reset_state()
+                self.endResetModel()
+                return
+            self._updating = True
+            try:
+                self.apply_operations(pending)
+            finally:
+                self._updating = False
+
+    def apply_operations(self, pending):
+        tree = self.task_tree
+        parents = []  # 子节点列表可能变化的父任务，按出现顺序去重
+        for operation, previous in pending:
+            op = operation.get("op")
+            if op == "add":
+                task = tree.get_task(operation["id"])
+                if task is not None and task.parent is not None:
+                    parents.append(task.parent)
+            elif op == "remove" and previous is not None:
+                parent = tree.get_task(previous["parent_id"])
+                if parent is not None:
+                    parents.append(parent)
+            elif op == "move" and previous is not None:
+                task = tree.get_task(operation["id"])
+                for parent in (tree.get_task(previous["parent_id"]), task.parent if task is not None else None):
+                    if parent is not None:
+                        parents.append(parent)
+            elif op in ("rename", "complete", "reopen"):
+                self.task_changed(tree.get_task(operation["id"]))
+        for parent in dict.fromkeys(parents):
+            self.sync_children(parent)
+        if tree.current_task is not self.current:
+            old, self.current = self.current, tree.current_task
+            self.task_changed(old)
+            self.task_changed(self.current)
+
+    def task_changed(self, task):
+        if task is not None:
+            index = self.index_of(task)
+            if index.isValid():
+                self.dataChanged.emit(index, index)
+
+    def sync_children(self, parent):
+        """让父任务的已暴露子任务与任务树一致，只对有变化的行发出插入/删除通知。"""
+        exposed = self.exposed.get(id(parent))
+        parent_index = self.index_of(parent)
+        if exposed is None or not parent_index.isValid():
+            return  # 尚未展开过，展开时会读取最新的子节点
+        children = parent.children
+        present = {id(child) for child in children}
+        # 先删除已经不在任务树中的行（从后往前，行号不受影响）
+        for row in range(len(exposed) - 1, -1, -1):
+            if id(exposed[row]) not in present:
+                self.beginRemoveRows(parent_index, row, row)
+                self.forget(exposed.pop(row))
+                self.renumber(exposed, row)
+                self.endRemoveRows()
+        # 再按任务树中的顺序插入新出现的子任务；只暴露了一部分时，已暴露范围之后的子任务留给 fetchMore
+        complete = len(exposed) >= self.totals.get(id(parent), 0)
+        known = {id(child) for child in exposed}
+        row = 0
+        for child in children:
+            if row < len(exposed) and exposed[row] is child:
+                row += 1
+                continue
+            if id(child) in known:
+                # 顺序发生了变化（例如移动），重新暴露这个父任务的子任务
+                self.reexpose(parent_index, parent)
+                return
+            if row >= len(exposed) and not complete:
+                break
+            self.beginInsertRows(parent_index, row, row)
+            exposed.insert(row, child)
+            self.nodes[id(child)] = child
+            self.parents[id(child)] = parent
+            self.renumber(exposed, row)
+            self.endInsertRows()
+            row += 1
+        self.totals[id(parent)] = len(children)
+
+    def renumber(self, exposed, start):
+        for row in range(start, len(exposed)):
+            self.rows[id(exposed[row])] = row
+
+    def reexpose(self, parent_index, parent):
+        exposed = self.exposed[id(parent)]
+        count = len(exposed)
+        if exposed:
+            self.beginRemoveRows(parent_index, 0, len(exposed) - 1)
+            for child in exposed:
+                self.forget(child)
+            exposed.clear()
+            self.endRemoveRows()
+        children = parent.children
+        batch = children[:max(count, 1)]
+        self.totals[id(parent)] = len(children)
+        if batch:
+            self.beginInsertRows(parent_index, 0, len(batch) - 1)
+            for row, child in enumerate(batch):
+                self.nodes[id(child)] = child
+                self.parents[id(child)] = parent
+                self.rows[id(child)] = row
+            exposed.extend(batch)
+            self.endInsertRows()
+
+    def forget(self, task):
+        """丢弃已删除子树在模型中的记录。"""
+        stack = [task]
+        while stack:
+            node = stack.pop()
+            key = id(node)
+            self.nodes.pop(key, None)
+            self.rows.pop(key, None)
+            self.parents.pop(key, None)
+            self.totals.pop(key, None)
+            stack.extend(self.exposed.pop(key, ()))
+
+    def reveal(self, task):
+        """确保从根节点到该任务的每一层都已暴露，返回该任务的索引（用于展开并滚动到当前任务）。"""
+        with self.task_tree.lock:
+            path = self.task_tree.get_task_path(task)
+        for parent, child in zip(path, path[1:]):
+            parent_index = self.index_of(parent)
+            if not parent_index.isValid():
+                return QModelIndex()
+            while id(child) not in self.rows and self.canFetchMore(parent_index):
+                self.fetchMore(parent_index)
+        return self.index_of(task)
@@ -0,0 +1,156 @@
+"""任务树文件的校验与自动修复。
+
+加载 JSON 快照时分两步检查，都不需要用户交互：
+
+1. 解析时（json_stream.load_tree）逐个检查节点的字段：id 和 name 必须是字符串，completed_at 必须是数字或 null。
+   不合法的节点被隔离，它下面合法的子树按原来的位置挂到它的父任务下。缺少 children 视为没有子任务；
+   children 不是数组时只隔离这个字段，节点本身保留为没有子任务的任务。
+2. 解析完成后 ``validate_tree`` 用一次迭代遍历检查整棵树：id 必须唯一，同一个节点不能出现两次（环），
+   current_task_id 必须能找到对应的任务（缺少时同样回退到根节点）。遍历的同时建立 id 索引，
+   TaskTree 直接使用，不必再遍历一次。只有文件无法解析或者没有 root 对象时才整体放弃。
+
+修复时被隔离或修改的内容以 JSON Lines 追加到 ``<任务树文件>.quarantine``，每行一条：
+
+    {"at": 时间, "reason": 原因, "parent_id": 所在的父任务, "node": 节点的原始字段（不含 children）, ...}
+
+修复后的任务树会立即写回，下次启动时不会重复隔离。
+"""
+
+import json
+import time
+import uuid
+from itertools import repeat
+
+ROOT_NAME = "Root"
+
+
+class InvalidNode:
+    """解析时发现的不合法节点：保存隔离记录和它下面可以挽救的合法子树。"""
+
+    __slots__ = ("record", "children")
+
+    def __init__(self, record, children):
+        self.record = record
+        self.children = children
+
+
+def node_problem(fields):
+    """返回节点字段不合法的原因，合法时返回 None（children 由 node_children 检查）。"""
+    if not isinstance(fields.get("id"), str) or not fields["id"]:
+        return "缺少 id 或 id 不是字符串"
+    if not isinstance(fields.get("name"), str):
+        return "缺少 name 或 name 不是字符串"
+    return None
+
+
+def node_children(fields, problems=None):
+    """返回节点的 children：缺少时为空数组；不是数组时把这个字段记入 problems 并按空数组处理。
+
+    problems 为 None 时不修复，直接抛出 ValueError。
+    """
+    children = fields.get("children", [])
+    if isinstance(children, list):
+        return children
+    if problems is None:
+        raise ValueError(f"任务 {fields.get('id')!r} 的 children 不是数组")
+    problems.append(quarantine_record("children 不是数组，已按没有子任务处理", {"id": fields.get("id")},
+                                      children=children))
+    return []
+
+
+def valid_completed_at(value):
+    return value is None or (isinstance(value, (int, float)) and not isinstance(value, bool) and value == value)
+
+
+def quarantine_record(reason, fields=None, parent_id=None, **extra):
+    record = {"reason": reason, "parent_id": parent_id}
+    if fields is not None:
+        record["node"] = {key: value for key, value in fields.items() if key != "children"} \
+            if isinstance(fields, dict) else fields
+    record.update(extra)
+    return record
+
+
+class ValidationReport:
+    """validate_tree 的结果：修复后的根节点、id 索引、当前任务和所有隔离记录。"""
+
+    def __init__(self, root, tasks, current_task, problems):
+        self.root = root
+        self.tasks = tasks
+        self.current_task = current_task
+        self.problems = problems
+
+    def summary(self):
+        counts = {}
+        for record in self.problems:
+            counts[record["reason"]] = counts.get(record["reason"], 0) + 1
+        return "；".join(f"{reason} {count} 处" for reason, count in counts.items())
+
+    def quarantine(self, filename):
+        """把隔离记录追加到隔离文件。"""
+        if not self.problems:
+            return
+        now = time.time()
+        with open(filename, "a", encoding="utf-8") as file:
+            for record in self.problems:
+                file.write(json.dumps(dict(record, at=now), ensure_ascii=False, default=repr) + "\n")
+
+
+def validate_tree(root, current_task_id, problems=None, repair=True):
+    """检查解析得到的任务树，返回 ValidationReport。
+
+    root 是 Task 或（根节点本身不合法时）InvalidNode；problems 是解析时已经发现的隔离记录。
+    repair 为 True 时就地修复：根节点不合法时换成新的根节点并挂上挽救出的子树，重复的 id 换成新的 id，
+    重复出现的节点从第二个位置摘除，找不到的当前任务回退到根节点。repair 为 False 时只检查不修改。
+    """
+    from task_tree import Task
+
+    problems = [] if problems is None else problems
+    if not isinstance(root, Task):
+        if not repair:
+            return ValidationReport(root, {}, None, problems)
+        salvaged = root.children if isinstance(root, InvalidNode) else []
+        root = Task(ROOT_NAME, str(uuid.uuid4()))
+        problems.append(quarantine_record("根节点不合法，已换成新的根节点", parent_id=None, new_id=root.id))
+        if salvaged:
+            root.children = list(salvaged)
+            for child in salvaged:
+                child.parent = root
+    tasks = {}
+    stack = [(root, None)]  # (节点, 这一次出现时所在的父节点)
+    pop, extend = stack.pop, stack.extend  # 加载时每个节点都要经过这里，循环尽量少做属性查找
+    while stack:
+        node, parent = pop()
+        existing = tasks.get(node.id)
+        if existing is node:
+            # 同一个节点出现在两个位置（构成环或被共享），从这一次出现的位置摘除
+            problems.append(quarantine_record("节点重复出现", {"id": node.id, "name": node.name},
+                                              parent.id if parent is not None else None))
+            if repair:
+                parent.children.remove(node)
+            continue
+        if existing is not None:
+            new_id = str(uuid.uuid4())
+            problems.append(quarantine_record("id 重复，已换成新的 id", {"id": node.id, "name": node.name},
+                                              parent.id if parent is not None else None, new_id=new_id))
+            if not repair:
+                continue
+            node.id = new_id
+        tasks[node.id] = node
+        node.parent = parent
+        if node.completed_at is not None and not valid_completed_at(node.completed_at):
+            problems.append(quarantine_record("completed_at 不是数字，已标记为未完成",
+                                              {"id": node.id, "completed_at": node.completed_at},
+                                              parent.id if parent is not None else None))
+            if repair:
+                node.completed_at = None
+        children = node.loaded_children()
+        if children:
+            extend(zip(reversed(children), repeat(node)))
+    # current_task_id 缺少（为 None）或不是字符串时同样回退到根节点
+    current_task = tasks.get(current_task_id) if isinstance(current_task_id, str) else None
+    if current_task is None:
+        problems.append(quarantine_record("current_task_id 找不到对应的任务，已回退到根节点",
+                                          {"current_task_id": current_task_id}))
+        current_task = root
+    return ValidationReport(root, tasks, current_task, problems)
@@ -0,0 +1,93 @@
+"""检查两个日志模式的实例共享同一个任务树文件时，合并后的任务树（包括兄弟任务的顺序）与重新加载文件一致。
+
+    python -m pytest tests/test_shared_file.py
+"""
+
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from task_tree import TaskTree  # noqa: E402
+
+
+def dump(tree):
+    """任务树的完整内容（包括兄弟任务的顺序），用于比较两个实例。"""
+    def node(task):
+        return task.id, task.name, [node(child) for child in task.children]
+
+    return node(tree.root)
+
+
+class SharedJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "tasks.json")
+        self.output = contextlib.redirect_stdout(io.StringIO())
+        self.output.__enter__()
+        self.trees = [TaskTree(self.filename, journal=True) for _ in range(2)]
+
+    def tearDown(self):
+        for tree in self.trees:
+            tree.close()
+        self.output.__exit__(None, None, None)
+        shutil.rmtree(self.directory)
+
+    def assertConverged(self):
+        for tree in self.trees:
+            tree.merge_external_changes()
+        first, second = self.trees
+        self.assertEqual(dump(first), dump(second))
+        reloaded = TaskTree(self.filename, journal=True)
+        try:
+            self.assertEqual(dump(reloaded), dump(first))
+        finally:
+            reloaded.close()
+
+    def add(self, tree, parent, name):
+        tree.focus_task(parent)
+        tree.add_task(name)
+
+    def test_concurrent_adds_keep_sibling_order(self):
+        first, second = self.trees
+        self.add(first, first.root, "a")
+        # second 还没有读到 a，就在同一个父任务下添加 b：写入前合并 a 时不能只是追加到本地的 b 后面
+        self.add(second, second.root, "b")
+        self.assertConverged()
+        self.assertEqual(sorted(child.name for child in first.root.children), ["a", "b"])
+
+    def test_anchor_moved_locally(self):
+        first, second = self.trees
+        self.add(first, first.root, "p")
+        self.add(first, first.root, "a")
+        second.merge_external_changes()
+        # first 在 a 后面添加 c；second 还没有读到，就把 a 移进 p 并在根任务下添加 d
+        self.add(first, first.root, "c")
+        with second.batch():
+            a = next(task for task in second.root.children if task.name == "a")
+            second.move_task(a, second.root.children[0])
+            self.add(second, second.root, "d")
+        self.assertConverged()
+        self.assertEqual([child.name for child in second.root.children], ["p", "d", "c"])
+
+    def test_random_interleaving(self):
+        rng = random.Random(7)
+        for step in range(60):
+            tree = self.trees[rng.randrange(2)]
+            # 一个批次中的多次本地修改在合并外部记录时都还没有写出
+            with tree.batch():
+                for _ in range(rng.randint(1, 3)):
+                    tasks = list(tree.tasks.values())
+                    self.add(tree, rng.choice(tasks), f"t{step}")
+            if rng.random() < 0.3:
+                self.assertConverged()
+        self.assertConverged()
+
+
+if __name__ == "__main__":
+    unittest.main()
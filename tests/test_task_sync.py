@@ -0,0 +1,182 @@
+"""用 sync_server.py 的参考服务器检查 task_sync.py 的合并是否收敛。
+
+每个用例在临时目录中从同一个任务树文件出发打开几个副本，按固定的随机种子交替地修改和同步，
+最后全部同步一遍，检查各个副本的任务树（名称、完成状态和兄弟任务的顺序）完全相同。
+
+    python -m pytest tests/test_task_sync.py
+"""
+
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sync_server import SyncServer  # noqa: E402
+from task_sync import TaskSync, initial_key, key_between  # noqa: E402
+from task_tree import TaskTree  # noqa: E402
+
+ACTIONS = ("add", "rename", "complete", "reopen", "move", "remove", "undo", "redo")
+
+
+def dump(tree):
+    """任务树的完整内容（包括兄弟任务的顺序），用于比较两个副本。"""
+    def node(task):
+        return task.id, task.name, task.completed_at, [node(child) for child in task.children]
+
+    return node(tree.root)
+
+
+class SyncConvergenceTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = SyncServer()
+        self.server.start("127.0.0.1", 0, background=True)
+        self.replicas = []
+        self.output = contextlib.redirect_stdout(io.StringIO())
+        self.output.__enter__()
+
+    def tearDown(self):
+        self.close_replicas()
+        self.output.__exit__(None, None, None)
+        self.server.close()
+        shutil.rmtree(self.directory)
+
+    def close_replicas(self):
+        for tree, sync in self.replicas:
+            sync.close()
+            tree.close()
+        self.replicas = []
+
+    def open_replicas(self, count, initial_tasks=5):
+        """从同一个任务树文件打开 count 个副本（每次调用使用新的目录和新的任务树）。"""
+        self.close_replicas()
+        directory = tempfile.mkdtemp(dir=self.directory)
+        base = os.path.join(directory, "base.json")
+        tree = TaskTree(base)
+        tree.add_tasks([f"t{index}" for index in range(initial_tasks)], tree.root)
+        tree.close()
+        for number in range(count):
+            filename = os.path.join(directory, f"replica{number}.json")
+            shutil.copy(base, filename)
+            tree = TaskTree(filename, history_depth=20)
+            # 不启动后台线程，由用例决定何时同步；机器 id 固定，排序键和合并结果只取决于种子
+            sync = TaskSync(tree, filename + ".sync", self.server.address)
+            sync.replica = "abc"[number]
+            self.replicas.append((tree, sync))
+        return self.replicas
+
+    def random_action(self, rng, tree, label):
+        tasks = list(tree.tasks.values())
+        others = [task for task in tasks if task is not tree.root]
+        action = rng.choice(ACTIONS)
+        if action == "add":
+            tree.focus_task(rng.choice(tasks))
+            tree.add_task(label)
+        elif action == "undo":
+            tree.undo()
+        elif action == "redo":
+            tree.redo()
+        elif not others:
+            return
+        elif action == "rename":
+            tree.focus_task(rng.choice(others))
+            tree.rename_task(label)
+        elif action == "complete":
+            tree.focus_task(rng.choice(others))
+            tree.complete_task()
+        elif action == "reopen":
+            tree.reopen_task(rng.choice(others))
+        elif action == "move":
+            tree.move_task(rng.choice(others), rng.choice(tasks), rng.choice((None, 0, 1)))
+        elif action == "remove":
+            tree.remove_task(rng.choice(others))
+
+    def assert_converged(self, seed):
+        for _ in range(2):
+            for _, sync in self.replicas:
+                sync.sync()
+        first = dump(self.replicas[0][0])
+        for tree, _ in self.replicas[1:]:
+            self.assertEqual(first, dump(tree), f"种子 {seed} 的副本没有收敛")
+
+    def run_random(self, seed, count, steps, sync_every, check_every):
+        """每一轮每个副本做一次随机修改，以 sync_every 的概率随后同步；每 check_every 轮全部同步并比较。"""
+        rng = random.Random(seed)
+        self.open_replicas(count)
+        for step in range(1, steps + 1):
+            for number, (tree, sync) in enumerate(self.replicas):
+                self.random_action(rng, tree, f"{'abc'[number]}{step}.{rng.randint(0, 9)}")
+                if rng.random() < sync_every:
+                    sync.sync()
+            if step % check_every == 0:
+                self.assert_converged(seed)
+
+    def test_two_replicas_sync_every_round(self):
+        for seed in range(1, 9):
+            with self.subTest(seed=seed):
+                self.run_random(seed, 2, 40, 1.0, 1)
+
+    def test_three_replicas_occasional_sync(self):
+        for seed in range(1, 7):
+            with self.subTest(seed=seed):
+                self.run_random(seed, 3, 40, 0.3, 10)
+
+    def test_concurrent_rename_last_writer_wins(self):
+        (tree_a, sync_a), (tree_b, sync_b) = self.open_replicas(2)
+        task_id = tree_a.root.children[0].id
+        tree_a.focus_task(tree_a.get_task(task_id))
+        tree_a.rename_task("from a")
+        tree_b.focus_task(tree_b.get_task(task_id))
+        tree_b.rename_task("from b")
+        tree_b.rename_task("from b again")  # 时钟更大，较晚
+        self.assert_converged(0)
+        self.assertEqual(tree_a.get_task(task_id).name, "from b again")
+
+    def test_undo_re_add_of_restored_task_is_not_synced(self):
+        (tree_a, sync_a), (tree_b, sync_b) = self.open_replicas(2)
+        task_id = tree_a.root.children[1].id
+        tree_a.remove_task(tree_a.get_task(task_id))
+        tree_b.remove_task(tree_b.get_task(task_id))
+        sync_a.sync()
+        sync_b.sync()
+        tree_b.undo()  # 比两次删除都晚的重新添加，合并后 A 上也恢复了这个任务
+        sync_b.sync()
+        sync_a.sync()
+        tree_b.focus_task(tree_b.get_task(task_id))
+        tree_b.rename_task("renamed on b")
+        sync_b.sync()
+        sync_a.sync()
+        self.assertEqual(tree_a.get_task(task_id).name, "renamed on b")
+        tree_a.undo()  # 撤销删除时任务已经存在，没有修改任何东西，不应带着旧的名称上传
+        self.assertEqual(sync_a.outbox, [])
+        self.assert_converged(0)
+        self.assertEqual(tree_a.get_task(task_id).name, "renamed on b")
+
+    def test_sync_cost_depends_on_changes(self):
+        (tree_a, sync_a), (tree_b, sync_b) = self.open_replicas(2, initial_tasks=2000)
+        sync_a.sync()
+        sync_b.sync()
+        tree_a.focus_task(tree_a.root.children[1000])
+        tree_a.rename_task("changed")
+        self.assertEqual(sync_a.sync(), (1, 0))
+        self.assertEqual(sync_b.sync(), (0, 1))
+        self.assertEqual(tree_b.root.children[1000].name, "changed")
+
+    def test_key_between(self):
+        keys = [initial_key(index) for index in range(100)]
+        self.assertEqual(keys, sorted(keys))
+        for low, high in [("", None), ("", keys[0]), (keys[0], keys[1]), (keys[-1], None), ("5", "501")]:
+            key = key_between(low, high)
+            self.assertLess(low, key)
+            if high is not None:
+                self.assertLess(key + "zz", high)
+            self.assertFalse(key.endswith("0"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,29 +1,49 @@
 import sys
-import keyboard  # Import the keyboard library for global hotkeys
+import threading
+import time
+_IMPORT_STARTED = time.perf_counter()  # --profile-startup：统计导入模块的耗时
 from PyQt5.QtWidgets import QApplication, QMainWindow, QAction, QVBoxLayout, QPushButton, QWidget, QMessageBox, QLabel, QMenu, QLineEdit, QInputDialog
+from PyQt5.QtWidgets import QDialog, QListWidget, QListWidgetItem, QTreeView, QAbstractItemView
 from PyQt5.QtGui import QIcon
-from PyQt5.QtCore import pyqtSignal, pyqtSlot, Qt, QRect, QRectF,QTimer
-from task_tree import TaskTree
+from PyQt5.QtCore import pyqtSignal, pyqtSlot, Qt, QRect, QRectF,QTimer, QObject
+from config_store import ConfigStore
+from hotkey_dispatcher import HotkeyDispatcher
+from task_tree_model import TaskTreeModel
+import instrumentation
 import json
 import os
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QColor, QFont, QPixmap, QRegion, QPainterPath
-from PyQt5.QtWidgets import QGraphicsDropShadowEffect, QGraphicsOpacityEffect
+from PyQt5.QtWidgets import QGraphicsDropShadowEffect, QGraphicsOpacityEffect, QStyle, QStyleOption
+from PyQt5.QtGui import QPainter
+from render_cache import RenderCache
+# keyboard 和任务树相关的模块推迟到真正用到时才导入（见 setup_global_hotkeys 和 TreeLoader）
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
 
 class TaskManagerUI(QMainWindow):
     update_ui_signal = pyqtSignal()  # 用于更新UI显示
     task_changed_signal = pyqtSignal()  # 用于通知任务切换
+    # 可以批量执行的动作：连续触发时在一个批次中修改任务树，只保存、刷新一次
+    BATCHED_ACTIONS = ("add_task", "complete_task", "create_new_workflow", "undo", "redo", "switch_workflow")
 
-    def __init__(self, task_tree):
+    def __init__(self, task_tree, workflow_store=None):
         super().__init__()
         self.task_tree = task_tree
+        self.workflow_store = workflow_store  # 为 None 时只使用单个任务树文件
+        self.hotkey_dispatcher = HotkeyDispatcher(self)
+        self.search_dialog = None
+        self.daemon = None  # 为脚本提供任务操作的套接字服务，见 start_daemon
+        self.task_tree.prepare_search(background=True)  # 提前在后台建立搜索索引
+        self.task_tree.add_listener(self.on_tree_operation)
+        self.hotkey_dispatcher.register("external_change", self.on_external_change)
         self.initUI()
         self.update_ui_signal.connect(self.update_ui)
         self.task_changed_signal.connect(self.update_task_display)
+        self.task_changed_signal.connect(self.update_tree_view)
         self.setup_global_hotkeys()
 
     def initUI(self):
-        self.setWindowTitle("EasyWorkflow")
+        self.update_window_title()
         self.setGeometry(300, 300, 600, 400)
 
         # 添加任务按钮
@@ -34,15 +54,39 @@ class TaskManagerUI(QMainWindow):
         complete_task_action = QAction(QIcon(None), '完成任务', self)
         complete_task_action.triggered.connect(self.complete_task)
 
+        # 删除任务按钮（连同子任务一起删除，可以撤销）
+        remove_task_action = QAction(QIcon(None), '删除任务', self)
+        remove_task_action.triggered.connect(self.remove_task)
+
+        # 撤销/重做按钮
+        undo_action = QAction(QIcon(None), '撤销', self)
+        undo_action.triggered.connect(self.undo)
+        redo_action = QAction(QIcon(None), '重做', self)
+        redo_action.triggered.connect(self.redo)
+
         # 设置工具栏
         toolbar = self.addToolBar("Main Toolbar")
         toolbar.addAction(add_task_action)
         toolbar.addAction(complete_task_action)
+        toolbar.addAction(remove_task_action)
+        toolbar.addAction(undo_action)
+        toolbar.addAction(redo_action)
 
         # 主布局
         central_widget = QWidget(self)
         layout = QVBoxLayout(central_widget)
 
+        # 任务树视图：子任务在展开时才加载，双击跳转到该任务
+        self.tree_model = TaskTreeModel(self.task_tree, self)
+        self.tree_view = QTreeView(self)
+        self.tree_view.setModel(self.tree_model)
+        self.tree_view.setHeaderHidden(True)
+        self.tree_view.setUniformRowHeights(True)  # 行高一致，视图不需要逐行测量
+        self.tree_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.tree_view.doubleClicked.connect(self.jump_to_index)
+        layout.addWidget(self.tree_view)
+        self.reveal_current_task()
+
         # 添加按钮到布局
         add_task_btn = QPushButton("添加新任务", self)
         add_task_btn.clicked.connect(self.add_task)
@@ -56,25 +100,65 @@ class TaskManagerUI(QMainWindow):
         # 新增的按钮
         new_workflow_btn = QPushButton("创建一个新的工作流", self)
         new_workflow_btn.clicked.connect(self.create_new_workflow)
+
+        import_outline_btn = QPushButton("导入大纲", self)
+        import_outline_btn.clicked.connect(self.import_outline)
+
+        search_task_btn = QPushButton("搜索任务", self)
+        search_task_btn.clicked.connect(self.search_task)
+
+        choose_workflow_btn = QPushButton("切换工作流", self)
+        choose_workflow_btn.clicked.connect(self.choose_workflow)
+        choose_workflow_btn.setEnabled(self.workflow_store is not None)
         
         
         layout.addWidget(add_task_btn)
         layout.addWidget(complete_task_btn)
         layout.addWidget(mini_mode_btn)
+        layout.addWidget(search_task_btn)
+        layout.addWidget(import_outline_btn)
         layout.addWidget(new_workflow_btn)  # 添加新按钮到布局
+        layout.addWidget(choose_workflow_btn)
         
         self.setCentralWidget(central_widget)
 
     def setup_global_hotkeys(self):
         """设置全局快捷键"""
+        import keyboard  # Import the keyboard library for global hotkeys
         # 读取 hotkey.json 文件
         with open('hotkey.json', 'r') as file:
             hotkeys = json.load(file)
 
-        # 为每个函数设置对应的快捷键
+        # 为每个函数设置对应的快捷键：回调运行在 keyboard 的监听线程中，只把动作放入队列，
+        # 由 GUI 线程统一执行
         for function_name, hotkey in hotkeys.items():
             if hasattr(self, function_name):
-                keyboard.add_hotkey(hotkey, getattr(self, function_name))
+                self.hotkey_dispatcher.register(
+                    function_name,
+                    lambda count, posted_at, name=function_name: self.run_hotkey_action(name, count, posted_at))
+                keyboard.add_hotkey(hotkey, self.hotkey_dispatcher.post, args=(function_name,))
+
+    def run_hotkey_action(self, name, count, posted_at=None):
+        """在 GUI 线程中执行连续触发 count 次的快捷键动作（posted_at 为快捷键回调投递动作的时间）"""
+        if name in self.BATCHED_ACTIONS:
+            self.run_action(name, count, posted_at=posted_at)
+        else:
+            # 其余动作（例如先弹出对话框的重命名）在自己的入口开始端到端计时，这里只记录排队时间
+            instrumentation.hotkey_queued(name, posted_at)
+            getattr(self, name)()
+
+    def run_action(self, name, count=1, posted_at=None, **options):
+        """在一个批次中执行 count 次动作，然后只发出一次界面更新信号（options 原样传给动作）
+
+        posted_at 为快捷键回调投递动作的时间，端到端计时从这一刻开始，包括在队列中等待 GUI 线程的时间。
+        """
+        instrumentation.begin_action(name, posted_at)
+        with instrumentation.measure(name, "tree_mutation"), self.task_tree.batch():
+            changed = getattr(self, "_" + name)(count, **options)
+        if changed:
+            instrumentation.signal_emitted()
+            self.update_ui_signal.emit()  # 触发 UI 更新
+            self.task_changed_signal.emit()  # 通知任务切换
 
     @pyqtSlot()
     def update_ui(self):
@@ -83,12 +167,14 @@ class TaskManagerUI(QMainWindow):
         
     def add_task(self):
         """增加任务并刷新 UI"""
+        self.run_action("add_task")
+
+    def _add_task(self, count):
         task_name = "新任务"
-        self.task_tree.add_task(task_name)
-        print(f"任务 '{task_name}' 已添加。")
-        self.update_ui_signal.emit()  # 触发 UI 更新
-        self.task_changed_signal.emit()  # 通知任务切换
-        self.task_tree.save_to_file()
+        for _ in range(count):
+            self.task_tree.add_task(task_name)
+        print(f"任务 '{task_name}' 已添加 {count} 次。" if count > 1 else f"任务 '{task_name}' 已添加。")
+        return True
 
     def rename_task(self):
         """重命名当前任务"""
@@ -96,23 +182,95 @@ class TaskManagerUI(QMainWindow):
             # self.mini_mode_window.enter_rename_mode()
             QTimer.singleShot(0,self.mini_mode_window.enter_rename_mode)
         else:# 默认操作
+            instrumentation.begin_action("rename_task")
             new_name = "重命名任务"  
-            self.task_tree.rename_task(new_name)
+            with instrumentation.measure("rename_task", "tree_mutation"):
+                self.task_tree.rename_task(new_name)
             print(f"任务已重命名为 '{new_name}'。")
+            instrumentation.signal_emitted()
             self.update_ui_signal.emit()  # 触发 UI 更新
             self.task_changed_signal.emit()  # 通知任务切换
-            self.task_tree.save_to_file()
 
     def complete_task(self):
         """完成任务并检查是否根节点"""
-        if self.task_tree.current_task == self.task_tree.root:
-            print("警告: 根节点不可完成。")
+        self.run_action("complete_task")
+
+    def _complete_task(self, count):
+        completed = 0
+        for _ in range(count):
+            if self.task_tree.current_task == self.task_tree.root:
+                print("警告: 根节点不可完成。")
+                break
+            self.task_tree.complete_task()
+            completed += 1
+        if completed:
+            print("任务已完成。")
+        return completed > 0
+
+    def remove_task(self):
+        """删除当前任务及其子任务，专注任务回到父任务"""
+        self.run_action("remove_task")
+
+    def _remove_task(self, count):
+        # 连续触发时只删除一次，避免接着删除父任务
+        task = self.task_tree.current_task
+        if not self.task_tree.remove_task(task):
+            return False
+        print(f"任务 '{task.name}' 已删除。")
+        return True
+
+    def import_outline(self):
+        """把缩进文本或 Markdown 大纲导入为当前任务的子任务"""
+        text, ok = QInputDialog.getMultiLineText(self, "导入大纲", "每行一个任务，用缩进或 Markdown 列表表示层级：")
+        if ok and text.strip():
+            self.run_action("import_outline", text=text)
+
+    def _import_outline(self, count, text):
+        return bool(self.task_tree.import_outline(text))
+
+    def undo(self):
+        """撤销上一步修改"""
+        self.run_action("undo")
+
+    def _undo(self, count):
+        undone = self.task_tree.undo(count)
+        print(f"已撤销 {undone} 步修改。" if undone else "没有可以撤销的修改。")
+        return undone > 0
+
+    def redo(self):
+        """重做上一步撤销的修改"""
+        self.run_action("redo")
+
+    def _redo(self, count):
+        redone = self.task_tree.redo(count)
+        print(f"已重做 {redone} 步修改。" if redone else "没有可以重做的修改。")
+        return redone > 0
+
+    def search_task(self):
+        """打开任务搜索框，选中结果后跳转到该任务"""
+        if self.search_dialog is None:
+            self.search_dialog = TaskSearchDialog(self)
+        self.search_dialog.open_search()
+
+    def jump_to_task(self, task):
+        """把专注任务切换到指定任务并刷新悬浮窗"""
+        instrumentation.begin_action("jump_to_task")
+        with instrumentation.measure("jump_to_task", "tree_mutation"):
+            self.task_tree.focus_task(task)
+        print(f"已跳转到任务 '{task.name}'。")
+        instrumentation.signal_emitted()
+        self.update_ui_signal.emit()  # 触发 UI 更新
+        self.task_changed_signal.emit()  # 通知任务切换
+
+    def restore_archived_task(self, archived):
+        """从归档中恢复任务所在的子树，并跳转到该任务"""
+        task = self.task_tree.restore_archived(archived.id)
+        if task is None:
+            QMessageBox.information(self, "搜索任务", f"'{archived.name}' 已不在归档中。")
             return
-        self.task_tree.complete_task()
-        print("任务已完成。")
+        print(f"已恢复并跳转到任务 '{task.name}'。")
         self.update_ui_signal.emit()  # 触发 UI 更新
         self.task_changed_signal.emit()  # 通知任务切换
-        self.task_tree.save_to_file()
 
     def enter_mini_mode(self):
         self.mini_mode_window = MiniModeWindow(self)
@@ -124,27 +282,263 @@ class TaskManagerUI(QMainWindow):
         if hasattr(self, 'mini_mode_window') and self.mini_mode_window.isVisible():
             self.mini_mode_window.update_task_name()
 
+    def update_tree_view(self):
+        """把任务树的修改反映到树视图上，并滚动到当前任务"""
+        with instrumentation.measure("tree_view", "model_update"):
+            self.tree_model.apply_pending()
+            self.reveal_current_task()
+
+    def reveal_current_task(self):
+        index = self.tree_model.reveal(self.task_tree.current_task)
+        if index.isValid():
+            self.tree_view.setCurrentIndex(index)
+            self.tree_view.scrollTo(index)
+
+    def jump_to_index(self, index):
+        task = self.tree_model.task_for(index)
+        if task is not None and task is not self.task_tree.current_task:
+            self.jump_to_task(task)
+
+    def use_task_tree(self, tree):
+        """切换界面使用的任务树（切换或创建工作流之后）"""
+        self.task_tree.remove_listener(self.on_tree_operation)
+        if self.task_tree.focus_log is not None:
+            self.task_tree.focus_log.pause()  # 不在使用的工作流停止计时
+        self.task_tree = tree
+        if tree.focus_log is not None:
+            tree.focus_log.resume()
+        self.task_tree.add_listener(self.on_tree_operation)
+        if self.daemon is not None:
+            self.daemon.task_tree = tree
+        self.task_tree.prepare_search(background=True)
+        self.tree_model.set_task_tree(tree)
+        self.update_window_title()
+
+    def start_daemon(self):
+        """在套接字上为脚本提供任务操作（见 task_daemon.py），脚本的修改在 GUI 线程中刷新界面"""
+        from task_daemon import TaskDaemon
+
+        daemon = TaskDaemon(self.task_tree, on_change=lambda: self.hotkey_dispatcher.post("external_change"))
+        try:
+            daemon.start(background=True)
+        except OSError as error:
+            print(f"无法启动任务守护进程：{error}")
+            return
+        self.daemon = daemon
+        QApplication.instance().aboutToQuit.connect(daemon.close)
+
+    def on_tree_operation(self, operation, previous):
+        """任务树的修改监听器：其它实例的修改在文件监视线程中合并，交给 GUI 线程刷新界面"""
+        if operation.get("external"):
+            self.hotkey_dispatcher.post("external_change")
+
+    def on_external_change(self, count, posted_at=None):
+        self.update_ui_signal.emit()  # 触发 UI 更新
+        self.task_changed_signal.emit()  # 通知任务切换
+
     def create_new_workflow(self):
         """创建一个新的工作流"""
-        self.task_tree.reset_to_root()  # 假设有一个方法可以重置 task_tree
+        if self.workflow_store is None:
+            self.run_action("create_new_workflow")
+            return
+        name, ok = QInputDialog.getText(self, "创建一个新的工作流", "工作流名称：",
+                                        text=self.workflow_store.unique_name())
+        if ok:
+            self.open_workflow(name, create=True)
+
+    def _create_new_workflow(self, count):
+        # 连续创建多次与创建一次的结果相同
+        if self.workflow_store is not None:
+            self.use_task_tree(self.workflow_store.create())
+        else:
+            self.task_tree.reset_to_root()  # 假设有一个方法可以重置 task_tree
         print("新的工作流已创建。")
+        return True
+
+    def update_window_title(self):
+        if self.workflow_store is not None and self.workflow_store.active:
+            self.setWindowTitle(f"EasyWorkflow - {self.workflow_store.active}")
+        else:
+            self.setWindowTitle("EasyWorkflow")
+
+    def open_workflow(self, name, create=False):
+        """切换到（或创建）指定名称的工作流并刷新界面"""
+        instrumentation.begin_action("switch_workflow")
+        try:
+            with instrumentation.measure("switch_workflow", "tree_mutation"):
+                tree = self.workflow_store.create(name) if create else self.workflow_store.switch(name)
+        except ValueError as error:
+            QMessageBox.warning(self, "工作流", str(error))
+            return
+        self.use_task_tree(tree)
+        print(f"已切换到工作流 '{self.workflow_store.active}'。")
+        instrumentation.signal_emitted()
         self.update_ui_signal.emit()  # 触发 UI 更新
         self.task_changed_signal.emit()  # 通知任务切换
-        self.task_tree.save_to_file()
+
+    def choose_workflow(self):
+        """从列表中选择要切换到的工作流"""
+        names = self.workflow_store.list_workflows()
+        name, ok = QInputDialog.getItem(self, "切换工作流", "工作流：", names, 0, False)
+        if ok and name:
+            self.open_workflow(name)
+
+    def switch_workflow(self):
+        """切换到上一个使用的工作流（连续触发 n 次则切换到最近使用的第 n 个）"""
+        self.run_action("switch_workflow")
+
+    def _switch_workflow(self, count):
+        if self.workflow_store is None:
+            return False
+        names = self.workflow_store.list_workflows()
+        if len(names) < 2:
+            print("没有其它工作流可以切换。")
+            return False
+        self.use_task_tree(self.workflow_store.switch(names[count % len(names)]))
+        print(f"已切换到工作流 '{self.workflow_store.active}'。")
+        return True
+
+    def closeEvent(self, event):
+        """关闭主窗口前写出后台写入线程中尚未落盘的修改"""
+        if self.workflow_store is not None:
+            self.workflow_store.flush()
+        else:
+            self.task_tree.flush()
+        super().closeEvent(event)
+
+class TaskSearchDialog(QDialog):
+    """任务搜索框：输入时实时显示匹配的任务（附带所在路径），回车或双击跳转
+
+    任务树中的匹配不足 RESULT_LIMIT 个时，还会列出已归档的匹配任务，选中后从归档中恢复并跳转。
+    """
+    RESULT_LIMIT = 50
+
+    def __init__(self, task_manager_ui):
+        super().__init__(task_manager_ui)
+        self.task_manager_ui = task_manager_ui
+        self.setWindowTitle("搜索任务")
+        self.setWindowFlags(self.windowFlags() | Qt.WindowStaysOnTopHint)
+        self.resize(480, 360)
+
+        self.input_field = QLineEdit(self)
+        self.input_field.setPlaceholderText("输入任务名称（支持前缀、片段和模糊匹配）")
+        self.input_field.textChanged.connect(self.update_results)
+        self.input_field.returnPressed.connect(self.accept_current)
+
+        self.result_list = QListWidget(self)
+        self.result_list.itemActivated.connect(self.accept_item)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.input_field)
+        layout.addWidget(self.result_list)
+
+    def open_search(self):
+        self.input_field.clear()
+        self.result_list.clear()
+        self.show()
+        self.raise_()
+        self.activateWindow()
+        self.input_field.setFocus()
+
+    def update_results(self, text):
+        task_tree = self.task_manager_ui.task_tree
+        with instrumentation.measure("search_task", "query"):
+            tasks = task_tree.search(text, self.RESULT_LIMIT)
+        self.result_list.clear()
+        for task in tasks:
+            path = " / ".join(ancestor.name for ancestor in task_tree.get_ancestors(task)[::-1])
+            item = QListWidgetItem(f"{task.name}    ({path})" if path else task.name)
+            item.setData(Qt.UserRole, task)
+            self.result_list.addItem(item)
+        if len(tasks) < self.RESULT_LIMIT and text:
+            with instrumentation.measure("search_task", "archive_query"):
+                archived_tasks = task_tree.search_archive(text, self.RESULT_LIMIT - len(tasks))
+            for archived in archived_tasks:
+                item = QListWidgetItem(f"[已归档] {archived.name}    ({' / '.join(archived.path)})")
+                item.setData(Qt.UserRole, archived)
+                item.setForeground(QColor("#9E9E9E"))
+                self.result_list.addItem(item)
+        if self.result_list.count():
+            self.result_list.setCurrentRow(0)
+
+    def accept_current(self):
+        item = self.result_list.currentItem()
+        if item is not None:
+            self.accept_item(item)
+
+    def accept_item(self, item):
+        from task_archive import ArchivedTask
+
+        self.hide()
+        task = item.data(Qt.UserRole)
+        if isinstance(task, ArchivedTask):
+            self.task_manager_ui.restore_archived_task(task)
+        else:
+            self.task_manager_ui.jump_to_task(task)
+
+
+class BackgroundWidget(QWidget):
+    """悬浮窗的中心部件：背景图片按部件尺寸缩放一次后缓存，重绘时直接绘制，不再经过样式表缩放"""
+
+    def __init__(self, mini_window):
+        super().__init__(mini_window)
+        self.mini_window = mini_window
+        self.image_path = None  # 为 None 时只使用样式表中的纯色背景
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        # 自定义的 QWidget 子类需要自己绘制样式表背景
+        option = QStyleOption()
+        option.initFrom(self)
+        self.style().drawPrimitive(QStyle.PE_Widget, option, painter, self)
+        if self.image_path is None:
+            return
+        pixmap = self.mini_window.render_cache.background_pixmap(self.image_path, self.width(), self.height())
+        if pixmap is not None:
+            radius = self.mini_window.config["window"]["border_radius"]
+            path = QPainterPath()
+            path.addRoundedRect(QRectF(self.rect()), radius, radius)
+            painter.setRenderHint(QPainter.Antialiasing)
+            painter.setClipPath(path)
+            painter.drawPixmap(0, 0, pixmap)
+
 
 class MiniModeWindow(QMainWindow):
     CONFIG_FILE = "mini_mode_config.json"
+    SAVE_DELAY_MS = 500  # 移动或缩放停止这么久之后才写配置文件
+    render_cache = RenderCache()  # 所有悬浮窗共用，重新进入 MINI 模式时仍然有效
 
-    def __init__(self, task_manager_ui):
+    def __init__(self, task_manager_ui=None):
+        """task_manager_ui 为 None 时先显示上次退出时的任务名称，任务树加载完成后再调用 attach()"""
         super().__init__()
-        self.task_manager_ui = task_manager_ui
-        self.config = self.load_config()
-        self.initUI()
+        self.task_manager_ui = None
+        self.config_store = self.load_config()
+        self.config = self.config_store.data
         self.offset = None  # 添加这一行，初始化 offset 属性
+        self._screen_geometry = None  # 缓存的屏幕可用区域，屏幕变化时失效
+        self._adjusting_position = False  # 防止 ensure_not_covered_by_taskbar 中的 move 再次触发检查
+        self._mask_key = None  # 当前遮罩的 (宽, 高, 圆角半径)，没有变化时不重新设置遮罩
+
+        # 拖动过程中不写文件，停止移动一段时间后再保存
+        self.save_timer = QTimer(self)
+        self.save_timer.setSingleShot(True)
+        self.save_timer.setInterval(self.SAVE_DELAY_MS)
+        self.save_timer.timeout.connect(self.save_config)
+        QApplication.instance().aboutToQuit.connect(self.save_config)
+
+        self.initUI()
+        if task_manager_ui is not None:
+            self.attach(task_manager_ui)
+
+    def attach(self, task_manager_ui):
+        """连接到主界面，此后显示任务树中的当前任务"""
+        self.task_manager_ui = task_manager_ui
+        task_manager_ui.mini_mode_window = self
 
         # 连接信号
         self.task_manager_ui.update_ui_signal.connect(self.update_task_name)
         self.task_manager_ui.task_changed_signal.connect(self.update_task_name)
+        self.update_task_name()
 
     def initUI(self):
         # 设置窗口标志
@@ -189,7 +583,7 @@ class MiniModeWindow(QMainWindow):
         layout.addWidget(self.label)
         layout.addWidget(self.input_field)
 
-        central_widget = QWidget(self)
+        central_widget = BackgroundWidget(self)
         central_widget.setLayout(layout)
         central_widget.setGraphicsEffect(shadow)
         
@@ -204,28 +598,37 @@ class MiniModeWindow(QMainWindow):
         self.customContextMenuRequested.connect(self.show_context_menu)
 
     def set_rounded_corners(self):
-        """设置圆角遮罩"""
-        radius = self.config["window"]["border_radius"]
-        path = QPainterPath()
-        rect = QRectF(0, 0, self.width(), self.height())
-        path.addRoundedRect(rect, radius, radius)
-        region = QRegion(path.toFillPolygon().toPolygon())
-        self.setMask(region)
+        """设置圆角遮罩（尺寸和半径不变时不重新设置）"""
+        key = (self.width(), self.height(), self.config["window"]["border_radius"])
+        if key == self._mask_key:
+            return
+        self._mask_key = key
+        self.setMask(self.render_cache.rounded_mask(*key))
 
     def update_task_name(self):
         """更新任务名称并调整窗口宽度"""
-        task_name = self.task_manager_ui.task_tree.current_task.name
-        self.label.setText(task_name)
-        self.adjust_window_width()
+        instrumentation.signal_received()
+        with instrumentation.measure("mini_window", "update_task_name"):
+            if self.task_manager_ui is None:
+                # 任务树仍在后台加载，显示上次退出时的任务名称
+                task_name = self.config["startup"]["task_name"] or "正在加载任务树……"
+            else:
+                task_name = self.task_manager_ui.task_tree.current_task.name
+                self.record_startup_task(task_name)
+            self.label.setText(task_name)
+            self.adjust_window_width()
+        instrumentation.finish_action()
 
     def adjust_window_width(self):
         """根据标签内容自动调整窗口宽度"""
-        # 获取文本的宽度
-        text_width = self.label.fontMetrics().boundingRect(self.label.text()).width()
-        # 设置窗口宽度，增加一些边距
-        new_width = text_width + 40  # 40 是一个经验值，可以根据需要调整
-        self.setFixedWidth(new_width)
-        self.set_rounded_corners()  # 更新圆角遮罩
+        with instrumentation.measure("mini_window", "resize_and_mask"):
+            # 获取文本的宽度（按字体和文本缓存）
+            text_width = self.render_cache.text_width(self.label.font(), self.label.text())
+            # 设置窗口宽度，增加一些边距；宽度不变时不触发重新布局
+            new_width = text_width + 40  # 40 是一个经验值，可以根据需要调整
+            if new_width != self.width():
+                self.setFixedWidth(new_width)
+            self.set_rounded_corners()  # 更新圆角遮罩
 
     def show_context_menu(self, pos):
         context_menu = QMenu(self)
@@ -255,15 +658,19 @@ class MiniModeWindow(QMainWindow):
             self.move(self.pos() + event.pos() - self.offset)
 
     def mouseReleaseEvent(self, event):
-        self.offset = None
+        if self.offset is not None:
+            self.offset = None
+            self.save_config()  # 拖动结束，立即保存位置
 
     def mouseDoubleClickEvent(self, event):
-        if event.button() == Qt.LeftButton:
+        if event.button() == Qt.LeftButton and self.task_manager_ui is not None:
             self.task_manager_ui.show()
             self.close()
 
     def enter_rename_mode(self):
         """进入重命名模式"""
+        if self.task_manager_ui is None:
+            return
         current_task_name = self.task_manager_ui.task_tree.current_task.name
         self.label.hide()
         self.input_field.setText(current_task_name)  # 使用当前任务名称
@@ -276,8 +683,10 @@ class MiniModeWindow(QMainWindow):
         """重命名任务并调整窗口宽度"""
         new_name = self.input_field.text().strip()
         if new_name:
-            self.task_manager_ui.task_tree.rename_task(new_name)
-            self.task_manager_ui.task_tree.save_to_file()  # 保存更改
+            instrumentation.begin_action("rename_task")
+            with instrumentation.measure("rename_task", "tree_mutation"):
+                self.task_manager_ui.task_tree.rename_task(new_name)
+            instrumentation.signal_emitted()
             self.task_manager_ui.update_ui_signal.emit()
             self.task_manager_ui.task_changed_signal.emit()
         
@@ -312,49 +721,64 @@ class MiniModeWindow(QMainWindow):
                 "y": 100,
                 "width": 200,
                 "height": 50
+            },
+            "startup": {
+                "task_name": ""  # 上次的当前任务名称，启动时在任务树加载完成前显示
+            },
+            "archive": {
+                "after_days": 30  # 完成超过这么多天的子树在打开工作流时移入归档，为 null 时不归档
+            },
+            "sync": {
+                "server": None,  # 同步服务器地址（主机:端口），为 null 时不与其它机器同步
+                "interval": 60  # 后台同步的间隔秒数，本地有修改时会提前同步
             }
         }
 
-        if os.path.exists(self.CONFIG_FILE):
-            with open(self.CONFIG_FILE, 'r') as file:
-                try:
-                    config = json.load(file)
-                    # 合并默认配置和文件配置
-                    for key, value in default_config.items():
-                        if key not in config:
-                            config[key] = value
-                        elif isinstance(value, dict):
-                            for sub_key, sub_value in value.items():
-                                if sub_key not in config[key]:
-                                    config[key][sub_key] = sub_value
-                    return config
-                except json.JSONDecodeError:
-                    print("JSON 文件格式错误，使用默认配置。")
-        else:
-            print("配置文件不存在，使用默认配置。")
-
-        return default_config
+        return ConfigStore(self.CONFIG_FILE, default_config)
 
-    def save_config(self):
-        # 更新配置中的位置信息
-        self.config["position"] = {
+    def record_geometry(self):
+        """把当前位置和大小记入配置（只有变化时才标记为需要保存），并推迟保存"""
+        self.config_store.update("position", {
             "x": self.x(),
             "y": self.y(),
             "width": self.width(),
             "height": self.height()
-        }
-        with open(self.CONFIG_FILE, 'w') as file:
-            json.dump(self.config, file, indent=4)
+        })
+        if self.config_store.dirty:
+            self.save_timer.start()
+
+    def record_startup_task(self, task_name):
+        """记下当前任务名称，下次启动时在任务树加载完成前显示"""
+        self.config_store.update("startup", {"task_name": task_name})
+        if self.config_store.dirty:
+            self.save_timer.start()
+
+    def save_config(self):
+        """立即写出尚未保存的配置；没有修改时不访问磁盘"""
+        self.save_timer.stop()
+        self.config_store.save()
 
     def moveEvent(self, event):
         """在窗口移动时检查并调整位置"""
-        self.ensure_not_covered_by_taskbar()
-        self.save_config()
+        if not self._adjusting_position:
+            self.ensure_not_covered_by_taskbar()
+        self.record_geometry()
         super().moveEvent(event)
 
+    def screen_geometry(self):
+        """返回主屏幕的可用区域；结果会被缓存，屏幕分辨率或任务栏变化时重新查询"""
+        if self._screen_geometry is None:
+            screen = QApplication.primaryScreen()
+            self._screen_geometry = screen.availableGeometry()
+            screen.availableGeometryChanged.connect(self.invalidate_screen_geometry)
+        return self._screen_geometry
+
+    def invalidate_screen_geometry(self, *args):
+        self._screen_geometry = None
+
     def ensure_not_covered_by_taskbar(self):
         """确保窗口不被任务栏遮挡"""
-        screen_geometry = QApplication.primaryScreen().availableGeometry()
+        screen_geometry = self.screen_geometry()
         window_geometry = self.geometry()
 
         # 检查并调整窗口位置
@@ -371,11 +795,16 @@ class MiniModeWindow(QMainWindow):
             new_x = screen_geometry.left()
 
         if new_x != window_geometry.x() or new_y != window_geometry.y():
-            self.move(new_x, new_y)
+            self._adjusting_position = True
+            try:
+                self.move(new_x, new_y)
+            finally:
+                self._adjusting_position = False
 
     def resizeEvent(self, event):
-        """在窗口大小调整时保存配置"""
-        self.save_config()
+        """在窗口大小调整时更新遮罩、记录尺寸，稍后保存配置"""
+        self.set_rounded_corners()
+        self.record_geometry()
         super().resizeEvent(event)
 
     def closeEvent(self, event):
@@ -393,7 +822,7 @@ class MiniModeWindow(QMainWindow):
         self.adjust_position()
 
     def adjust_position(self):
-        screen_geometry = QApplication.primaryScreen().availableGeometry()
+        screen_geometry = self.screen_geometry()
         window_geometry = self.geometry()
 
         # 检查窗口是否超出屏幕可用区域
@@ -406,21 +835,18 @@ class MiniModeWindow(QMainWindow):
         """应用背景样式"""
         background_config = self.config["window"]["background"]
         style = f"border-radius: {self.config['window']['border_radius']}px;"
+        widget.image_path = None
         
         if background_config["type"] == "color":
             # 纯色背景
             style += f"background-color: {background_config['color']};"
         
         elif background_config["type"] == "image":
-            # 图片背景
+            # 图片背景：由 BackgroundWidget 绘制缓存中拉伸好的图片，样式表只保留透明背景
             image_path = background_config["image_path"]
             if os.path.exists(image_path):
-                style += f"""
-                    background-image: url({image_path});
-                    background-position: center;
-                    background-repeat: no-repeat;
-                    background-size: 100% 100%;  // 拉伸图片以填充窗口
-                """
+                widget.image_path = image_path
+                style += "background: transparent;"
             else:
                 # 图片不存在时的后备样式
                 style += f"background-color: {self.config['window']['background']['color']};"
@@ -435,6 +861,7 @@ class MiniModeWindow(QMainWindow):
             "type": "color",
             "color": color
         }
+        self.config_store.mark_dirty()
         self.save_config()
         self.apply_background_style(self.centralWidget())
 
@@ -453,17 +880,81 @@ class MiniModeWindow(QMainWindow):
             "position": position,
             "repeat": repeat
         }
+        self.config_store.mark_dirty()
         self.save_config()
         self.apply_background_style(self.centralWidget())
 
-if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    task_tree = TaskTree()
-    TaskManager = TaskManagerUI(task_tree)
-    TaskManager.enter_mini_mode()
+class TreeLoader(QObject):
+    """在后台线程中打开工作流并加载、校验任务树，完成后在 GUI 线程中发出 loaded 信号"""
+    loaded = pyqtSignal(object, object)  # (工作流存储, 任务树)
+    failed = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.load_seconds = None
+
+    def start(self, **store_options):
+        threading.Thread(target=self.run, kwargs=store_options, daemon=True).start()
+
+    def run(self, **store_options):
+        started = time.perf_counter()
+        try:
+            from task_daemon import take_over
+            from workflow_store import WorkflowStore  # 任务树相关的模块在后台线程中导入
+
+            take_over()  # 守护进程正在运行时先让它写出修改并退出，由图形界面持有任务树
+            workflow_store = WorkflowStore(**store_options)
+            task_tree = workflow_store.current()
+        except Exception as error:
+            self.failed.emit(str(error))
+            return
+        self.load_seconds = time.perf_counter() - started
+        self.loaded.emit(workflow_store, task_tree)  # 跨线程的信号会排队到 GUI 线程中处理
+
+
+def main(argv):
+    """先显示悬浮窗，任务树在后台加载完成后再创建主界面并连接到悬浮窗。
+
+    使用 --profile-startup 参数时打印导入、显示悬浮窗、加载任务树各阶段的耗时，然后退出。
+    """
+    profile_startup = "--profile-startup" in argv
+    started = time.perf_counter()
+    app = QApplication([arg for arg in argv if arg != "--profile-startup"])
+    mini_mode_window = MiniModeWindow()
+    mini_mode_window.show()
+    shown = time.perf_counter()
+
+    def on_loaded(workflow_store, task_tree):
+        attach_started = time.perf_counter()
+        task_manager_ui = TaskManagerUI(task_tree, workflow_store)
+        mini_mode_window.attach(task_manager_ui)
+        task_manager_ui.start_daemon()
+        ready = time.perf_counter()
+        for stage, seconds in (("import", IMPORT_SECONDS), ("show_mini_window", shown - started),
+                               ("load_tree", loader.load_seconds), ("create_ui", ready - attach_started),
+                               ("ready", ready - started)):
+            instrumentation.record("startup", stage, seconds)
+        if profile_startup:
+            print(f"导入模块：{IMPORT_SECONDS * 1000:.1f} ms")
+            print(f"显示悬浮窗：{(shown - started) * 1000:.1f} ms")
+            print(f"加载任务树（后台线程）：{loader.load_seconds * 1000:.1f} ms")
+            print(f"创建主界面：{(ready - attach_started) * 1000:.1f} ms")
+            print(f"从创建应用到可以使用：{(ready - started) * 1000:.1f} ms")
+            app.quit()
+
+    def on_failed(message):
+        QMessageBox.critical(mini_mode_window, "EasyWorkflow", f"加载任务树失败：{message}")
+        app.quit()
+
+    loader = TreeLoader()
+    loader.loaded.connect(on_loaded)
+    loader.failed.connect(on_failed)
+    loader.start(journal=True, write_delay=0.5, history_depth=100, watch=True, track_focus=True,
+                 archive_after_days=mini_mode_window.config["archive"]["after_days"],
+                 sync_server=mini_mode_window.config["sync"]["server"],
+                 sync_interval=mini_mode_window.config["sync"]["interval"])
+    return app.exec_()
 
-    # 直接启动 MiniModeWindow
 
-    # mini_mode_window = MiniModeWindow(TaskManagerUI(task_tree))
-    # mini_mode_window.show()
-    sys.exit(app.exec_())
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,131 @@
+"""多工作流存储：每个工作流是工作流目录中的一个任务树文件。
+
+已经打开的工作流保存在一个有上限的 LRU 缓存中，切换到缓存中的工作流不需要重新解析文件；
+超出上限时关闭最久未使用的任务树（关闭前会写出尚未保存的修改），
+因此即使存档了几百个工作流，内存中也只保留最近使用的几个。
+"""
+
+import glob
+import os
+import re
+from collections import OrderedDict
+
+from config_store import ConfigStore
+from task_tree import TaskTree
+
+INVALID_NAME_CHARACTERS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+
+class WorkflowStore:
+    INDEX_FILE = "workflows.json"
+
+    def __init__(self, directory="workflows", capacity=4, extension=".json", legacy_file="task_tree.json",
+                 **tree_options):
+        """tree_options 原样传给每个 TaskTree（例如 journal、write_delay、history_depth）。"""
+        self.directory = directory
+        self.capacity = max(1, capacity)
+        self.extension = extension
+        self.tree_options = tree_options
+        self.trees = OrderedDict()  # 工作流名称 -> 已打开的 TaskTree，按最近使用排序
+        os.makedirs(directory, exist_ok=True)
+        self.index = ConfigStore(os.path.join(directory, self.INDEX_FILE), {"active": None, "recent": []})
+        if legacy_file and not self.list_workflows() and os.path.exists(legacy_file):
+            self.import_legacy_file(legacy_file)
+
+    def path_for(self, name):
+        return os.path.join(self.directory, name + self.extension)
+
+    def import_legacy_file(self, legacy_file, name="默认工作流"):
+        """把旧版本的单个任务树文件及其全部附属文件移动到工作流目录中。
+
+        附属文件都以任务树文件名加后缀命名（.journal、.archive/、.focus、.quarantine、.sync、.outbox 等），
+        这里按 ``<legacy_file>.*`` 一并移动，以后新增的附属文件也不会被落下。
+        """
+        path = self.path_for(name)
+        for sidecar in glob.glob(glob.escape(legacy_file) + ".*"):
+            os.replace(sidecar, path + sidecar[len(legacy_file):])
+        os.replace(legacy_file, path)
+        print(f"已将 {legacy_file} 迁移为工作流 '{name}'。")
+        self.set_active(name)
+
+    def list_workflows(self):
+        """返回所有工作流名称：最近使用的在前，其余按名称排序。"""
+        names = {entry[:-len(self.extension)] for entry in os.listdir(self.directory)
+                 if entry.endswith(self.extension) and entry != self.INDEX_FILE}
+        recent = [name for name in self.index.data["recent"] if name in names]
+        return recent + sorted(names.difference(recent))
+
+    @property
+    def active(self):
+        return self.index.data["active"]
+
+    def set_active(self, name):
+        recent = [name] + [other for other in self.index.data["recent"] if other != name]
+        self.index.update("active", name)
+        self.index.update("recent", recent)
+        self.index.save()
+
+    def normalize_name(self, name):
+        name = INVALID_NAME_CHARACTERS.sub("_", name).strip().strip(".")
+        if not name:
+            raise ValueError("工作流名称不能为空")
+        return name
+
+    def unique_name(self, base="新工作流"):
+        existing = set(self.list_workflows())
+        if base not in existing:
+            return base
+        number = 2
+        while f"{base} {number}" in existing:
+            number += 1
+        return f"{base} {number}"
+
+    def open(self, name):
+        """返回指定工作流的任务树：缓存中有则直接返回，否则从文件加载（不存在时创建）。"""
+        name = self.normalize_name(name)
+        tree = self.trees.get(name)
+        if tree is not None:
+            self.trees.move_to_end(name)
+        else:
+            tree = TaskTree(self.path_for(name), **self.tree_options)
+            self.trees[name] = tree
+            self.evict(keep=name)
+        return tree
+
+    def switch(self, name):
+        """切换到指定工作流并记为当前工作流，返回它的任务树。"""
+        tree = self.open(name)
+        self.set_active(self.normalize_name(name))
+        return tree
+
+    def create(self, name=None):
+        """创建一个新的工作流并切换过去。"""
+        name = self.normalize_name(name) if name else self.unique_name()
+        if os.path.exists(self.path_for(name)):
+            raise ValueError(f"工作流 '{name}' 已存在")
+        tree = self.switch(name)
+        tree.save_to_file()
+        return tree
+
+    def current(self):
+        """返回当前工作流的任务树（首次使用时创建默认工作流）。"""
+        return self.switch(self.active or self.unique_name("默认工作流"))
+
+    def evict(self, keep=None):
+        """关闭超出缓存上限的最久未使用的任务树（关闭时写出未保存的修改）。"""
+        for name in list(self.trees):
+            if len(self.trees) <= self.capacity:
+                break
+            if name in (self.active, keep):
+                continue  # 当前工作流正在被界面使用，或是刚打开的工作流
+            self.trees.pop(name).close()
+            print(f"工作流 '{name}' 已从缓存中移除。")
+
+    def flush(self):
+        """写出所有已打开工作流中尚未保存的修改。"""
+        for tree in self.trees.values():
+            tree.flush()
+
+    def close(self):
+        while self.trees:
+            self.trees.popitem(last=False)[1].close()
@@ -0,0 +1,69 @@
+import atexit
+import threading
+
+
+class WriteBehindWriter:
+    """后台写入线程：把一段时间内的多次保存请求合并成一次磁盘写入。
+
+    调用方只需 ``mark_dirty()``，线程在 ``delay`` 秒后调用一次 ``flush_callback``；
+    延迟期间的重复请求不产生额外开销。解释器退出时会自动执行最后一次写入。
+    """
+
+    def __init__(self, flush_callback, delay=0.5):
+        self.flush_callback = flush_callback
+        self.delay = delay
+        self._condition = threading.Condition()
+        self._dirty = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="TaskTreeWriter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def mark_dirty(self):
+        """标记有待写入的修改，若线程空闲则唤醒它。"""
+        with self._condition:
+            if self._closed:
+                dirty_after_close = True
+            else:
+                dirty_after_close = False
+                if not self._dirty:
+                    self._dirty = True
+                    self._condition.notify()
+        if dirty_after_close:
+            # 已关闭的写入器不再有后台线程，直接同步写入
+            self.flush_callback()
+
+    def flush(self):
+        """立即同步写入所有待写入的修改（供关闭窗口和测试使用）。"""
+        with self._condition:
+            self._dirty = False
+        self.flush_callback()
+
+    def close(self):
+        """停止后台线程并执行最后一次写入。可以重复调用。"""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self.flush()
+        atexit.unregister(self.close)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._dirty and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                # 等待合并窗口结束；关闭时提前醒来，剩余的写入交给 close()
+                self._condition.wait(self.delay)
+                if self._closed:
+                    return
+                self._dirty = False
+            try:
+                self.flush_callback()
+            except Exception as e:
+                print(f"后台保存任务树失败，原因：{e}")
+                self.mark_dirty()